@@ -0,0 +1,253 @@
+"""
+Backtest dạng vector cho tín hiệu của predict_future_trend.
+
+Quy trình cho một mã (hoặc nhiều mã nối liền nhau với group_ids):
+1. bar_signal_counts: tính chỉ báo một lần trên toàn bộ lịch sử và quét luật của
+   từng analyzer bằng mảng → số tín hiệu BUY/SELL tại mỗi nến. Nhãn nến theo xu hướng
+   của cả chuỗi gán cho mỗi nến cả chu kỳ chứa nó (chu kỳ được chọn theo giá đóng cửa
+   tới 14 nến sau), nên được thay bằng nhãn "as of" chính nến đó (as_of_candle_labels).
+2. window_verdicts: mỗi analyzer ra statement theo số BUY/SELL trong `window` nến
+   gần nhất, verdict cuối cùng theo đúng luật đồng thuận của predict_future_trend
+   (+1 = BUY, -1 = SELL, 0 = HOLD).
+3. positions_from_verdicts: BUY → mua (long), SELL → bán ra (hoặc short), HOLD → giữ nguyên vị thế.
+4. evaluate_positions / summarize_backtest: lợi nhuận, tỷ lệ thắng, drawdown.
+
+Tín hiệu tại nến t chỉ dùng dữ liệu đến t (Star Doji được tính ở nến xác nhận t+1); verdict
+được quyết định sau khi nến t đóng cửa, vị thế áp dụng cho lợi nhuận từ t đến t+1.
+"""
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+import sys
+import os
+
+# Thêm parent directory vào path để import
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils import DISPLAY_DATE_FORMAT
+from indicators.candle_patterns import as_of_candle_labels
+from prediction.registry import get_analyzers, prepare_frame
+from prediction.future_prediction import required_agreement
+from prediction.vectorized import shift, rolling_sum, bar_positions
+from prediction.signals import signal_dicts
+
+TRADING_DAYS_PER_YEAR = 252
+
+BACKTEST_SUMMARY_COLUMNS = [
+    'bars', 'total_return', 'annual_return', 'buy_hold_return',
+    'max_drawdown', 'trades', 'hit_rate', 'exposure',
+]
+
+
+def _counts_from_signals(signals, dates: pd.Series) -> Tuple[np.ndarray, np.ndarray]:
+    """Đổi tín hiệu (SignalArray hoặc list dict, date dạng chuỗi) về số BUY/SELL theo nến - dùng cho analyzer không có scan"""
+    positions = {date: i for i, date in enumerate(dates.dt.strftime(DISPLAY_DATE_FORMAT))}
+    buy = np.zeros(len(dates), dtype=int)
+    sell = np.zeros(len(dates), dtype=int)
+    for signal in signal_dicts(signals, include_reason=False):
+        i = positions.get(signal.get('date'))
+        if i is None:
+            continue
+        if signal.get('action') == 'BUY':
+            buy[i] += 1
+        elif signal.get('action') == 'SELL':
+            sell[i] += 1
+    return buy, sell
+
+
+def bar_signal_counts(df: pd.DataFrame, trends: list, exchange: str,
+                      analyzers: Optional[List[str]] = None) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+    """
+    Số tín hiệu BUY/SELL của từng analyzer tại mỗi nến trên toàn bộ lịch sử của một mã
+
+    Args:
+        df: DataFrame OHLCV của một mã, đã sắp xếp theo Date (có thể có sẵn cột chỉ báo)
+        trends: Xu hướng trên toàn bộ lịch sử
+        exchange: Sàn giao dịch
+        analyzers: Tên các analyzer (mặc định tất cả analyzer đã đăng ký)
+
+    Returns:
+        {tên analyzer: (buy_counts, sell_counts)}; số tín hiệu tại mỗi nến bằng số tín hiệu ở nến
+        cuối khi chỉ có dữ liệu đến nến đó
+    """
+    selected = get_analyzers(analyzers)
+    frame = prepare_frame(df, selected, trends, exchange)
+    if 'trend_context' in frame.columns:
+        frame = as_of_candle_labels(frame, exchange, trends)
+    counts = {}
+    for analyzer in selected:
+        if analyzer.scan is not None:
+            counts[analyzer.name] = analyzer.scan(frame, trends, exchange)
+        else:
+            counts[analyzer.name] = _counts_from_signals(analyzer.func(frame, trends, exchange), frame['Date'])
+    return counts
+
+
+def window_verdicts(counts: Dict[str, Tuple[np.ndarray, np.ndarray]], window: int,
+                    group_ids=None, required: Optional[int] = None) -> np.ndarray:
+    """
+    Verdict tại mỗi nến từ tín hiệu trong `window` nến gần nhất
+
+    Statement của mỗi analyzer: BUY nếu số BUY > số SELL trong cửa sổ, SELL nếu ngược lại.
+    Verdict: BUY/SELL khi ít nhất `required` statement cùng loại và nhiều hơn loại kia
+    (mặc định theo required_agreement như predict_future_trend).
+
+    Returns:
+        Mảng int: +1 = BUY, -1 = SELL, 0 = HOLD
+    """
+    length = len(next(iter(counts.values()))[0]) if counts else 0
+    buy_votes = np.zeros(length, dtype=int)
+    sell_votes = np.zeros(length, dtype=int)
+    for buy, sell in counts.values():
+        net = rolling_sum(buy, window, group_ids) - rolling_sum(sell, window, group_ids)
+        buy_votes += net > 0
+        sell_votes += net < 0
+    required = required or required_agreement(len(counts))
+    return np.select(
+        [(buy_votes >= required) & (buy_votes > sell_votes),
+         (sell_votes >= required) & (sell_votes > buy_votes)],
+        [1, -1],
+        default=0
+    )
+
+
+def positions_from_verdicts(verdicts: np.ndarray, group_ids=None, allow_short: bool = False) -> np.ndarray:
+    """
+    Vị thế sau khi đóng cửa mỗi nến: BUY → 1, SELL → 0 (hoặc -1 nếu allow_short), HOLD → giữ vị thế trước
+
+    Mỗi mã bắt đầu không có vị thế.
+    """
+    verdicts = np.asarray(verdicts)
+    target = pd.Series(np.select(
+        [verdicts > 0, verdicts < 0],
+        [1.0, -1.0 if allow_short else 0.0],
+        default=np.nan
+    ))
+    if group_ids is None:
+        held = target.ffill()
+    else:
+        held = target.groupby(np.asarray(group_ids), sort=False).ffill()
+    return held.fillna(0.0).to_numpy()
+
+
+def evaluate_positions(close: np.ndarray, positions: np.ndarray, group_ids=None,
+                       cost_bps: float = 0.0) -> Dict[str, np.ndarray]:
+    """
+    Lợi nhuận theo nến của chiến lược
+
+    Vị thế quyết định khi nến t-1 đóng cửa áp dụng cho lợi nhuận close(t-1) → close(t);
+    phí giao dịch (cost_bps, tính trên giá trị thay đổi vị thế) trừ vào nến đổi vị thế.
+
+    Returns:
+        Dict mảng: bar_return, held (vị thế đang giữ), strategy_return, equity
+    """
+    close = np.asarray(close, dtype='float64')
+    positions = np.asarray(positions, dtype='float64')
+    prev_close = shift(close, 1, group_ids)
+    bar_return = np.nan_to_num(close / prev_close - 1.0)
+    held = np.nan_to_num(shift(positions, 1, group_ids))
+    turnover = np.abs(positions - np.nan_to_num(shift(positions, 1, group_ids)))
+    strategy_return = held * bar_return - turnover * cost_bps / 10000.0
+    growth = pd.Series(1.0 + strategy_return)
+    if group_ids is None:
+        equity = growth.cumprod().to_numpy()
+    else:
+        equity = growth.groupby(np.asarray(group_ids), sort=False).cumprod().to_numpy()
+    return {
+        'bar_return': bar_return,
+        'held': held,
+        'strategy_return': strategy_return,
+        'equity': equity,
+    }
+
+
+def summarize_backtest(close: np.ndarray, evaluation: Dict[str, np.ndarray], group_ids=None) -> pd.DataFrame:
+    """
+    Chỉ số tổng hợp cho từng mã
+
+    - total_return / annual_return: lợi nhuận cả kỳ / quy đổi theo năm (252 phiên)
+    - buy_hold_return: lợi nhuận nếu mua và giữ cả kỳ để so sánh
+    - max_drawdown: mức sụt giảm lớn nhất từ đỉnh của equity (số âm)
+    - trades / hit_rate: số lệnh (mỗi lần mở vị thế mới) và tỷ lệ lệnh có lãi
+    - exposure: tỷ lệ số nến có giữ vị thế
+
+    Returns:
+        DataFrame với index là mã (hoặc 0 nếu không có group_ids) và các cột BACKTEST_SUMMARY_COLUMNS
+    """
+    close = np.asarray(close, dtype='float64')
+    length = len(close)
+    groups = np.zeros(length, dtype=int) if group_ids is None else np.asarray(group_ids)
+    held = evaluation['held']
+    frame = pd.DataFrame({
+        'group': groups,
+        'close': close,
+        'equity': evaluation['equity'],
+        'growth': 1.0 + evaluation['strategy_return'],
+        'held': held,
+    })
+    grouped = frame.groupby('group', sort=False)
+    drawdown = frame['equity'] / grouped['equity'].cummax() - 1.0
+
+    # Mỗi lệnh là một đoạn liên tiếp giữ cùng một vị thế khác 0
+    previous_held = np.nan_to_num(shift(held, 1, group_ids))
+    starts = (held != 0) & ((held != previous_held) | (bar_positions(length, group_ids) == 0))
+    trade_ids = np.cumsum(starts)
+    in_trade = held != 0
+    trades = frame[in_trade].assign(trade=trade_ids[in_trade]).groupby(['group', 'trade'], sort=False)['growth'].prod() - 1.0
+    trade_stats = trades.groupby(level='group', sort=False).agg(['size', lambda r: float((r > 0).mean())])
+    trade_stats.columns = ['trades', 'hit_rate']
+
+    summary = pd.DataFrame({
+        'bars': grouped.size(),
+        'total_return': grouped['equity'].last() - 1.0,
+        'buy_hold_return': grouped['close'].last() / grouped['close'].first() - 1.0,
+        'max_drawdown': drawdown.groupby(frame['group'], sort=False).min(),
+        'exposure': (frame['held'] != 0).groupby(frame['group'], sort=False).mean(),
+    })
+    summary['annual_return'] = (1.0 + summary['total_return']) ** (TRADING_DAYS_PER_YEAR / summary['bars']) - 1.0
+    summary = summary.join(trade_stats)
+    summary['trades'] = summary['trades'].fillna(0).astype(int)
+    summary['hit_rate'] = summary['hit_rate'].fillna(0.0)
+    return summary[BACKTEST_SUMMARY_COLUMNS]
+
+
+def backtest_frame(df: pd.DataFrame, trends: list, exchange: str, window: int = 60,
+                   analyzers: Optional[List[str]] = None, allow_short: bool = False,
+                   cost_bps: float = 0.0, walk_forward: bool = False) -> Tuple[pd.DataFrame, pd.Series]:
+    """
+    Backtest toàn bộ lịch sử của một mã
+
+    Args:
+        df: DataFrame OHLCV đã sắp xếp theo Date
+        trends: Xu hướng trên toàn bộ lịch sử
+        exchange: Sàn giao dịch
+        window: Số nến gần nhất dùng để ra statement của mỗi analyzer
+        analyzers: Tên các analyzer (mặc định tất cả)
+        allow_short: SELL mở vị thế short thay vì chỉ bán ra
+        cost_bps: Phí giao dịch mỗi lần đổi vị thế (basis point)
+        walk_forward: Dùng verdict "as of" từng phiên đúng như predict trên cửa sổ `window` nến
+            (backtest.walk_forward) thay vì đếm tín hiệu theo nến trong cửa sổ
+
+    Returns:
+        Tuple (DataFrame theo nến: Date, Close, verdict, position, strategy_return, equity;
+               Series chỉ số tổng hợp)
+    """
+    if walk_forward:
+        # Import tại chỗ: walk_forward dùng bar_signal_counts của module này
+        from backtest.walk_forward import walk_forward_verdicts
+        verdicts = walk_forward_verdicts(df, trends, exchange, window=window, analyzers=analyzers)['verdict'].to_numpy()
+    else:
+        counts = bar_signal_counts(df, trends, exchange, analyzers)
+        verdicts = window_verdicts(counts, window)
+    positions = positions_from_verdicts(verdicts, allow_short=allow_short)
+    close = df['Close'].to_numpy(dtype='float64')
+    evaluation = evaluate_positions(close, positions, cost_bps=cost_bps)
+    bars = pd.DataFrame({
+        'Date': df['Date'].to_numpy(),
+        'Close': close,
+        'verdict': verdicts,
+        'position': positions,
+        'strategy_return': evaluation['strategy_return'],
+        'equity': evaluation['equity'],
+    })
+    summary = summarize_backtest(close, evaluation).iloc[0]
+    return bars, summary
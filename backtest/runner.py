@@ -0,0 +1,114 @@
+"""
+Chạy backtest cho nhiều mã: đọc lịch sử (feature store nếu có, không thì gọi API),
+backtest từng mã trên một tiến trình riêng và tổng hợp theo sàn.
+"""
+import logging
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, Optional, Tuple
+import pandas as pd
+import sys
+import os
+
+# Thêm parent directory vào path để import
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils import fetch_stock_history, records_to_price_frame
+from indicators.features import trends_from_frame
+from indicators.trend_analysis import calculate_trend
+from storage.feature_store import FeatureStore
+from backtest.engine import backtest_frame, BACKTEST_SUMMARY_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+
+def load_history(symbol: str, start_date: str, end_date: str,
+                 store_dir: Optional[str] = None) -> Optional[Tuple[pd.DataFrame, list, str]]:
+    """
+    Đọc lịch sử của một mã kèm xu hướng và sàn
+
+    Ưu tiên feature store (chỉ báo và nhãn đã tính sẵn trên toàn bộ lịch sử); nếu mã
+    chưa có trong store thì lấy OHLCV từ API và tính xu hướng trên toàn bộ khoảng.
+
+    Returns:
+        Tuple (df, trends, exchange) hoặc None nếu không đủ dữ liệu
+    """
+    if store_dir:
+        store = FeatureStore(store_dir)
+        meta = store.metadata(symbol)
+        if meta is not None:
+            df = store.read(symbol, start_date, end_date)
+            if df is not None and len(df) >= 2:
+                return df, trends_from_frame(df), meta.get('exchange', 'Unknown')
+
+    records = fetch_stock_history(symbol, start_date, end_date)
+    if not records or len(records) < 2:
+        return None
+    df = records_to_price_frame(records)
+    exchange = records[0].get("stock_code", {}).get("exchange", "Unknown")
+    first_date = df['Date'].iloc[0].strftime('%Y-%m-%d')
+    last_date = df['Date'].iloc[-1].strftime('%Y-%m-%d')
+    try:
+        trends = calculate_trend(df, symbol, first_date, last_date, exchange)
+    except ValueError:
+        trends = []
+    return df, trends, exchange
+
+
+def backtest_symbol(symbol: str, start_date: str, end_date: str, store_dir: Optional[str] = None,
+                    window: int = 60, analyzers: Optional[List[str]] = None,
+                    allow_short: bool = False, cost_bps: float = 0.0,
+                    walk_forward: bool = False) -> Optional[Dict]:
+    """
+    Backtest một mã (hàm cấp module để chạy trên process pool)
+
+    Returns:
+        Dict chỉ số tổng hợp kèm symbol và exchange, hoặc None nếu không đủ dữ liệu
+    """
+    history = load_history(symbol, start_date, end_date, store_dir)
+    if history is None:
+        return None
+    df, trends, exchange = history
+    _, summary = backtest_frame(df, trends, exchange, window=window, analyzers=analyzers,
+                                allow_short=allow_short, cost_bps=cost_bps, walk_forward=walk_forward)
+    return {"symbol": symbol, "exchange": exchange, **summary.to_dict()}
+
+
+def run_backtest(symbols: List[str], start_date: str, end_date: str, workers: int = 4, **options) -> pd.DataFrame:
+    """
+    Backtest nhiều mã song song trên process pool
+
+    Args:
+        symbols: Danh sách mã
+        start_date, end_date: Khoảng lịch sử (YYYY-MM-DD)
+        workers: Số tiến trình
+        **options: Tham số cho backtest_symbol (store_dir, window, analyzers, allow_short, cost_bps, walk_forward)
+
+    Returns:
+        DataFrame mỗi dòng một mã: symbol, exchange và các cột BACKTEST_SUMMARY_COLUMNS
+    """
+    rows = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(backtest_symbol, symbol, start_date, end_date, **options): symbol
+            for symbol in symbols
+        }
+        for future in as_completed(futures):
+            symbol = futures[future]
+            try:
+                row = future.result()
+            except Exception as e:
+                logger.error(f"{symbol}: {e}")
+                continue
+            if row is not None:
+                rows.append(row)
+    results = pd.DataFrame(rows, columns=['symbol', 'exchange'] + BACKTEST_SUMMARY_COLUMNS)
+    results = results.astype({'bars': int, 'trades': int})
+    return results.sort_values('symbol').reset_index(drop=True)
+
+
+def summarize_by_exchange(results: pd.DataFrame) -> pd.DataFrame:
+    """Trung bình chỉ số theo sàn (và số mã)"""
+    grouped = results.groupby('exchange')
+    summary = grouped[['total_return', 'annual_return', 'buy_hold_return', 'max_drawdown', 'hit_rate', 'exposure']].mean()
+    summary.insert(0, 'symbols', grouped.size())
+    summary['trades'] = grouped['trades'].sum()
+    return summary
@@ -0,0 +1,299 @@
+"""
+Dò tham số (parameter sweep) cho các ngưỡng của tín hiệu trên process pool.
+
+Các tham số được dò (mặc định là hằng số hiện tại của từng module):
+- rsi_levels: (oversold, overbought, extreme_oversold, extreme_overbought) - mặc định 30/70/10/90
+- volume_ratio: ngưỡng volume thấp của RSI/MA/MACD/BB - mặc định 0.5
+- ma_pairs: tập cặp MA dùng cho analyzer MA (theo tên trong MA_PAIR_SETS) - mặc định "all"
+- trend_threshold: ngưỡng % xác định xu hướng (ảnh hưởng nhãn nến) - mặc định 10/15/20 theo sàn
+
+Dữ liệu nến và chỉ báo (không phụ thuộc tham số) của tất cả các mã được tính một lần
+ở tiến trình chính rồi đặt vào shared memory; worker chỉ gắn vào vùng nhớ này (không
+pickle dữ liệu theo từng task). Mỗi task là một trend_threshold x một nhóm mã: nhãn nến
+được tính một lần, sau đó tất cả tổ hợp tham số còn lại được backtest theo panel mode.
+
+Verdict dùng cách đếm tín hiệu theo nến trong `window` nến gần nhất (backtest.engine).
+"""
+import itertools
+import logging
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+import sys
+import os
+
+# Thêm parent directory vào path để import
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from indicators.candle_patterns import classify_candle_pattern, as_of_candle_labels
+from indicators.trend_analysis import calculate_trend, TREND_THRESHOLDS
+from prediction.registry import ANALYZERS, INDICATORS
+from prediction.vectorized import action_counts, rolling_mean
+from prediction.rsi_signal_analysis import (
+    scan_rsi_rules, RSI_SIGNAL_RULES, RSI_OVERSOLD, RSI_OVERBOUGHT, RSI_EXTREME_OVERSOLD, RSI_EXTREME_OVERBOUGHT,
+    LOW_VOLUME_RATIO
+)
+from prediction.ma_signal_analysis import scan_ma_cross_rules, MA_PAIRS, MA_SIGNAL_RULES
+from prediction.macd_signal_analysis import scan_macd_rules, MACD_SIGNAL_RULES
+from prediction.bb_signal_analysis import scan_bb_rules, BB_SIGNAL_RULES
+from backtest.engine import (
+    window_verdicts, positions_from_verdicts, evaluate_positions, summarize_backtest, BACKTEST_SUMMARY_COLUMNS
+)
+from backtest.runner import load_history
+
+logger = logging.getLogger(__name__)
+
+# Các tập cặp MA có thể chọn
+MA_PAIR_SETS = {
+    'all': MA_PAIRS,
+    'fast': [pair for pair in MA_PAIRS if pair[0] == 'MA10'],
+    'slow': [pair for pair in MA_PAIRS if pair[0] != 'MA10'],
+    'golden': [('MA50', 'MA200')],
+}
+
+DEFAULT_RSI_LEVELS = (RSI_OVERSOLD, RSI_OVERBOUGHT, RSI_EXTREME_OVERSOLD, RSI_EXTREME_OVERBOUGHT)
+
+# Lưới tham số mặc định (tổ hợp đầu tiên của mỗi tham số là giá trị hiện tại)
+DEFAULT_SWEEP_GRID = {
+    'rsi_levels': [DEFAULT_RSI_LEVELS, (25, 75, 10, 90), (35, 65, 15, 85), (20, 80, 5, 95)],
+    'volume_ratio': [LOW_VOLUME_RATIO, 0.3, 0.7],
+    'ma_pairs': ['all', 'fast', 'slow', 'golden'],
+    'trend_threshold': [10, 15, 20],
+}
+
+SWEEP_PARAM_COLUMNS = ['rsi_levels', 'volume_ratio', 'ma_pairs', 'trend_threshold']
+
+# Cột lưu trong shared memory (Date lưu dạng số ngày kể từ epoch để giữ float64)
+PANEL_COLUMNS = [
+    'Date', 'Open', 'High', 'Low', 'Close', 'Volume',
+    'MA10', 'MA50', 'MA100', 'MA200', 'BB_Upper', 'BB_Lower', 'BB_Middle',
+    'RSI', 'MACD', 'MACD_Signal', 'MACD_Histogram',
+]
+
+# Chỉ báo tính sẵn ở tiến trình chính (không phụ thuộc tham số dò)
+_PANEL_INDICATORS = ['MA', 'BB', 'RSI', 'MACD']
+
+# Trạng thái của worker: vùng shared memory và thông tin các mã
+_worker_state: Dict[str, object] = {}
+
+
+def format_rsi_levels(levels: Tuple) -> str:
+    """Chuỗi hiển thị ngưỡng RSI, ví dụ "30/70/10/90" """
+    return '/'.join(f"{level:g}" for level in levels)
+
+
+def build_panel(frames: List[pd.DataFrame]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Nối dữ liệu nến + chỉ báo của các mã thành một ma trận float64 (dòng x PANEL_COLUMNS)
+
+    Returns:
+        Tuple (ma trận, offsets) - dòng của mã thứ i là offsets[i]:offsets[i + 1]
+    """
+    offsets = np.concatenate([[0], np.cumsum([len(frame) for frame in frames])])
+    panel = np.empty((offsets[-1], len(PANEL_COLUMNS)), dtype='float64')
+    for frame, start, end in zip(frames, offsets[:-1], offsets[1:]):
+        for column_index, column in enumerate(PANEL_COLUMNS):
+            if column == 'Date':
+                values = frame['Date'].to_numpy(dtype='datetime64[D]').astype('int64')
+            else:
+                values = frame[column].to_numpy(dtype='float64')
+            panel[start:end, column_index] = values
+    return panel, offsets
+
+
+def _init_worker(shm_name: str, shape: Tuple[int, int], offsets: np.ndarray, symbols: List[str], exchanges: List[str]):
+    """Gắn worker vào vùng shared memory chứa panel (chạy một lần khi tạo tiến trình)"""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    _worker_state['shm'] = shm
+    _worker_state['panel'] = np.ndarray(shape, dtype='float64', buffer=shm.buf)
+    _worker_state['offsets'] = offsets
+    _worker_state['symbols'] = symbols
+    _worker_state['exchanges'] = exchanges
+
+
+def _symbol_frame(panel: np.ndarray, start: int, end: int) -> pd.DataFrame:
+    """DataFrame của một mã từ panel (copy ra khỏi shared memory)"""
+    frame = pd.DataFrame(panel[start:end], columns=PANEL_COLUMNS)
+    frame['Date'] = frame['Date'].astype('int64').astype('datetime64[D]').astype('datetime64[ns]')
+    return frame
+
+
+def _candle_counts(frame: pd.DataFrame, symbol: str, exchange: str, trend_threshold: float):
+    """Số tín hiệu Candle theo nến với xu hướng tính theo trend_threshold (nhãn "as of" từng nến như bar_signal_counts)"""
+    start_date = frame['Date'].iloc[0].strftime('%Y-%m-%d')
+    end_date = frame['Date'].iloc[-1].strftime('%Y-%m-%d')
+    try:
+        trends = calculate_trend(frame, symbol, start_date, end_date, exchange, threshold=trend_threshold)
+    except ValueError:
+        trends = []
+    labelled = as_of_candle_labels(classify_candle_pattern(frame, exchange, trends), exchange, trends, trend_threshold)
+    return ANALYZERS['Candle'].scan(labelled, trends, exchange)
+
+
+def sweep_chunk(trend_threshold: float, first: int, last: int, grid: Dict[str, list], window: int,
+                allow_short: bool, cost_bps: float) -> pd.DataFrame:
+    """
+    Backtest các mã first..last-1 với một trend_threshold và mọi tổ hợp tham số còn lại (chạy trên worker)
+
+    Returns:
+        DataFrame mỗi dòng một (mã, tổ hợp tham số): symbol, exchange, SWEEP_PARAM_COLUMNS, BACKTEST_SUMMARY_COLUMNS
+    """
+    panel = _worker_state['panel']
+    offsets = _worker_state['offsets']
+    symbols = _worker_state['symbols'][first:last]
+    exchanges = _worker_state['exchanges'][first:last]
+    start, end = offsets[first], offsets[last]
+    rows = panel[start:end]
+    columns = {column: rows[:, index] for index, column in enumerate(PANEL_COLUMNS)}
+    group_ids = np.repeat(np.arange(first, last), np.diff(offsets[first:last + 1]))
+
+    # Candle: nhãn nến phụ thuộc trend_threshold, tính riêng từng mã
+    candle_buy, candle_sell = [], []
+    for symbol_index, (symbol, exchange) in enumerate(zip(symbols, exchanges), start=first):
+        frame = _symbol_frame(panel, offsets[symbol_index], offsets[symbol_index + 1])
+        buy, sell = _candle_counts(frame, symbol, exchange, trend_threshold)
+        candle_buy.append(buy)
+        candle_sell.append(sell)
+    candle_counts = (np.concatenate(candle_buy), np.concatenate(candle_sell))
+
+    volume = columns['Volume']
+    volume_ma20 = rolling_mean(volume, window=20, min_periods=1, group_ids=group_ids)
+    volume_avg_full = rolling_mean(volume, window=20, group_ids=group_ids)
+    close = columns['Close']
+
+    results = []
+    for volume_ratio in grid['volume_ratio']:
+        macd_rules = scan_macd_rules(columns['MACD'], columns['MACD_Signal'], close, volume, volume_avg_full,
+                                     group_ids, low_volume_ratio=volume_ratio)
+        bb_rules = scan_bb_rules(close, columns['BB_Upper'], columns['BB_Lower'], volume, volume_ma20,
+                                 group_ids, low_volume_ratio=volume_ratio)
+        base_counts = {
+            'MACD': action_counts(macd_rules, [action for action, _, _ in MACD_SIGNAL_RULES]),
+            'BB': action_counts(bb_rules, [action for action, _ in BB_SIGNAL_RULES]),
+        }
+        ma_counts = {}
+        for pair_set in grid['ma_pairs']:
+            pairs = MA_PAIR_SETS[pair_set]
+            ma_small = np.column_stack([columns[small] for small, _ in pairs])
+            ma_large = np.column_stack([columns[large] for _, large in pairs])
+            ma_rules = scan_ma_cross_rules(ma_small, ma_large, volume, volume_ma20, group_ids,
+                                           low_volume_ratio=volume_ratio)
+            ma_counts[pair_set] = action_counts(ma_rules, [action for action, _ in MA_SIGNAL_RULES])
+
+        for levels in grid['rsi_levels']:
+            oversold, overbought, extreme_oversold, extreme_overbought = levels
+            rsi_rules = scan_rsi_rules(columns['RSI'], volume, volume_ma20, group_ids,
+                                       oversold=oversold, overbought=overbought,
+                                       extreme_oversold=extreme_oversold, extreme_overbought=extreme_overbought,
+                                       low_volume_ratio=volume_ratio)
+            rsi_counts = action_counts(rsi_rules, [action for action, _ in RSI_SIGNAL_RULES])
+            for pair_set in grid['ma_pairs']:
+                # Cùng thứ tự analyzer như registry
+                counts = {
+                    'RSI': rsi_counts,
+                    'Candle': candle_counts,
+                    'MA': ma_counts[pair_set],
+                    'MACD': base_counts['MACD'],
+                    'BB': base_counts['BB'],
+                }
+                verdicts = window_verdicts(counts, window, group_ids)
+                positions = positions_from_verdicts(verdicts, group_ids, allow_short)
+                evaluation = evaluate_positions(close, positions, group_ids, cost_bps)
+                summary = summarize_backtest(close, evaluation, group_ids)
+                summary.insert(0, 'symbol', [symbols[group - first] for group in summary.index])
+                summary.insert(1, 'exchange', [exchanges[group - first] for group in summary.index])
+                summary.insert(2, 'rsi_levels', format_rsi_levels(levels))
+                summary.insert(3, 'volume_ratio', volume_ratio)
+                summary.insert(4, 'ma_pairs', pair_set)
+                summary.insert(5, 'trend_threshold', trend_threshold)
+                results.append(summary.reset_index(drop=True))
+    return pd.concat(results, ignore_index=True)
+
+
+def _load_symbol(symbol: str, start_date: str, end_date: str, store_dir: Optional[str]):
+    """Lịch sử của một mã với các chỉ báo không phụ thuộc tham số dò (None nếu không đủ dữ liệu)"""
+    history = load_history(symbol, start_date, end_date, store_dir)
+    if history is None:
+        return None
+    df, trends, exchange = history
+    if exchange.upper() not in TREND_THRESHOLDS:
+        return None
+    frame = df.reset_index(drop=True)
+    for name in _PANEL_INDICATORS:
+        if not INDICATORS[name].is_present(frame):
+            frame = INDICATORS[name].compute(frame, trends, exchange)
+    return frame[PANEL_COLUMNS], exchange
+
+
+def run_sweep(symbols: List[str], start_date: str, end_date: str, grid: Optional[Dict[str, list]] = None,
+              workers: int = 4, window: int = 60, allow_short: bool = False, cost_bps: float = 0.0,
+              store_dir: Optional[str] = None, chunk_size: int = 50) -> pd.DataFrame:
+    """
+    Backtest mọi tổ hợp tham số trong grid cho nhiều mã trên process pool
+
+    Args:
+        symbols: Danh sách mã
+        start_date, end_date: Khoảng lịch sử (YYYY-MM-DD)
+        grid: Lưới tham số (các khóa như DEFAULT_SWEEP_GRID, thiếu khóa nào dùng mặc định)
+        workers: Số tiến trình
+        window, allow_short, cost_bps: Tham số backtest (như run_backtest)
+        store_dir: Thư mục feature store
+        chunk_size: Số mã mỗi task
+
+    Returns:
+        DataFrame mỗi dòng một (mã, tổ hợp tham số)
+    """
+    grid = {**DEFAULT_SWEEP_GRID, **(grid or {})}
+    unknown = [name for name in grid['ma_pairs'] if name not in MA_PAIR_SETS]
+    if unknown:
+        raise ValueError(f"Tập cặp MA không hợp lệ: {', '.join(unknown)}. Chỉ hỗ trợ: {', '.join(MA_PAIR_SETS)}")
+
+    # Đọc dữ liệu (I/O) song song bằng thread, giữ thứ tự mã
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as loader:
+        loaded = list(loader.map(lambda symbol: _load_symbol(symbol, start_date, end_date, store_dir), symbols))
+    kept = [(symbol, item) for symbol, item in zip(symbols, loaded) if item is not None]
+    if not kept:
+        return pd.DataFrame(columns=['symbol', 'exchange'] + SWEEP_PARAM_COLUMNS + BACKTEST_SUMMARY_COLUMNS)
+    kept_symbols = [symbol for symbol, _ in kept]
+    exchanges = [exchange for _, (_, exchange) in kept]
+    panel, offsets = build_panel([frame for _, (frame, _) in kept])
+    logger.info(f"Sweep panel: {len(kept_symbols)} symbols, {len(panel)} bars")
+
+    shm = shared_memory.SharedMemory(create=True, size=max(panel.nbytes, 1))
+    try:
+        np.ndarray(panel.shape, dtype='float64', buffer=shm.buf)[:] = panel
+        del panel
+        chunks = [(first, min(first + chunk_size, len(kept_symbols))) for first in range(0, len(kept_symbols), chunk_size)]
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(shm.name, (int(offsets[-1]), len(PANEL_COLUMNS)), offsets,
+                                           kept_symbols, exchanges)) as executor:
+            futures = [
+                executor.submit(sweep_chunk, trend_threshold, first, last, grid, window, allow_short, cost_bps)
+                for trend_threshold, (first, last) in itertools.product(grid['trend_threshold'], chunks)
+            ]
+            results = [future.result() for future in futures]
+    finally:
+        shm.close()
+        shm.unlink()
+
+    results = pd.concat(results, ignore_index=True)
+    results = results.astype({'bars': int, 'trades': int})
+    return results.sort_values(['symbol'] + SWEEP_PARAM_COLUMNS).reset_index(drop=True)
+
+
+def summarize_sweep(results: pd.DataFrame) -> pd.DataFrame:
+    """Trung bình chỉ số theo sàn và tổ hợp tham số"""
+    grouped = results.groupby(['exchange'] + SWEEP_PARAM_COLUMNS)
+    summary = grouped[['total_return', 'annual_return', 'buy_hold_return', 'max_drawdown', 'hit_rate', 'exposure']].mean()
+    summary.insert(0, 'symbols', grouped.size())
+    summary['trades'] = grouped['trades'].sum()
+    return summary.reset_index()
+
+
+def best_settings(summary: pd.DataFrame, metric: str = 'annual_return') -> pd.DataFrame:
+    """Tổ hợp tham số có `metric` trung bình cao nhất của mỗi sàn"""
+    if metric not in summary.columns:
+        raise ValueError(f"Chỉ số '{metric}' không hợp lệ. Chỉ hỗ trợ: {', '.join(BACKTEST_SUMMARY_COLUMNS)}")
+    best = summary.loc[summary.groupby('exchange')[metric].idxmax()]
+    return best.set_index('exchange')
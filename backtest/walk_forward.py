@@ -0,0 +1,336 @@
+"""
+Walk-forward: verdict "as of" từng phiên của predict_future_trend với cửa sổ 60/180 nến,
+tính một lần trên toàn bộ chuỗi thay vì gọi lại predict cho mỗi ngày (O(n) thay vì O(n²)).
+
+Verdict tại phiên t bằng đúng kết quả của predict_future_trend trên cửa sổ N nến
+kết thúc tại t của feature frame tính trên dữ liệu đến t (như /predict đọc feature
+store được build sau phiên t), không dùng dữ liệu sau t:
+
+- Chỉ báo ở mỗi phiên chỉ phụ thuộc dữ liệu đến phiên đó nên dùng chung.
+- Nhãn nến của cả chuỗi chỉ dùng được cho các chu kỳ xu hướng đã kết thúc tại t (chu
+  kỳ được chọn theo giá đóng cửa tới 14 nến sau); các nến từ chu kỳ đầu tiên kết thúc
+  sau t được gán lại nhãn theo chu kỳ tìm được trên dữ liệu đến t (trend_period_tails).
+- Tín hiệu được quét một lần trên toàn chuỗi (chưa áp bộ lọc volume); số BUY/SELL
+  trong cửa sổ lấy từ hiệu tổng tiền tố.
+- Các hiệu ứng đầu cửa sổ được tính lại riêng cho 19 nến đầu: volume trung bình 20
+  phiên của analyzer được tính trên cửa sổ (min_periods=1, MACD thì chưa lọc khi
+  chưa đủ 20 phiên), và các nến đầu cửa sổ không có nến trước để so sánh
+  (RSI/BB cần 1 nến, MA/MACD cần 2 nến).
+- Candle: tín hiệu cùng trend period được cộng strength thành một tín hiệu; period
+  bị cửa sổ cắt ở hai đầu được tính bằng tổng tiền tố phần nằm trong cửa sổ.
+
+Độ trễ của tín hiệu nến: Star Doji cần nến kế tiếp để xác nhận, nên tại phiên t Star
+Doji của chính phiên t luôn là HOLD; tín hiệu của nó chỉ có từ phiên t+1. Các mẫu nến
+khác có ngay khi nến đóng cửa.
+
+Analyzer đăng ký thêm (không thuộc 5 analyzer mặc định) dùng tổng số tín hiệu theo
+nến trong cửa sổ (bar_signal_counts), không tính hiệu ứng đầu cửa sổ.
+"""
+from typing import List, Optional
+import numpy as np
+import pandas as pd
+import sys
+import os
+
+# Thêm parent directory vào path để import
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from prediction.registry import get_analyzers, prepare_frame
+from prediction.future_prediction import required_agreement
+from prediction.vectorized import action_counts, rolling_mean, volume_filter_ratio
+from prediction.rsi_signal_analysis import scan_rsi_rules, RSI_SIGNAL_RULES, LOW_VOLUME_RATIO as RSI_LOW_VOLUME
+from prediction.ma_signal_analysis import scan_ma_cross_rules, MA_PAIRS, MA_SIGNAL_RULES, LOW_VOLUME_RATIO as MA_LOW_VOLUME
+from prediction.macd_signal_analysis import scan_macd_rules, MACD_SIGNAL_RULES, LOW_VOLUME_RATIO as MACD_LOW_VOLUME
+from prediction.bb_signal_analysis import scan_bb_rules, BB_SIGNAL_RULES, LOW_VOLUME_RATIO as BB_LOW_VOLUME
+from prediction.candle_signal_analysis import (
+    scan_candle_signals, select_candle_signals, CANDLE_ENTRY_ACTIONS, CANDLE_ENTRY_STRENGTHS
+)
+from indicators.trend_analysis import trend_period_tails
+from indicators.candle_patterns import frame_candle_shapes, candle_pattern_names
+from backtest.engine import bar_signal_counts
+
+# Cửa sổ của /predict theo range
+WALK_FORWARD_WINDOWS = {'short': 60, 'long': 180}
+
+VOLUME_WINDOW = 20
+# Số nến đầu cửa sổ có volume trung bình khác với khi tính trên toàn chuỗi
+_HEAD = VOLUME_WINDOW - 1
+# Ngữ cảnh xu hướng của các nến được gán lại nhãn (chỉ số dùng trong _candle_window_votes)
+_TAIL_CONTEXTS = ['sideways', 'uptrend', 'downtrend']
+
+
+def _window_starts(length: int, window: int) -> np.ndarray:
+    """Vị trí nến đầu tiên của cửa sổ kết thúc tại mỗi phiên"""
+    return np.maximum(np.arange(length) - window + 1, 0)
+
+
+def _prefix(values: np.ndarray) -> np.ndarray:
+    """Tổng tiền tố có phần tử 0 ở đầu: tổng [a, b] = prefix[b + 1] - prefix[a]"""
+    return np.concatenate([np.zeros(1, dtype=np.asarray(values).dtype), np.cumsum(values)])
+
+
+def _windowed_counts(buy: np.ndarray, sell: np.ndarray, volume: np.ndarray, starts: np.ndarray,
+                     min_offset: int, volume_mode: str, low_volume_ratio: float):
+    """
+    Số BUY/SELL trong cửa sổ [starts[t], t] của một analyzer có bộ lọc volume
+
+    Args:
+        buy, sell: Số tín hiệu theo nến khi chưa áp bộ lọc volume
+        volume: Mảng volume
+        starts: Nến đầu cửa sổ của mỗi phiên
+        min_offset: Số nến đầu cửa sổ không thể có tín hiệu (thiếu nến trước)
+        volume_mode: "min1" - trung bình trượt min_periods=1 (RSI/MA/BB),
+                     "full" - trung bình đủ 20 phiên, chưa đủ thì không lọc (MACD)
+        low_volume_ratio: Ngưỡng volume thấp của analyzer
+    """
+    length = len(buy)
+    volume = np.asarray(volume)
+    volume_float = volume.astype('float64')
+    ends = np.arange(length)
+
+    # Phần thân cửa sổ (từ nến thứ 20 trở đi): volume trung bình giống như trên toàn chuỗi
+    if volume_mode == 'min1':
+        full_ok = ~(volume_filter_ratio(volume_float, rolling_mean(volume_float, window=VOLUME_WINDOW, min_periods=1)) < low_volume_ratio)
+    else:
+        full_avg = rolling_mean(volume_float, window=VOLUME_WINDOW)
+        full_ok = ~(~np.isnan(full_avg) & (volume_float < low_volume_ratio * full_avg))
+    body_buy = _prefix(np.where(full_ok, buy, 0))
+    body_sell = _prefix(np.where(full_ok, sell, 0))
+    body_start = np.minimum(starts + _HEAD, ends + 1)
+    window_buy = body_buy[ends + 1] - body_buy[body_start]
+    window_sell = body_sell[ends + 1] - body_sell[body_start]
+
+    # 19 nến đầu cửa sổ: volume trung bình tính trên phần cửa sổ đã có
+    volume_prefix = _prefix(volume if np.issubdtype(volume.dtype, np.integer) else volume_float)
+    for offset in range(min_offset, _HEAD):
+        positions = starts + offset
+        inside = positions <= ends
+        positions = np.minimum(positions, length - 1)
+        if volume_mode == 'min1':
+            average = (volume_prefix[positions + 1] - volume_prefix[starts]) / (offset + 1)
+            ok = ~(volume_filter_ratio(volume_float[positions], average) < low_volume_ratio)
+        else:
+            ok = np.ones(length, dtype=bool)
+        use = inside & ok
+        window_buy = window_buy + np.where(use, buy[positions], 0)
+        window_sell = window_sell + np.where(use, sell[positions], 0)
+    return window_buy, window_sell
+
+
+def _scan_unfiltered(frame: pd.DataFrame, name: str):
+    """Số BUY/SELL theo nến của analyzer mặc định khi chưa áp bộ lọc volume"""
+    no_average = np.full(len(frame), np.nan)
+    volume = frame['Volume']
+    if name == 'RSI':
+        rules = scan_rsi_rules(frame['RSI'], volume, no_average)
+        return action_counts(rules, [action for action, _ in RSI_SIGNAL_RULES])
+    if name == 'MA':
+        ma_small = np.column_stack([frame[small].to_numpy(dtype='float64') for small, _ in MA_PAIRS])
+        ma_large = np.column_stack([frame[large].to_numpy(dtype='float64') for _, large in MA_PAIRS])
+        rules = scan_ma_cross_rules(ma_small, ma_large, volume, no_average)
+        return action_counts(rules, [action for action, _ in MA_SIGNAL_RULES])
+    if name == 'MACD':
+        rules = scan_macd_rules(frame['MACD'], frame['MACD_Signal'], frame['Close'], volume, no_average)
+        return action_counts(rules, [action for action, _, _ in MACD_SIGNAL_RULES])
+    rules = scan_bb_rules(frame['Close'], frame['BB_Upper'], frame['BB_Lower'], volume, no_average)
+    return action_counts(rules, [action for action, _ in BB_SIGNAL_RULES])
+
+
+# (số nến đầu cửa sổ không có tín hiệu, cách tính volume trung bình, ngưỡng volume thấp)
+_FILTERED_ANALYZERS = {
+    'RSI': (1, 'min1', RSI_LOW_VOLUME),
+    'MA': (2, 'min1', MA_LOW_VOLUME),
+    'MACD': (2, 'full', MACD_LOW_VOLUME),
+    'BB': (1, 'min1', BB_LOW_VOLUME),
+}
+
+
+def _confirmed_candle_votes(frame: pd.DataFrame, starts: np.ndarray, ends: np.ndarray):
+    """
+    Số tín hiệu BUY/SELL của analyzer Candle trên đoạn [starts[t], ends[t]] với nhãn của cả chuỗi
+
+    Tín hiệu trong cùng trend period được gộp thành một (dấu của tổng strength),
+    tín hiệu ngoài period được đếm riêng từng nến; đoạn rỗng khi ends[t] < starts[t].
+    """
+    length = len(frame)
+    positions = np.arange(length)
+    patterns = frame['candle_pattern'].astype(object).to_numpy()
+    trend_contexts = frame['trend_context'].astype(object).to_numpy()
+    periods = frame['trend_period'].astype(object).to_numpy() if 'trend_period' in frame.columns \
+        else np.full(length, None, dtype=object)
+
+    entries = scan_candle_signals(patterns, trend_contexts, frame['Open'], frame['Close'])
+    entries = np.where(select_candle_signals(patterns, trend_contexts), entries, -1)
+    strengths = np.append(np.array(CANDLE_ENTRY_STRENGTHS), 0)[entries]
+    buy, sell = action_counts(entries, CANDLE_ENTRY_ACTIONS)
+
+    stops = np.maximum(ends + 1, starts)
+    empty = stops == starts
+    last = np.maximum(stops - 1, 0)
+
+    # Star Doji tại chính phiên t chưa có nến xác nhận → HOLD, strength 0
+    pending_star = (patterns == 'Star Doji') & (entries >= 0) & (ends == positions)
+    star_strength = np.where(pending_star, strengths, 0)
+    star_buy = np.where(pending_star, buy, 0)
+    star_sell = np.where(pending_star, sell, 0)
+
+    in_period = np.array([bool(period) and bool(trend) for period, trend in zip(periods, trend_contexts)], dtype=bool)
+
+    # Tín hiệu ngoài trend period: đếm từng nến
+    alone_buy = _prefix(np.where(in_period, 0, buy))
+    alone_sell = _prefix(np.where(in_period, 0, sell))
+    votes_buy = alone_buy[stops] - alone_buy[starts] - np.where(in_period, 0, star_buy)
+    votes_sell = alone_sell[stops] - alone_sell[starts] - np.where(in_period, 0, star_sell)
+
+    # Các đoạn liên tiếp cùng trend period
+    labels = np.where(in_period, periods, None)
+    changed = np.ones(length, dtype=bool)
+    changed[1:] = labels[1:] != labels[:-1]
+    segment_starts = np.flatnonzero(changed & in_period)
+    if len(segment_starts) == 0:
+        return votes_buy, votes_sell
+    run_ids = np.cumsum(changed) - 1
+    run_of_segment = run_ids[segment_starts]
+    run_ends = np.append(np.flatnonzero(changed)[1:] - 1, length - 1)
+    segment_ends = run_ends[run_of_segment]
+    segment_of_bar = np.full(length, -1)
+    segment_of_bar[in_period] = np.searchsorted(run_of_segment, run_ids[in_period])
+
+    strength_prefix = _prefix(np.where(in_period, strengths, 0))
+    segment_totals = strength_prefix[segment_ends + 1] - strength_prefix[segment_starts]
+    positive_prefix = _prefix((segment_totals > 0).astype(int))
+    negative_prefix = _prefix((segment_totals < 0).astype(int))
+
+    # Period chứa nến cuối đoạn và period chứa nến đầu đoạn (có thể bị cắt ở đầu cửa sổ)
+    last_segment = np.where(empty, -1, segment_of_bar[last])
+    first_segment = np.where(empty, -1, segment_of_bar[np.minimum(starts, length - 1)])
+    cut_first = (first_segment >= 0) & (segment_starts[np.maximum(first_segment, 0)] < starts)
+
+    # Các period nằm trọn trong đoạn và kết thúc trước period của nến cuối đoạn
+    interior_from = np.searchsorted(segment_starts, starts, side='left')
+    interior_to = np.where(last_segment >= 0, last_segment, np.searchsorted(segment_starts, stops - 1, side='right'))
+    interior_to = np.maximum(interior_to, interior_from)
+    votes_buy = votes_buy + positive_prefix[interior_to] - positive_prefix[interior_from]
+    votes_sell = votes_sell + negative_prefix[interior_to] - negative_prefix[interior_from]
+
+    # Period của nến cuối đoạn: cộng từ đầu period (hoặc đầu cửa sổ), bỏ Star Doji chưa xác nhận
+    has_last = last_segment >= 0
+    last_from = np.where(has_last, np.maximum(segment_starts[np.maximum(last_segment, 0)], starts), stops)
+    last_sum = strength_prefix[stops] - strength_prefix[last_from] - np.where(has_last, star_strength, 0)
+    votes_buy = votes_buy + (has_last & (last_sum > 0))
+    votes_sell = votes_sell + (has_last & (last_sum < 0))
+
+    # Period bị cắt ở đầu cửa sổ (khác period của nến cuối đoạn): phần từ đầu cửa sổ đến hết period
+    first_only = cut_first & (first_segment != last_segment)
+    first_to = np.minimum(segment_ends[np.maximum(first_segment, 0)], last)
+    first_sum = strength_prefix[first_to + 1] - strength_prefix[starts]
+    votes_buy = votes_buy + (first_only & (first_sum > 0))
+    votes_sell = votes_sell + (first_only & (first_sum < 0))
+    return votes_buy, votes_sell
+
+
+def _candle_window_votes(frame: pd.DataFrame, starts: np.ndarray, trends: list, exchange: str):
+    """
+    Số tín hiệu BUY/SELL của analyzer Candle trong cửa sổ [starts[t], t] với nhãn xu hướng đã biết tại t
+
+    Nhãn của cả chuỗi dùng được cho các nến trước cuts[t] (trend_period_tails); từ cuts[t]
+    đến t (tối đa 14 nến) nhãn xu hướng và mẫu nến được gán lại theo chu kỳ tìm được trên
+    dữ liệu đến t.
+    """
+    length = len(frame)
+    ends = np.arange(length)
+    cuts, tails = trend_period_tails(frame, trends, exchange)
+    votes_buy, votes_sell = _confirmed_candle_votes(frame, starts, np.minimum(cuts - 1, ends))
+    reworked = np.flatnonzero(cuts <= ends)
+    if len(reworked) == 0:
+        return votes_buy, votes_sell
+
+    # Entry của mỗi nến theo từng ngữ cảnh (sideways / uptrend / downtrend), có và chưa có nến xác nhận
+    shapes = frame_candle_shapes(frame, exchange)
+    open_prices = frame['Open'].to_numpy(dtype='float64')
+    close_prices = frame['Close'].to_numpy(dtype='float64')
+    confirmed = np.empty((len(_TAIL_CONTEXTS), length), dtype=int)
+    pending = np.empty((len(_TAIL_CONTEXTS), length), dtype=int)
+    for code, context in enumerate(_TAIL_CONTEXTS):
+        contexts = np.full(length, context, dtype=object)
+        patterns = candle_pattern_names(shapes, contexts)
+        selected = select_candle_signals(patterns, contexts)
+        confirmed[code] = np.where(selected, scan_candle_signals(patterns, contexts, open_prices, close_prices), -1)
+        pending[code] = np.where(selected, scan_candle_signals(patterns, contexts, open_prices, close_prices,
+                                                               group_ids=ends), -1)
+    strengths = np.append(np.array(CANDLE_ENTRY_STRENGTHS), 0)
+    actions = np.append(np.array(CANDLE_ENTRY_ACTIONS, dtype=object), 'HOLD')
+
+    for t in reworked:
+        first = max(starts[t], cuts[t])
+        codes = np.zeros(t - first + 1, dtype=int)
+        period_ids = np.full(t - first + 1, -1)
+        for number, (period_start, period_end, trend) in enumerate(tails[t]):
+            if period_end >= first:
+                span = slice(max(period_start, first) - first, period_end - first + 1)
+                codes[span] = _TAIL_CONTEXTS.index(trend)
+                period_ids[span] = number
+        entries = confirmed[codes, np.arange(first, t + 1)]
+        entries[-1] = pending[codes[-1], t]
+        alone = actions[entries[period_ids < 0]]
+        votes_buy[t] += int(np.sum(alone == 'BUY'))
+        votes_sell[t] += int(np.sum(alone == 'SELL'))
+        for number in np.unique(period_ids[period_ids >= 0]):
+            total = strengths[entries[period_ids == number]].sum()
+            votes_buy[t] += total > 0
+            votes_sell[t] += total < 0
+    return votes_buy, votes_sell
+
+
+def walk_forward_verdicts(df: pd.DataFrame, trends: list, exchange: str, window: int = 60,
+                          analyzers: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Statement của từng analyzer và verdict cuối cùng "as of" mỗi phiên
+
+    Args:
+        df: Feature frame của một mã trên toàn bộ lịch sử (đọc từ feature store hoặc OHLCV;
+            chỉ báo/nhãn còn thiếu được tính trên toàn chuỗi)
+        trends: Xu hướng trên toàn bộ lịch sử (nhãn nến của df được tính theo trends)
+        exchange: Sàn giao dịch
+        window: Số nến của cửa sổ predict (60 = short, 180 = long)
+        analyzers: Tên các analyzer (mặc định tất cả)
+
+    Returns:
+        DataFrame theo phiên: Date, một cột statement (+1/-1/0) mỗi analyzer và verdict
+    """
+    selected = get_analyzers(analyzers)
+    frame = prepare_frame(df.reset_index(drop=True), selected, trends, exchange)
+    length = len(frame)
+    starts = _window_starts(length, window)
+    ends = np.arange(length)
+
+    statements = {}
+    extra = [analyzer.name for analyzer in selected if analyzer.name not in _FILTERED_ANALYZERS and analyzer.name != 'Candle']
+    extra_counts = bar_signal_counts(frame, trends, exchange, extra) if extra else {}
+    for analyzer in selected:
+        if analyzer.name == 'Candle':
+            window_buy, window_sell = _candle_window_votes(frame, starts, trends, exchange)
+        elif analyzer.name in _FILTERED_ANALYZERS:
+            buy, sell = _scan_unfiltered(frame, analyzer.name)
+            window_buy, window_sell = _windowed_counts(buy, sell, frame['Volume'].to_numpy(), starts,
+                                                       *_FILTERED_ANALYZERS[analyzer.name])
+        else:
+            buy, sell = extra_counts[analyzer.name]
+            buy_prefix, sell_prefix = _prefix(buy), _prefix(sell)
+            window_buy = buy_prefix[ends + 1] - buy_prefix[starts]
+            window_sell = sell_prefix[ends + 1] - sell_prefix[starts]
+        statements[analyzer.name] = np.sign(window_buy - window_sell).astype(int)
+
+    buy_votes = sum(statement > 0 for statement in statements.values())
+    sell_votes = sum(statement < 0 for statement in statements.values())
+    required = required_agreement(len(selected))
+    verdicts = np.select(
+        [(buy_votes >= required) & (buy_votes > sell_votes),
+         (sell_votes >= required) & (sell_votes > buy_votes)],
+        [1, -1],
+        default=0
+    )
+    result = pd.DataFrame({'Date': frame['Date'].to_numpy()})
+    for name, statement in statements.items():
+        result[name] = statement
+    result['verdict'] = verdicts
+    return result
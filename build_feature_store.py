@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+"""
+Job tính trước chỉ báo và nhãn mẫu nến cho tất cả mã chứng khoán.
+
+Chạy sau giờ đóng cửa (ví dụ cron 16:00 các ngày trong tuần):
+    python build_feature_store.py --store-dir data/features
+
+Lần chạy đầu lấy toàn bộ lịch sử (--years năm); các lần sau chỉ lấy phần nến mới
+kể từ ngày cuối cùng đã lưu, ghép với OHLCV cũ rồi tính lại feature cho mã đó.
+
+Khi đặt SIGNAL_STORE_PATH (hoặc --signal-store), tín hiệu BUY/SELL của các analyzer tại
+các nến chưa được đánh giá được ghi thêm vào lịch sử tín hiệu (storage/signal_store.py).
+"""
+import logging
+import sys
+import argparse
+import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import pandas as pd
+from dotenv import load_dotenv
+
+from utils import fetch_stock_symbols, fetch_stock_history, records_to_price_frame
+from indicators.features import compute_feature_frame, OHLCV_COLUMNS
+from storage.feature_store import FeatureStore, FEATURE_STORE_DIR, FEATURE_STORE_VERSION
+from storage.signal_store import SignalStore, SIGNAL_STORE_PATH
+from prediction.incremental import update_signal_history
+
+# Setup logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.StreamHandler(sys.stdout)
+    ]
+)
+
+logger = logging.getLogger("feature-store")
+
+
+def update_symbol(store: FeatureStore, symbol: str, exchange: str, history_start: str, end_date: str, full: bool = False,
+                  signals: SignalStore = None) -> int:
+    """
+    Cập nhật feature của một mã (và lịch sử tín hiệu nếu có signals)
+
+    Returns:
+        Số nến đã lưu cho mã
+    """
+    meta = None if full else store.metadata(symbol)
+    if meta and meta.get('last_date'):
+        # Chỉ lấy nến mới, giữ lại OHLCV đã lưu
+        stored = store.read(symbol, columns=OHLCV_COLUMNS)
+        fetch_start = meta['last_date']
+        history_start = meta.get('history_start') or history_start
+        exchange = meta.get('exchange') if exchange == "Unknown" else exchange
+    else:
+        stored = None
+        fetch_start = history_start
+
+    records = fetch_stock_history(symbol, fetch_start, end_date)
+    fresh = records_to_price_frame(records) if records else None
+    if records and exchange == "Unknown":
+        exchange = records[0].get("stock_code", {}).get("exchange", "Unknown")
+
+    if stored is not None and fresh is not None:
+        df = pd.concat([stored.astype(fresh.dtypes.to_dict()), fresh], ignore_index=True)
+        df = df.drop_duplicates(subset='Date', keep='last').sort_values('Date').reset_index(drop=True)
+    elif fresh is not None:
+        df = fresh
+    elif stored is not None and meta.get('version') != FEATURE_STORE_VERSION:
+        # File của phiên bản cũ: tính lại feature từ OHLCV đã lưu dù không có nến mới
+        df = stored
+    else:
+        if stored is not None and signals is not None:
+            update_signal_history(signals, symbol, store.read(symbol), exchange)
+        return 0 if stored is None else len(stored)
+
+    if len(df) < 2:
+        return 0
+
+    features = compute_feature_frame(df, symbol, exchange)
+    store.write(symbol, features, exchange, history_start)
+    if signals is not None:
+        update_signal_history(signals, symbol, features, exchange)
+    return len(features)
+
+
+def main():
+    """Chạy job cập nhật feature store"""
+    load_dotenv()
+    parser = argparse.ArgumentParser(description='Build precomputed indicator feature store')
+    parser.add_argument('--store-dir', default=FEATURE_STORE_DIR,
+                      help='Thư mục feature store (mặc định: FEATURE_STORE_DIR)')
+    parser.add_argument('--symbols', nargs='*',
+                      help='Chỉ cập nhật các mã này (mặc định: tất cả mã niêm yết)')
+    parser.add_argument('--years', type=int, default=3,
+                      help='Số năm lịch sử khi tạo mới một mã (default: 3)')
+    parser.add_argument('--workers', type=int, default=8,
+                      help='Số luồng tải dữ liệu song song (default: 8)')
+    parser.add_argument('--full', action='store_true',
+                      help='Tính lại toàn bộ lịch sử thay vì cập nhật tăng dần')
+    parser.add_argument('--signal-store', default=SIGNAL_STORE_PATH,
+                      help='File SQLite lịch sử tín hiệu (mặc định: SIGNAL_STORE_PATH; bỏ trống = không ghi)')
+
+    args = parser.parse_args()
+
+    if not args.store_dir:
+        logger.error("FEATURE_STORE_DIR is not set. Use --store-dir or set it in your .env file.")
+        return 1
+
+    store = FeatureStore(args.store_dir)
+    signals = SignalStore(args.signal_store) if args.signal_store else None
+    today = datetime.date.today()
+    end_date = today.strftime('%Y-%m-%d')
+    history_start = (today - datetime.timedelta(days=365 * args.years)).strftime('%Y-%m-%d')
+
+    if args.symbols:
+        universe = [{"symbol": s.upper(), "exchange": "Unknown"} for s in args.symbols]
+    else:
+        universe = fetch_stock_symbols()
+    logger.info(f"Updating {len(universe)} symbols into {args.store_dir}...")
+
+    failed = []
+    # Phần lớn thời gian là chờ API nên dùng thread pool
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        futures = {
+            executor.submit(update_symbol, store, item["symbol"], item["exchange"], history_start, end_date, args.full, signals): item["symbol"]
+            for item in universe
+        }
+        for future in as_completed(futures):
+            symbol = futures[future]
+            try:
+                bars = future.result()
+                logger.info(f"{symbol}: {bars} bars")
+            except Exception as e:
+                failed.append(symbol)
+                logger.error(f"{symbol}: {e}")
+
+    logger.info(f"Done. {len(universe) - len(failed)} updated, {len(failed)} failed.")
+    return 1 if failed and len(failed) == len(universe) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
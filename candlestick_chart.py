@@ -1,19 +1,22 @@
 import traceback
 from fastapi import FastAPI, Query, HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
 from typing import Optional
 import pandas as pd
 from dotenv import load_dotenv
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import base64
+import json
 import os
 import datetime
 from pydantic import BaseModel
 from telegram import Bot
 import asyncio
 
-from models import CandleData, ChartConfig, ChartRequest, PredictRequest
-from utils import fetch_stock_data, update_attachment
+from models import CandleData, ChartConfig, ChartRequest, PredictRequest, PredictLatestRequest, PredictBatchRequest, ScreenRequest, SignalHistoryRequest, AnalyzeRequest, WatchlistRequest
+from utils import update_attachment, build_price_frame, DISPLAY_DATE_FORMAT
 from indicators.moving_averages import calculate_moving_averages
 from indicators.bollinger_bands import calculate_bollinger_bands
 from indicators.ichimoku import calculate_ichimoku
@@ -21,8 +24,11 @@ from indicators.rsi import calculate_rsi
 from indicators.macd import calculate_macd
 from indicators.support import calculate_support
 from indicators.resistance import calculate_resistance
+from indicators.pivots import get_support_resistance_levels
 from indicators.trend_analysis import calculate_trend, get_trend_summary
 from indicators.candle_patterns import analyze_candle_patterns, classify_candle_pattern
+from indicators.features import trends_from_frame
+from indicators.resample import resample_ohlcv, normalize_timeframe, timeframe_cache_key, TIMEFRAME_LABELS
 from plotting.candlestick import add_candlestick_trace
 from plotting.bollinger_bands import add_bollinger_bands_traces
 from plotting.ichimoku import add_ichimoku_traces
@@ -33,46 +39,71 @@ from plotting.volume import add_volume_trace
 from plotting.support import add_support_trace
 from plotting.resistance import add_resistance_trace
 from plotting.pattern_highlights import add_pattern_highlights, get_highlighted_pattern_summary
-from prediction.future_prediction import predict_future_trend
+from plotting.signal_markers import add_signal_markers
+from prediction.executor import shutdown_executors
+from prediction.registry import analyzer_versions
+from prediction.service import predict_symbol, analyze_symbol, iter_predict_batch, load_precomputed_window, fetch_candles, resolve_predict_window, PredictError
+from prediction.incremental import predict_latest
+from prediction.watchlist import analyze_watchlist
+from prediction.screener import screen_market, filter_screen, validate_screen_criteria
+from storage.feature_store import feature_store
+from storage.signal_store import signal_store
 
 load_dotenv()
 
 app = FastAPI(title="Stock Analysis API", description="API for stock candlestick charts with technical indicators")
 
-def build_chart(data: CandleData, config: ChartConfig, exchange: str = "Unknown"):
-    """Build complete chart with all indicators"""
-    # Prepare DataFrame
-    df = pd.DataFrame({
-        'Date': pd.to_datetime(data.dates, utc=True, errors='coerce'),
-        'Open': data.open,
-        'High': data.high,
-        'Low': data.low,
-        'Close': data.close,
-        'Volume': data.volume,
-    })
-    df = df.dropna(subset=['Date'])
-    df = df.sort_values('Date')
-    df['Date'] = df['Date'].dt.strftime('%d/%m/%Y')
-    
-    # Calculate indicators
-    if config.show_ma:
+@app.on_event("shutdown")
+def close_analyzer_executors():
+    """Đóng pool chạy analyzer khi tắt server"""
+    shutdown_executors()
+
+def build_chart(data: Optional[CandleData], config: ChartConfig, exchange: str = "Unknown", df: Optional[pd.DataFrame] = None,
+                trends: Optional[list] = None, signals: Optional[dict] = None):
+    """
+    Build complete chart with all indicators
+
+    df: frame đã tính sẵn từ feature store nếu có. trends: trends đã tính trên df - khi đó df đã
+    ở khung config.timeframe (frame dùng chung của /analyze). signals: tín hiệu analyzer để vẽ marker BUY/SELL.
+    """
+    if df is None:
+        # Prepare DataFrame (Date giữ kiểu datetime64 cho đến khi vẽ)
+        df = build_price_frame(
+            dates=data.dates,
+            open=data.open,
+            high=data.high,
+            low=data.low,
+            close=data.close,
+            volume=data.volume
+        )
+    
+    # Gộp nến theo khung thời gian (nến gộp của symbol được cache)
+    timeframe = normalize_timeframe(config.timeframe)
+    if trends is None:
+        df = resample_ohlcv(df, timeframe, config.symbol)
+    # Frame từ feature store đã có sẵn chỉ báo và nhãn mẫu nến
+    precomputed = 'candle_pattern' in df.columns
+    
+    # Calculate indicators (bỏ qua các chỉ báo đã có sẵn)
+    if config.show_ma and 'MA10' not in df.columns:
         df = calculate_moving_averages(df)
     
-    if config.show_bb:
+    if config.show_bb and 'BB_Upper' not in df.columns:
         df = calculate_bollinger_bands(df)
     
-    if config.show_ich:
+    if config.show_ich and 'ICH_Tenkan' not in df.columns:
         df = calculate_ichimoku(df)
     
-    if config.show_rsi:
+    if config.show_rsi and 'RSI' not in df.columns:
         df = calculate_rsi(df)
     
-    if config.show_macd:
+    if config.show_macd and 'MACD' not in df.columns:
         df = calculate_macd(df)
     
     if config.show_sr:
-        df = calculate_support(df)
-        df = calculate_resistance(df)
+        # Pivot của symbol được cache, lần gọi thứ hai tái sử dụng kết quả
+        df = calculate_support(df, timeframe_cache_key(config.symbol, timeframe))
+        df = calculate_resistance(df, timeframe_cache_key(config.symbol, timeframe))
 
     # Phân tích candle patterns nếu cần (để có data cho highlighting)
     df_with_patterns = None
@@ -88,10 +119,20 @@ def build_chart(data: CandleData, config: ChartConfig, exchange: str = "Unknown"
         config.highlight_dragonfly_doji,
         config.highlight_gravestone_doji
     ]):
-        # Cần trends để phân loại candle patterns chính xác
-        trends = calculate_trend(df, config.symbol, config.start_date, config.end_date, exchange)
-        df_with_patterns = classify_candle_pattern(df, trends)
-        df = df_with_patterns  # Update main df
+        if precomputed:
+            # Nhãn đã được tính sẵn trong feature store (hoặc bởi analyzer Candle)
+            df_with_patterns = df
+        elif trends is not None:
+            df_with_patterns = classify_candle_pattern(df, exchange, trends)
+            df = df_with_patterns
+        else:
+            # Cần trends để phân loại candle patterns chính xác
+            trends = calculate_trend(df, config.symbol, config.start_date, config.end_date, exchange)
+            df_with_patterns = classify_candle_pattern(df, exchange, trends)
+            df = df_with_patterns  # Update main df
+    
+    # Chỉ format Date sang chuỗi hiển thị ở tầng vẽ biểu đồ
+    plot_df = df.assign(Date=df['Date'].dt.strftime(DISPLAY_DATE_FORMAT))
     
     # Create subplots - determine number of rows based on indicators
     total_rows = 2  # Price + Volume
@@ -123,42 +164,47 @@ def build_chart(data: CandleData, config: ChartConfig, exchange: str = "Unknown"
         )
     
     # Add candlestick
-    fig = add_candlestick_trace(fig, df, row=1, col=1)
+    fig = add_candlestick_trace(fig, plot_df, row=1, col=1)
     
     # Add indicators to price chart
     if config.show_bb:
-        fig = add_bollinger_bands_traces(fig, df, row=1, col=1)
+        fig = add_bollinger_bands_traces(fig, plot_df, row=1, col=1)
     
     if config.show_ich:
-        fig = add_ichimoku_traces(fig, df, row=1, col=1)
+        fig = add_ichimoku_traces(fig, plot_df, row=1, col=1)
     
     if config.show_ma:
-        fig = add_moving_averages_traces(fig, df, row=1, col=1)
+        fig = add_moving_averages_traces(fig, plot_df, row=1, col=1)
+    
+    # Marker BUY/SELL đã tính khi predict
+    signal_marker_count = 0
+    if signals:
+        fig, signal_marker_count = add_signal_markers(fig, plot_df, signals, row=1, col=1)
     
     # Thêm Support & Resistance
     if config.show_sr:
-        fig = add_support_trace(fig, df, row=1, col=1)
-        fig = add_resistance_trace(fig, df, row=1, col=1)
+        fig = add_support_trace(fig, plot_df, row=1, col=1)
+        fig = add_resistance_trace(fig, plot_df, row=1, col=1)
     
     # Add volume
-    fig = add_volume_trace(fig, df, row=2, col=1)
+    fig = add_volume_trace(fig, plot_df, row=2, col=1)
     
     # Add RSI and MACD to appropriate rows
     current_row = 3
     if config.show_rsi:
-        fig = add_rsi_traces(fig, df, row=current_row, col=1)
+        fig = add_rsi_traces(fig, plot_df, row=current_row, col=1)
         current_row += 1
     
     if config.show_macd:
-        fig = add_macd_traces(fig, df, row=current_row, col=1)
+        fig = add_macd_traces(fig, plot_df, row=current_row, col=1)
     
     # Thêm pattern highlights (sau khi vẽ xong tất cả indicators)
     if df_with_patterns is not None:
-        fig = add_pattern_highlights(fig, df_with_patterns, config, total_rows)
+        fig = add_pattern_highlights(fig, plot_df, config, total_rows)
     
     # Update layout
-    start_display = pd.to_datetime(config.start_date).strftime('%d/%m/%Y')
-    end_display = pd.to_datetime(config.end_date).strftime('%d/%m/%Y')
+    start_display = pd.to_datetime(config.start_date).strftime(DISPLAY_DATE_FORMAT)
+    end_display = pd.to_datetime(config.end_date).strftime(DISPLAY_DATE_FORMAT)
     
     # Calculate height based on number of indicators
     chart_height = 700
@@ -168,8 +214,11 @@ def build_chart(data: CandleData, config: ChartConfig, exchange: str = "Unknown"
         chart_height += 100
     
     # Set fixed dark background theme với grid rõ ràng cho đo đạc
+    title = f'Candlestick Chart for Stock {config.symbol} ({start_display} - {end_display})'
+    if timeframe != "D":
+        title += f' - {TIMEFRAME_LABELS[timeframe]}'
     fig.update_layout(
-        title=f'Candlestick Chart for Stock {config.symbol} ({start_display} - {end_display})',
+        title=title,
         template='plotly_dark',
         xaxis_rangeslider_visible=False,
         height=chart_height,
@@ -299,25 +348,47 @@ def build_chart(data: CandleData, config: ChartConfig, exchange: str = "Unknown"
         "startDate": config.start_date,
         "endDate": config.end_date
     }
+    if signals:
+        response["signal_markers"] = signal_marker_count
     
     # Add candle pattern analysis if enabled
     if config.show_cp:  # Đơn giản hóa check
-        # Sử dụng df_with_patterns nếu có, nếu không thì phân tích lại
-        if df_with_patterns is not None:
-            candle_analysis = analyze_candle_patterns(df_with_patterns)
-        else:
-            candle_analysis = analyze_candle_patterns(df)
+        # df_with_patterns đã có nhãn nên chỉ cần tính gaps và thống kê trong một lượt
+        candle_analysis = analyze_candle_patterns(df_with_patterns, trends, exchange)
         response["candle_patterns"] = candle_analysis
     
     # Add highlighted patterns summary if any
     if df_with_patterns is not None:
-        highlighted_patterns = get_highlighted_pattern_summary(df_with_patterns, config)
+        highlighted_patterns = get_highlighted_pattern_summary(plot_df, config)
         if highlighted_patterns:
             response["highlighted_patterns"] = highlighted_patterns
     
+    # Add support/resistance levels if enabled
+    if config.show_sr:
+        levels = get_support_resistance_levels(df, timeframe_cache_key(config.symbol, timeframe))
+        response["support_resistance"] = {
+            level_type: [
+                {
+                    "price": round(level["price"], 2),
+                    "lower": round(level["lower"], 2),
+                    "upper": round(level["upper"], 2),
+                    "touches": int(level["touches"]),
+                    "last_touch": level["last_touch"].strftime(DISPLAY_DATE_FORMAT)
+                }
+                for level in level_list
+            ]
+            for level_type, level_list in levels.items()
+        }
+    
     # Add trend analysis if enabled
     if config.show_tr:
-        weekly_trends = calculate_trend(df, config.symbol, config.start_date, config.end_date, exchange)
+        if trends is not None:
+            # Đã tính khi phân loại candle patterns hoặc khi predict
+            weekly_trends = trends
+        elif precomputed:
+            weekly_trends = trends_from_frame(df, config.symbol, exchange)
+        else:
+            weekly_trends = calculate_trend(df, config.symbol, config.start_date, config.end_date, exchange)
         trend_summary = get_trend_summary(weekly_trends)
         response["trend_analysis"] = {
             "weekly_trends": weekly_trends,  
@@ -326,6 +397,34 @@ def build_chart(data: CandleData, config: ChartConfig, exchange: str = "Unknown"
     
     return response
 
+def chart_config(request: ChartRequest, symbol: str, start_date: str, end_date: str, timeframe: str) -> ChartConfig:
+    """ChartConfig từ các cờ của ChartRequest và khoảng ngày thực tế của dữ liệu"""
+    return ChartConfig(
+        show_ma=request.MA,
+        show_bb=request.BB,
+        show_ich=request.ICH,
+        show_rsi=request.RSI,
+        show_macd=request.MACD,
+        show_sr=request.SR, 
+        show_tr=request.TR,  
+        show_cp=request.CP,  
+        # Pattern highlights
+        highlight_marubozu=request.highlight_marubozu,
+        highlight_spinning_top=request.highlight_spinning_top,
+        highlight_hammer=request.highlight_hammer,
+        highlight_hanging_man=request.highlight_hanging_man,
+        highlight_inverted_hammer=request.highlight_inverted_hammer,
+        highlight_shooting_star=request.highlight_shooting_star,
+        highlight_star_doji=request.highlight_star_doji,
+        highlight_long_legged_doji=request.highlight_long_legged_doji,
+        highlight_dragonfly_doji=request.highlight_dragonfly_doji,
+        highlight_gravestone_doji=request.highlight_gravestone_doji,
+        symbol=symbol,
+        start_date=start_date,
+        end_date=end_date,
+        timeframe=timeframe
+    )
+
 @app.get("/")
 def root():
     return {"message": "Stock Analysis API is running"}
@@ -335,56 +434,46 @@ def plot_candlestick(request: ChartRequest):
     try:
         # Ensure symbol is a string for all usages
         symbol = request.symbol.upper()
+        timeframe = normalize_timeframe(request.timeframe)
 
-        # Fetch data
-        data = fetch_stock_data(symbol, request.startDate, request.endDate)
+        # Dùng feature store khi có đủ dữ liệu cho khoảng thời gian yêu cầu
+        precomputed = None
+        if request.startDate and request.endDate:
+            precomputed = load_precomputed_window(symbol, request.startDate, request.endDate, timeframe)
 
-        if not data or len(data) < 2:
-            raise HTTPException(status_code=404, detail="Không tìm thấy dữ liệu hoặc dữ liệu không đủ để vẽ biểu đồ.")
+        candle_data = None
+        precomputed_df = None
+        if precomputed is not None and len(precomputed[0]) >= 2:
+            precomputed_df, exchange = precomputed
+            actual_start_date = precomputed_df['Date'].iloc[0].strftime('%Y-%m-%d')
+            actual_end_date = precomputed_df['Date'].iloc[-1].strftime('%Y-%m-%d')
+        else:
+            # Fetch data
+            data = fetch_candles(symbol, request.startDate, request.endDate, timeframe)
 
-        # Extract actual date range
-        dates = [pd.to_datetime(item["time"]) for item in data]
-        actual_start_date = min(dates).strftime('%Y-%m-%d')
-        actual_end_date = max(dates).strftime('%Y-%m-%d')
-        exchange = data[0].get("stock_code", {}).get("exchange", "Unknown")
+            if not data or len(data) < 2:
+                raise HTTPException(status_code=404, detail="Không tìm thấy dữ liệu hoặc dữ liệu không đủ để vẽ biểu đồ.")
 
-        # Convert to CandleData
-        candle_data = CandleData(
-            dates=[item["time"] for item in data],
-            open=[item["open"] for item in data],
-            high=[item["high"] for item in data],
-            low=[item["low"] for item in data],
-            close=[item["close"] for item in data],
-            volume=[item["volume"] for item in data]
-        )
+            # Extract actual date range (parse một lần cho cả danh sách)
+            dates = pd.to_datetime([item["time"] for item in data])
+            actual_start_date = dates.min().strftime('%Y-%m-%d')
+            actual_end_date = dates.max().strftime('%Y-%m-%d')
+            exchange = data[0].get("stock_code", {}).get("exchange", "Unknown")
 
-        config = ChartConfig(
-            show_ma=request.MA,
-            show_bb=request.BB,
-            show_ich=request.ICH,
-            show_rsi=request.RSI,
-            show_macd=request.MACD,
-            show_sr=request.SR, 
-            show_tr=request.TR,  
-            show_cp=request.CP,  
-            # Pattern highlights
-            highlight_marubozu=request.highlight_marubozu,
-            highlight_spinning_top=request.highlight_spinning_top,
-            highlight_hammer=request.highlight_hammer,
-            highlight_hanging_man=request.highlight_hanging_man,
-            highlight_inverted_hammer=request.highlight_inverted_hammer,
-            highlight_shooting_star=request.highlight_shooting_star,
-            highlight_star_doji=request.highlight_star_doji,
-            highlight_long_legged_doji=request.highlight_long_legged_doji,
-            highlight_dragonfly_doji=request.highlight_dragonfly_doji,
-            highlight_gravestone_doji=request.highlight_gravestone_doji,
-            symbol=symbol,
-            start_date=actual_start_date,
-            end_date=actual_end_date
-        )
+            # Convert to CandleData
+            candle_data = CandleData(
+                dates=[item["time"] for item in data],
+                open=[item["open"] for item in data],
+                high=[item["high"] for item in data],
+                low=[item["low"] for item in data],
+                close=[item["close"] for item in data],
+                volume=[item["volume"] for item in data]
+            )
+
+        config = chart_config(request, symbol, actual_start_date, actual_end_date, timeframe)
         
         # Build and return chart
-        return build_chart(candle_data, config, exchange)
+        return build_chart(candle_data, config, exchange, df=precomputed_df)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Lỗi khi xử lý dữ liệu: {str(e)}")
@@ -404,97 +493,247 @@ def predict_stock(request: PredictRequest):
         Dict chứa final_statement (BUY/SELL/HOLD) và analysis chi tiết từ 5 phương pháp
     """
     try:
-        if not request.range or request.range.lower() not in ["short", "long"]:
+        return predict_symbol(
+            request.symbol, request.range, request.endDate, request.timeframe,
+            request.timing, request.analyzers, detail=request.detail
+        )
+        
+    except PredictError as pe:
+        # Lỗi tham số / dữ liệu đã có mã HTTP và thông báo phù hợp
+        raise HTTPException(status_code=pe.status_code, detail=pe.detail)
+    except Exception as e:
+        # Handle general exceptions with a clear error message
+        error_detail = f"Lỗi khi xử lý dữ liệu hoặc dự đoán: {str(e)}"
+        # Add trace for debugging if needed
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=error_detail)
+
+@app.post("/predict/latest")
+def predict_stock_latest(request: PredictLatestRequest):
+    """
+    Chế độ chỉ nến mới cho cảnh báo: tín hiệu xuất hiện từ lần gọi trước và final_statement đã cập nhật
+    
+    Trạng thái lần đánh giá trước được giữ theo (mã, range, khung nến, analyzer); chỉ các nến mới
+    được phân tích. Lần gọi đầu tiên chỉ phân tích nến cuối.
+    
+    Args:
+        request: PredictLatestRequest như /predict, thêm since (ngày nến cuối đã xử lý, tùy chọn)
+    
+    Returns:
+        Dict chứa new_signals theo analyzer, statements, final_statement, previous_final_statement và changed
+    """
+    try:
+        return predict_latest(
+            request.symbol, request.range, request.endDate, request.timeframe,
+            request.analyzers, request.since
+        )
+        
+    except PredictError as pe:
+        raise HTTPException(status_code=pe.status_code, detail=pe.detail)
+    except Exception as e:
+        error_detail = f"Lỗi khi xử lý dữ liệu hoặc dự đoán: {str(e)}"
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=error_detail)
+
+@app.post("/predict/batch")
+def predict_stock_batch(request: PredictBatchRequest):
+    """
+    Dự đoán cho nhiều mã trong một request, trả về dạng NDJSON (mỗi dòng một mã)
+    
+    Các mã có trong feature store được tính ngay; các mã còn lại được lấy dữ liệu theo lô
+    (một truy vấn cho nhiều mã) rồi tính song song trên pool PREDICT_BATCH_EXECUTOR.
+    Mỗi dòng được gửi ngay khi mã đó xong nên thứ tự dòng là thứ tự hoàn thành.
+    
+    Args:
+        request: PredictBatchRequest với danh sách items (các trường như /predict)
+    
+    Returns:
+        StreamingResponse application/x-ndjson; mỗi dòng gồm index (vị trí trong items),
+        symbol, status (mã HTTP như /predict) và result (response của /predict) hoặc detail
+    """
+    items = [item.model_dump() for item in request.items]
+    
+    def stream_lines():
+        for line in iter_predict_batch(items):
+            yield json.dumps(jsonable_encoder(line), ensure_ascii=False) + "\n"
+    
+    return StreamingResponse(stream_lines(), media_type="application/x-ndjson")
+
+@app.post("/analyze")
+def analyze_stock(request: AnalyzeRequest):
+    """
+    Dự đoán và biểu đồ của một mã trong một request (thay cho gọi /predict rồi /plot)
+    
+    Dữ liệu được lấy một lần cho cửa sổ của range/endDate/timeframe; chỉ báo, trends và nhãn
+    mẫu nến tính cho dự đoán được biểu đồ dùng lại, tín hiệu BUY/SELL đã tính được vẽ thành marker.
+    
+    Args:
+        request: AnalyzeRequest gồm các cờ của /plot và range, analyzers, detail, markers của /predict
+    
+    Returns:
+        Dict chứa prediction (response của /predict) và chart (response của /plot)
+    """
+    try:
+        prediction, frame, trends, signals = analyze_symbol(
+            request.symbol, request.range, request.endDate, request.timeframe,
+            request.analyzers, detail=request.detail
+        )
+        config = chart_config(
+            request, prediction["symbol"], prediction["startDate"], prediction["endDate"], prediction["timeframe"]
+        )
+        chart = build_chart(
+            None, config, prediction["exchange"], df=frame, trends=trends,
+            signals=signals if request.markers else None
+        )
+        return {"prediction": prediction, "chart": chart}
+        
+    except PredictError as pe:
+        raise HTTPException(status_code=pe.status_code, detail=pe.detail)
+    except Exception as e:
+        error_detail = f"Lỗi khi xử lý dữ liệu hoặc dự đoán: {str(e)}"
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=error_detail)
+
+@app.post("/screen")
+def screen_stocks(request: ScreenRequest):
+    """
+    Lọc toàn thị trường theo kết quả của các analyzer ở phiên gần nhất
+    
+    Tất cả các mã trong feature store (HSX/HNX/UPCOM) được tính trong một lần dạng panel
+    với cùng cửa sổ dữ liệu như /predict; statement và final_statement của mỗi mã giống
+    /predict, kèm các sự kiện xảy ra ở phiên cuối (events) để lọc.
+    
+    Args:
+        request: ScreenRequest với range và các điều kiện lọc (final_statement, statements, events)
+    
+    Returns:
+        Dict chứa phiên, số mã đã quét / bị bỏ qua và danh sách mã thỏa điều kiện
+    """
+    try:
+        # Cùng kiểm tra tham số và cửa sổ dữ liệu (khung ngày) như /predict
+        _, _, start_date_str, end_date_str = resolve_predict_window(request.range, request.endDate, "D", request.analyzers)
+        if feature_store is None:
             raise HTTPException(
-                status_code=400, 
-                detail=f"Tham số 'range' phải là 'short' hoặc 'long', giá trị nhận được: '{request.range}'"
+                status_code=503,
+                detail="Screener cần feature store (FEATURE_STORE_DIR) đã được build bằng build_feature_store.py"
             )
+        try:
+            validate_screen_criteria(request.statements, request.events, request.final_statement,
+                                     request.exchanges, request.analyzers)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         
-        # Use our trading days utilities from utils module
-        from utils import get_start_date_for_trading_days
-        # Set endDate to today
-        if request.endDate:
-            end_date = pd.to_datetime(request.endDate, format='%Y-%m-%d')
-        else:
-            end_date = datetime.datetime.now()
-        range_value = request.range.lower()
-        
-        # Calculate start date to ensure we have enough trading days
-        required_trading_days = 60 if range_value == "short" else 180 
-        start_date = get_start_date_for_trading_days(end_date, required_trading_days)
+        results, skipped = screen_market(feature_store, start_date_str, end_date_str, request.exchanges, request.analyzers)
+        matched = filter_screen(results, request.final_statement, request.statements, request.events)
+        if request.limit is not None:
+            matched = matched.head(max(request.limit, 0))
         
-        # Format dates for API
-        start_date_str = start_date.strftime('%Y-%m-%d')
-        end_date_str = end_date.strftime('%Y-%m-%d')
+        return {
+            "startDate": start_date_str,
+            "endDate": end_date_str,
+            "range": request.range,
+            "screened": len(results),
+            "skipped": skipped,
+            "count": len(matched),
+            "results": matched.to_dict(orient="records")
+        }
         
-        # Fetch data - truyền đúng thứ tự start_date, end_date
-        data = fetch_stock_data(request.symbol.upper(), start_date_str, end_date_str)
+    except HTTPException as he:
+        raise he
+    except PredictError as pe:
+        raise HTTPException(status_code=pe.status_code, detail=pe.detail)
+    except Exception as e:
+        error_detail = f"Lỗi khi chạy screener: {str(e)}"
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=error_detail)
+
+@app.post("/watchlist")
+def watchlist(request: WatchlistRequest):
+    """
+    Statement của các mã trong watchlist cùng tỷ lệ BUY/SELL và các mã có tín hiệu mới
+    
+    Các mã được đọc một lần (feature store hoặc một truy vấn API cho nhiều mã) và tính
+    chung dạng panel như /screen; statement và final_statement của mỗi mã giống /predict.
+    
+    Args:
+        request: WatchlistRequest với danh sách symbols, range, endDate và analyzers
+    
+    Returns:
+        Dict chứa results theo mã, summary (số mã và tỷ lệ BUY/SELL/HOLD), new_signals và errors
+    """
+    try:
+        return analyze_watchlist(request.symbols, request.range, request.endDate, request.analyzers)
         
-        if not data:
+    except PredictError as pe:
+        raise HTTPException(status_code=pe.status_code, detail=pe.detail)
+    except Exception as e:
+        error_detail = f"Lỗi khi phân tích watchlist: {str(e)}"
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=error_detail)
+
+@app.post("/signals/history")
+def signal_history(request: SignalHistoryRequest):
+    """
+    Lịch sử tín hiệu BUY/SELL của một mã trong khoảng ngày (truy vấn lịch sử tín hiệu đã lưu)
+    
+    Lịch sử được ghi bởi build_feature_store.py trên toàn bộ lịch sử trong feature store nên
+    mỗi nến chỉ được đánh giá một lần; tín hiệu nến được ghi theo từng nến.
+    
+    Args:
+        request: SignalHistoryRequest với symbol, khoảng ngày, analyzer và action cần lấy
+    
+    Returns:
+        Dict chứa evaluatedUntil (nến cuối đã đánh giá theo analyzer) và danh sách tín hiệu theo ngày
+    """
+    try:
+        if signal_store is None:
             raise HTTPException(
-                status_code=404, 
-                detail=f"Không tìm thấy dữ liệu cho mã chứng khoán '{request.symbol.upper()}' trong khoảng thời gian từ {start_date_str} đến {end_date_str}"
+                status_code=503,
+                detail="Lịch sử tín hiệu cần SIGNAL_STORE_PATH đã được ghi bằng build_feature_store.py"
             )
-        elif len(data) < 2:
+        try:
+            versions = analyzer_versions(request.analyzers)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        for name, value in (("startDate", request.startDate), ("endDate", request.endDate)):
+            if value:
+                try:
+                    pd.to_datetime(value, format='%Y-%m-%d')
+                except ValueError:
+                    raise HTTPException(
+                        status_code=400,
+                        detail=f"Tham số '{name}' phải có dạng YYYY-MM-DD, giá trị nhận được: '{value}'"
+                    )
+        if request.action and request.action.upper() not in ["BUY", "SELL"]:
             raise HTTPException(
-                status_code=422, 
-                detail=f"Dữ liệu cho mã '{request.symbol.upper()}' không đủ để phân tích. Cần ít nhất 2 điểm dữ liệu, nhận được {len(data)}."
+                status_code=400,
+                detail=f"Tham số 'action' phải là 'BUY' hoặc 'SELL', giá trị nhận được: '{request.action}'"
             )
         
-        # Extract actual date range và exchange
-        dates = [pd.to_datetime(item["time"]) for item in data]
-        data_start_date = min(dates).strftime('%Y-%m-%d')
-        data_end_date = max(dates).strftime('%Y-%m-%d')
-        exchange = data[0].get("stock_code", {}).get("exchange", "Unknown")
-        
-        # Prepare DataFrame
-        df = pd.DataFrame({
-            'Date': pd.to_datetime([item["time"] for item in data], utc=True, errors='coerce'),
-            'Open': [item["open"] for item in data],
-            'High': [item["high"] for item in data],
-            'Low': [item["low"] for item in data],
-            'Close': [item["close"] for item in data],
-            'Volume': [item["volume"] for item in data]
-        })
-        df = df.dropna(subset=['Date'])
-        df = df.sort_values('Date')
-        df['Date'] = df['Date'].dt.strftime('%d/%m/%Y')
-        
-        # Calculate all indicators needed for analysis
-        df = calculate_moving_averages(df)
-        df = calculate_bollinger_bands(df)
-        df = calculate_rsi(df)
-        df = calculate_macd(df)
-        df = calculate_support(df)
-        df = calculate_resistance(df)
-        
-        # Phân tích trends trước để dùng cho candle patterns
-        trends = calculate_trend(df, request.symbol.upper(), data_start_date, data_end_date, exchange)
+        symbol = request.symbol.upper()
+        signals = signal_store.query(
+            symbol, versions, request.startDate, request.endDate, request.action, request.limit
+        )
+        evaluated = signal_store.evaluated_until(symbol, versions)
         
-        # Dự đoán tương lai với 5 phương pháp (mỗi method tự gọi indicator của mình)
-        future_prediction = predict_future_trend(df, trends, exchange)
+        def display_date(value):
+            return pd.Timestamp(value).strftime(DISPLAY_DATE_FORMAT) if value else None
         
-        # Thêm metadata cần thiết vào response
-        # Ensure symbol is a string for .upper()
-        response = {
-            "symbol": request.symbol.upper(),
-            "startDate": data_start_date,
-            "endDate": data_end_date, 
-            "range": request.range,
-            "exchange": exchange,
-            "final_statement": future_prediction["final_statement"],
-            "analysis": future_prediction["analysis"]
+        for signal in signals:
+            signal["date"] = display_date(signal["date"])
+        return {
+            "symbol": symbol,
+            "startDate": request.startDate,
+            "endDate": request.endDate,
+            "evaluatedUntil": {name: display_date(value) for name, value in evaluated.items()},
+            "count": len(signals),
+            "signals": signals
         }
         
-        return response
-        
     except HTTPException as he:
-        # Re-raise HTTP exceptions as they already have proper status codes and messages
         raise he
     except Exception as e:
-        # Handle general exceptions with a clear error message
-        error_detail = f"Lỗi khi xử lý dữ liệu hoặc dự đoán: {str(e)}"
-        # Add trace for debugging if needed
+        error_detail = f"Lỗi khi đọc lịch sử tín hiệu: {str(e)}"
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=error_detail)
 
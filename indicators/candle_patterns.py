@@ -6,7 +6,9 @@ import os
 
 # Thêm parent directory vào path để import
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from indicators.trend_analysis import calculate_trend
+from utils import DISPLAY_DATE_FORMAT
+from indicators.trend_analysis import calculate_trend, parse_trend_periods, trend_period_tails
+from storage.compact import is_compact_frame, categorize_labels
 
 def _map_trends_to_dataframe(df: pd.DataFrame, trends: List[Dict]) -> pd.DataFrame:
     """
@@ -17,44 +19,122 @@ def _map_trends_to_dataframe(df: pd.DataFrame, trends: List[Dict]) -> pd.DataFra
         trends: Danh sách xu hướng từ trend_analysis
         
     Returns:
-        DataFrame với cột 'trend_context' mới
+        DataFrame với cột 'trend_context' và 'trend_period' mới
     """
     df_result = df.copy()
     
-    # Chuyển đổi Date về datetime nếu cần
-    if df_result['Date'].dtype == 'object':
-        df_result['Date'] = pd.to_datetime(df_result['Date'], format='%d/%m/%Y')
-    
     # Tạo cột xu hướng mặc định
     df_result['trend_context'] = 'sideways'
+    df_result['trend_period'] = None
     
-    # Map xu hướng từ trend_analysis vào từng ngày
-    for trend in trends:
-        trend_start = pd.to_datetime(trend['period'].split(' to ')[0], format='%d/%m/%Y')
-        trend_end = pd.to_datetime(trend['period'].split(' to ')[1], format='%d/%m/%Y')
-        
+    # Map xu hướng từ trend_analysis vào từng ngày (Date đã là datetime64)
+    for trend, (trend_start, trend_end) in zip(trends, parse_trend_periods(trends)):
         # Gán xu hướng cho tất cả ngày trong khoảng thời gian này
         # Chuyển về lowercase để đồng nhất
         trend_value = trend['trend'].lower()
         mask = (df_result['Date'] >= trend_start) & (df_result['Date'] <= trend_end)
         df_result.loc[mask, 'trend_context'] = trend_value
+        df_result.loc[mask, 'trend_period'] = trend['period']
     
     return df_result
 
+# Ngưỡng phân loại
+SMALL_BODY_THRESHOLD = 0.1      # Thân nến nhỏ
+SMALL_SHADOW_THRESHOLD = 0.05   # Râu ngắn
+LARGE_SHADOW_THRESHOLD = 0.3    # Râu dài
+DOJI_THRESHOLD = 0.03           # Ngưỡng cho Doji
+
+# Ngưỡng Marubozu (% thân nến) theo sàn giao dịch; mặc định HSX nếu không xác định được sàn
+MARUBOZU_THRESHOLDS = {
+    "HSX": 3,
+    "HNX": 5,
+    "UPCOM": 7,
+}
+
+def candle_shapes(body_ratio: np.ndarray, upper_ratio: np.ndarray, lower_ratio: np.ndarray,
+                  body_percentage: np.ndarray, exchange: str) -> np.ndarray:
+    """
+    Hình dạng nến (không phụ thuộc xu hướng) theo thứ tự ưu tiên
+    
+    Returns:
+        Mảng mã hình dạng: 0 = Standard, 1 = Star Doji, 2 = Long Legged Doji, 3 = Dragonfly,
+        4 = Gravestone, 5 = Marubozu, 6 = Hammer/Hanging Man, 7 = Inverted Hammer/Shooting Star
+    """
+    marubozu_threshold = MARUBOZU_THRESHOLDS.get(exchange, MARUBOZU_THRESHOLDS["HSX"])
+    
+    # Xác định hình dạng nến theo đúng thứ tự ưu tiên (np.select lấy điều kiện đúng đầu tiên)
+    is_doji = body_ratio <= DOJI_THRESHOLD
+    return np.select(
+        [
+            # 1. Nến Doji và các biến thể (ưu tiên cao nhất)
+            is_doji & (upper_ratio <= SMALL_SHADOW_THRESHOLD) & (lower_ratio <= SMALL_SHADOW_THRESHOLD)
+                & (np.abs(lower_ratio - upper_ratio) <= 0.02),                                  # Star Doji
+            is_doji & (np.abs(upper_ratio - lower_ratio) <= 0.1)
+                & (upper_ratio >= LARGE_SHADOW_THRESHOLD) & (lower_ratio >= LARGE_SHADOW_THRESHOLD),  # Long Legged Doji
+            is_doji & (upper_ratio <= SMALL_SHADOW_THRESHOLD) & (lower_ratio >= LARGE_SHADOW_THRESHOLD),  # Dragonfly
+            is_doji & (lower_ratio <= SMALL_SHADOW_THRESHOLD) & (upper_ratio >= LARGE_SHADOW_THRESHOLD),  # Gravestone
+            # 2. Nến Marubozu - thân lớn, râu ngắn, không phụ thuộc trend
+            ~is_doji & (upper_ratio <= SMALL_SHADOW_THRESHOLD) & (lower_ratio <= SMALL_SHADOW_THRESHOLD)
+                & (body_percentage >= marubozu_threshold),
+            # 3. Hammer/Hanging Man - thân nhỏ, râu dưới dài, râu trên ngắn
+            ~is_doji & (body_ratio <= SMALL_BODY_THRESHOLD) & (lower_ratio >= LARGE_SHADOW_THRESHOLD)
+                & (upper_ratio <= SMALL_SHADOW_THRESHOLD),
+            # 4. Inverted Hammer/Shooting Star - thân nhỏ, râu trên dài, râu dưới ngắn
+            ~is_doji & (body_ratio <= SMALL_BODY_THRESHOLD) & (upper_ratio >= LARGE_SHADOW_THRESHOLD)
+                & (lower_ratio <= SMALL_SHADOW_THRESHOLD),
+        ],
+        [1, 2, 3, 4, 5, 6, 7],
+        default=0
+    )
+
+def candle_pattern_names(shape: np.ndarray, trend: np.ndarray) -> np.ndarray:
+    """Tên mẫu theo hình dạng x xu hướng (sideways giữ 'Standard' với các mẫu phụ thuộc trend)"""
+    is_uptrend = trend == 'uptrend'
+    is_downtrend = trend == 'downtrend'
+    return np.select(
+        [
+            shape == 1,
+            shape == 2,
+            (shape == 3) & is_downtrend,
+            (shape == 3) & is_uptrend,
+            (shape == 4) & is_uptrend,
+            (shape == 4) & is_downtrend,
+            shape == 5,
+            (shape == 6) & is_downtrend,
+            (shape == 6) & is_uptrend,
+            (shape == 7) & is_downtrend,
+            (shape == 7) & is_uptrend,
+        ],
+        [
+            'Star Doji',
+            'Long Legged Doji',
+            'Dragonfly Doji',
+            'Hanging Man',
+            'Gravestone Doji',
+            'Inverted Hammer',
+            'Marubozu',
+            'Hammer',
+            'Hanging Man',
+            'Inverted Hammer',
+            'Shooting Star',
+        ],
+        default='Standard'
+    ).astype(object)
+
 def classify_candle_pattern(df: pd.DataFrame, exchange: str, trends: List[Dict] = None) -> pd.DataFrame:
     df_result = df.copy()
-    df_result['candle_pattern'] = 'Standard'
-    
-    # Lưu lại format Date gốc
-    original_date_format = df_result['Date'].dtype == 'object'
-    original_dates = df_result['Date'].copy()
-    
-    # Tính toán các giá trị cần thiết
-    df_result['body_size'] = abs(df_result['Close'] - df_result['Open'])
-    df_result['upper_shadow'] = df_result['High'] - df_result[['Open', 'Close']].max(axis=1)
-    df_result['lower_shadow'] = df_result[['Open', 'Close']].min(axis=1) - df_result['Low']
-    df_result['total_range'] = df_result['High'] - df_result['Low']
-    df_result['body_percentage'] = (abs(df_result['Close'] - df_result['Open']) / df_result['Open']) * 100
+    
+    # Tính toán các giá trị cần thiết (luôn tính trên float64 kể cả với frame compact)
+    open_price = df_result['Open'].astype('float64')
+    high_price = df_result['High'].astype('float64')
+    low_price = df_result['Low'].astype('float64')
+    close_price = df_result['Close'].astype('float64')
+    
+    df_result['body_size'] = abs(close_price - open_price)
+    df_result['upper_shadow'] = high_price - pd.concat([open_price, close_price], axis=1).max(axis=1)
+    df_result['lower_shadow'] = pd.concat([open_price, close_price], axis=1).min(axis=1) - low_price
+    df_result['total_range'] = high_price - low_price
+    df_result['body_percentage'] = (abs(close_price - open_price) / open_price) * 100
     # Tính toán ngưỡng cho việc phân loại
 
     df_result['body_ratio'] = df_result['body_size'] / df_result['total_range']
@@ -72,86 +152,70 @@ def classify_candle_pattern(df: pd.DataFrame, exchange: str, trends: List[Dict]
     else:
         # Fallback: không có xu hướng, tất cả sẽ được phân loại là sideways
         df_result['trend_context'] = 'sideways'
+        df_result['trend_period'] = None
     
-    # Khôi phục lại Date format gốc nếu cần
-    if original_date_format:
-        df_result['Date'] = original_dates
-    
-    # Ngưỡng phân loại
-    SMALL_BODY_THRESHOLD = 0.1      # Thân nến nhỏ
-    SMALL_SHADOW_THRESHOLD = 0.05   # Râu ngắn
-    LARGE_SHADOW_THRESHOLD = 0.3    # Râu dài
-    DOJI_THRESHOLD = 0.03           # Ngưỡng cho Doji
-    
-    # Ngưỡng Marubozu theo sàn giao dịch
-    if exchange == "HSX":
-        MARUBOZU_THRESHOLD = 3      # 3% movement cho HSX
-    elif exchange == "HNX":
-        MARUBOZU_THRESHOLD = 5      # 5% movement cho HNX
-    elif exchange== "UPCOM":
-        MARUBOZU_THRESHOLD = 7      # 7% movement cho UPCOM
-    else:
-        MARUBOZU_THRESHOLD = 3      # Mặc định HSX nếu không xác định được sàn
+    trend = df_result['trend_context'].astype(str).str.lower().to_numpy()
+    shape = candle_shapes(
+        df_result['body_ratio'].to_numpy(), df_result['upper_shadow_ratio'].to_numpy(),
+        df_result['lower_shadow_ratio'].to_numpy(), df_result['body_percentage'].to_numpy(), exchange
+    )
+    df_result['candle_pattern'] = candle_pattern_names(shape, trend)
     
-    for idx in df_result.index:
-        row = df_result.loc[idx]
-        trend = row.get('trend_context', 'sideways').lower()  # Chuyển về lowercase để match
-        
-        # 1. Nến Doji và các biến thể (ưu tiên cao nhất)
-        if row['body_ratio'] <= DOJI_THRESHOLD:
-            # Star Doji - râu ngắn, gần bằng nhau
-            if (row['upper_shadow_ratio'] <= SMALL_SHADOW_THRESHOLD and 
-                row['lower_shadow_ratio'] <= SMALL_SHADOW_THRESHOLD and 
-                abs(row['lower_shadow_ratio'] - row['upper_shadow_ratio']) <= 0.02):
-                df_result.loc[idx, 'candle_pattern'] = 'Star Doji'
-            
-            # Long Legged Doji - cả 2 râu đều dài và gần bằng nhau
-            elif (abs(row['upper_shadow_ratio'] - row['lower_shadow_ratio']) <= 0.1 and
-                  row['upper_shadow_ratio'] >= LARGE_SHADOW_THRESHOLD and
-                  row['lower_shadow_ratio'] >= LARGE_SHADOW_THRESHOLD):
-                df_result.loc[idx, 'candle_pattern'] = 'Long Legged Doji'
-            
-            # Dragonfly Doji - râu trên ngắn, râu dưới dài
-            elif (row['upper_shadow_ratio'] <= SMALL_SHADOW_THRESHOLD and
-                    row['lower_shadow_ratio'] >= LARGE_SHADOW_THRESHOLD):
-                if row['trend_context'] == 'downtrend':
-                    df_result.loc[idx, 'candle_pattern'] = 'Dragonfly Doji'
-                elif row['trend_context'] == 'uptrend':
-                    df_result.loc[idx, 'candle_pattern'] = 'Hanging Man'
-            # Gravestone Doji
-            elif (row['lower_shadow_ratio'] <= SMALL_SHADOW_THRESHOLD and
-                  row['upper_shadow_ratio'] >= LARGE_SHADOW_THRESHOLD):
-                if row['trend_context'] == 'uptrend':
-                    df_result.loc[idx, 'candle_pattern'] = 'Gravestone Doji'
-                elif row['trend_context'] == 'downtrend':
-                    df_result.loc[idx, 'candle_pattern'] = 'Inverted Hammer'
-        
-        # 2. Nến Marubozu - thân lớn, râu ngắn, không phụ thuộc trend
-        elif (row['upper_shadow_ratio'] <= SMALL_SHADOW_THRESHOLD and
-              row['lower_shadow_ratio'] <= SMALL_SHADOW_THRESHOLD and
-              row['body_percentage'] >= MARUBOZU_THRESHOLD):
-            df_result.loc[idx, 'candle_pattern'] = 'Marubozu'
-        
-        # 3. Hammer/Hanging Man - thân nhỏ, râu dưới dài, râu trên ngắn
-        elif (row['body_ratio'] <= SMALL_BODY_THRESHOLD and
-              row['lower_shadow_ratio'] >= LARGE_SHADOW_THRESHOLD and
-              row['upper_shadow_ratio'] <= SMALL_SHADOW_THRESHOLD):
-            if trend == 'downtrend':
-                df_result.loc[idx, 'candle_pattern'] = 'Hammer'
-            elif trend == 'uptrend':
-                df_result.loc[idx, 'candle_pattern'] = 'Hanging Man'
-            # Nếu sideways, không phân loại thành pattern đặc biệt
-        
-        # 4. Inverted Hammer/Shooting Star - thân nhỏ, râu trên dài, râu dưới ngắn
-        elif (row['body_ratio'] <= SMALL_BODY_THRESHOLD and
-              row['upper_shadow_ratio'] >= LARGE_SHADOW_THRESHOLD and
-              row['lower_shadow_ratio'] <= SMALL_SHADOW_THRESHOLD):
-            if trend == 'downtrend':
-                df_result.loc[idx, 'candle_pattern'] = 'Inverted Hammer'
-            elif trend == 'uptrend':
-                df_result.loc[idx, 'candle_pattern'] = 'Shooting Star'
+    # Frame compact giữ nhãn ở dạng categorical
+    if is_compact_frame(df):
+        df_result = categorize_labels(df_result)
     return df_result
 
+def frame_candle_shapes(df: pd.DataFrame, exchange: str) -> np.ndarray:
+    """candle_shapes tính trực tiếp từ OHLC của df (cùng công thức với classify_candle_pattern)"""
+    open_price = df['Open'].to_numpy(dtype='float64')
+    high_price = df['High'].to_numpy(dtype='float64')
+    low_price = df['Low'].to_numpy(dtype='float64')
+    close_price = df['Close'].to_numpy(dtype='float64')
+    body_size = np.abs(close_price - open_price)
+    total_range = high_price - low_price
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return candle_shapes(
+            body_size / total_range,
+            (high_price - np.maximum(open_price, close_price)) / total_range,
+            (np.minimum(open_price, close_price) - low_price) / total_range,
+            body_size / open_price * 100,
+            exchange
+        )
+
+def as_of_candle_labels(df: pd.DataFrame, exchange: str, trends: List[Dict], threshold: float = None) -> pd.DataFrame:
+    """
+    Nhãn trend_context / trend_period / candle_pattern của mỗi nến như khi chỉ có dữ liệu đến chính nến đó
+    
+    Nhãn tính với xu hướng của cả chuỗi gán cho một nến cả chu kỳ chứa nó, mà chu kỳ được chọn
+    theo giá đóng cửa tới 14 nến sau; backtest theo nến dùng nhãn này để không nhìn trước tương lai.
+    
+    Args:
+        df: DataFrame đã có nhãn nến tính với trends (classify_candle_pattern hoặc feature store)
+        exchange: Sàn giao dịch
+        trends: Xu hướng trên toàn bộ df
+        threshold: Ngưỡng xu hướng đã dùng cho trends (mặc định theo sàn)
+        
+    Returns:
+        DataFrame với ba cột nhãn được thay bằng nhãn "as of" từng nến
+    """
+    cuts, tails = trend_period_tails(df, trends, exchange, threshold)
+    changed = np.flatnonzero(cuts <= np.arange(len(df)))
+    if len(changed) == 0:
+        return df
+    contexts = df['trend_context'].astype(object).to_numpy().copy()
+    periods = df['trend_period'].astype(object).to_numpy().copy()
+    patterns = df['candle_pattern'].astype(object).to_numpy().copy()
+    labels = df['Date'].dt.strftime(DISPLAY_DATE_FORMAT).to_numpy()
+    for t in changed:
+        # Chu kỳ chứa nến t trong phần quét lại phải kết thúc tại t
+        contexts[t], periods[t] = 'sideways', None
+        for start, end, trend in tails[t]:
+            if end == t:
+                contexts[t], periods[t] = trend, f"{labels[start]} to {labels[end]}"
+    patterns[changed] = candle_pattern_names(frame_candle_shapes(df.iloc[changed], exchange), contexts[changed])
+    return df.assign(trend_context=contexts, trend_period=periods, candle_pattern=patterns)
+
 def detect_gaps(df: pd.DataFrame) -> pd.DataFrame:
     """
     Phát hiện Rising/Falling Windows (gaps)
@@ -163,22 +227,21 @@ def detect_gaps(df: pd.DataFrame) -> pd.DataFrame:
         DataFrame với cột 'gap_type' mới
     """
     df_result = df.copy()
-    df_result['gap_type'] = 'No Gap'
     
-    for i in range(1, len(df_result)):
-        current_open = df_result.iloc[i]['Open']
-        previous_high = df_result.iloc[i-1]['High']
-        previous_low = df_result.iloc[i-1]['Low']
-        
-        # Gap tăng (Up Gap/Rising Window)
-        # Điều kiện: Giá mở cửa > giá cao nhất của nến trước đó
-        if current_open > previous_high:
-            df_result.iloc[i, df_result.columns.get_loc('gap_type')] = 'Rising Window'
-        
-        # Gap giảm (Down Gap/Falling Window)  
-        # Điều kiện: Giá mở cửa < giá thấp nhất của nến trước đó
-        elif current_open < previous_low:
-            df_result.iloc[i, df_result.columns.get_loc('gap_type')] = 'Falling Window'
+    # So sánh giá mở cửa với High/Low của nến trước bằng mảng dịch 1 vị trí
+    current_open = df_result['Open'].to_numpy()[1:]
+    previous_high = df_result['High'].to_numpy()[:-1]
+    previous_low = df_result['Low'].to_numpy()[:-1]
+    
+    gap_type = np.full(len(df_result), 'No Gap', dtype=object)
+    # Gap tăng (Rising Window): giá mở cửa > giá cao nhất của nến trước đó
+    # Gap giảm (Falling Window): giá mở cửa < giá thấp nhất của nến trước đó
+    gap_type[1:] = np.select(
+        [current_open > previous_high, current_open < previous_low],
+        ['Rising Window', 'Falling Window'],
+        default='No Gap'
+    )
+    df_result['gap_type'] = gap_type
     
     return df_result
 
@@ -196,7 +259,9 @@ def get_candle_statistics(df: pd.DataFrame) -> Dict:
         return {"error": "DataFrame không có cột 'candle_pattern'"}
     
     filtered_df = df[df['candle_pattern'] != 'Standard']
-    pattern_counts = filtered_df['candle_pattern'].value_counts().to_dict()
+    pattern_counts = filtered_df['candle_pattern'].value_counts()
+    # Bỏ các category không xuất hiện (khi cột là categorical)
+    pattern_counts = pattern_counts[pattern_counts > 0].to_dict()
     total_special_candles = len(filtered_df)
     total_candles = len(df)
     pattern_percentages = {
@@ -218,6 +283,9 @@ def analyze_candle_patterns(df: pd.DataFrame, trends: List[Dict] = None, exchang
     """
     Phân tích toàn diện các mẫu nến
     
+    Nếu df đã có nhãn candle_pattern / gap_type (ví dụ đã phân loại trong build_chart
+    hoặc đọc từ feature store) thì dùng lại, không phân loại lại.
+    
     Args:
         df: DataFrame với OHLC data
         trends: Danh sách xu hướng từ trend_analysis (optional)
@@ -226,17 +294,18 @@ def analyze_candle_patterns(df: pd.DataFrame, trends: List[Dict] = None, exchang
     Returns:
         Dict chứa phân tích chi tiết
     """
-    # Phân loại nến với trends và exchange
-    df_with_patterns = classify_candle_pattern(df, exchange, trends)
+    # Phân loại nến với trends và exchange (chỉ khi chưa có nhãn)
+    df_with_patterns = df if 'candle_pattern' in df.columns else classify_candle_pattern(df, exchange, trends)
     
     # Phát hiện gaps
-    df_with_gaps = detect_gaps(df_with_patterns)
+    df_with_gaps = df_with_patterns if 'gap_type' in df_with_patterns.columns else detect_gaps(df_with_patterns)
     
     # Thống kê
     candle_stats = get_candle_statistics(df_with_gaps)
     
     # Thống kê gaps
-    gap_counts = df_with_gaps['gap_type'].value_counts().to_dict()
+    gap_counts = df_with_gaps['gap_type'].value_counts()
+    gap_counts = gap_counts[gap_counts > 0].to_dict()
     
     return {
         "candle_analysis": candle_stats,
@@ -0,0 +1,120 @@
+"""
+Tính toàn bộ chỉ báo và nhãn mẫu nến mà API cung cấp cho một mã.
+
+Dùng bởi job build_feature_store.py để tính trước sau giờ đóng cửa; /predict và
+/plot sau đó chỉ cần cắt cửa sổ dữ liệu từ feature store.
+Các giá trị được tính trên toàn bộ lịch sử nên chỉ báo dài hạn (MA200, MACD...)
+đã "ấm" ngay từ đầu cửa sổ yêu cầu.
+"""
+import logging
+from typing import Dict, List
+import numpy as np
+import pandas as pd
+import sys
+import os
+
+# Thêm parent directory vào path để import
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from indicators.moving_averages import calculate_moving_averages
+from indicators.bollinger_bands import calculate_bollinger_bands
+from indicators.ichimoku import calculate_ichimoku
+from indicators.rsi import calculate_rsi
+from indicators.macd import calculate_macd
+from indicators.trend_analysis import calculate_trend, parse_trend_periods
+from indicators.candle_patterns import classify_candle_pattern, detect_gaps
+
+logger = logging.getLogger(__name__)
+
+OHLCV_COLUMNS = ['Date', 'Open', 'High', 'Low', 'Close', 'Volume']
+
+INDICATOR_COLUMNS = [
+    'MA10', 'MA50', 'MA100', 'MA200',
+    'BB_Upper', 'BB_Lower', 'BB_Middle',
+    'ICH_Tenkan', 'ICH_Kijun', 'ICH_SpanA', 'ICH_SpanB', 'ICH_Chikou',
+    'RSI',
+    'MACD', 'MACD_Signal', 'MACD_Histogram',
+]
+
+LABEL_COLUMNS = ['candle_pattern', 'trend_context', 'trend_period', 'gap_type']
+
+# Thông tin của trend period chứa nến (NaN ngoài period) để dựng lại đầy đủ kết quả calculate_trend:
+# trend_change = percent_change (%, đã làm tròn 2 chữ số), trend_days = days_count
+TREND_DETAIL_COLUMNS = ['trend_change', 'trend_days']
+
+FEATURE_COLUMNS = OHLCV_COLUMNS + INDICATOR_COLUMNS + LABEL_COLUMNS + TREND_DETAIL_COLUMNS
+
+
+def compute_feature_frame(df: pd.DataFrame, symbol: str, exchange: str) -> pd.DataFrame:
+    """
+    Tính tất cả chỉ báo và nhãn cho toàn bộ lịch sử của một mã
+
+    Args:
+        df: DataFrame OHLCV (Date datetime64) đã sắp xếp theo thời gian
+        symbol: Mã chứng khoán
+        exchange: Sàn giao dịch (HSX/HNX/UPCOM)
+
+    Returns:
+        DataFrame chỉ gồm FEATURE_COLUMNS, index 0..n-1
+    """
+    features = df.sort_values('Date').reset_index(drop=True)
+    features = calculate_moving_averages(features)
+    features = calculate_bollinger_bands(features)
+    features = calculate_ichimoku(features)
+    features = calculate_rsi(features)
+    features = calculate_macd(features)
+
+    # Xu hướng trên toàn bộ lịch sử để gán ngữ cảnh cho mẫu nến
+    start_date = features['Date'].iloc[0].strftime('%Y-%m-%d')
+    end_date = features['Date'].iloc[-1].strftime('%Y-%m-%d')
+    try:
+        trends = calculate_trend(features, symbol, start_date, end_date, exchange)
+    except ValueError as e:
+        logger.warning(f"{symbol}: {e} - bỏ qua phân tích xu hướng")
+        trends = []
+
+    features = classify_candle_pattern(features, exchange, trends)
+    features = detect_gaps(features)
+    features = _assign_trend_details(features, trends)
+    return features[FEATURE_COLUMNS]
+
+
+def _assign_trend_details(df: pd.DataFrame, trends: List[Dict]) -> pd.DataFrame:
+    """Gán trend_change / trend_days của trend period cho các nến thuộc period đó"""
+    change = np.full(len(df), np.nan)
+    days = np.full(len(df), np.nan)
+    dates = df['Date'].to_numpy()
+    for trend, (start, end) in zip(trends, parse_trend_periods(trends)):
+        lo = np.searchsorted(dates, np.datetime64(start), side='left')
+        hi = np.searchsorted(dates, np.datetime64(end), side='right')
+        change[lo:hi] = float(str(trend['percent_change']).split()[0])
+        days[lo:hi] = trend['days_count']
+    return df.assign(trend_change=change, trend_days=days)
+
+
+def trends_from_frame(df: pd.DataFrame, symbol: str = None, exchange: str = None) -> List[Dict]:
+    """
+    Dựng lại danh sách xu hướng từ cột trend_period/trend_context đã tính sẵn
+
+    Args:
+        df: DataFrame đọc từ feature store
+        symbol, exchange: Thêm vào mỗi xu hướng như calculate_trend (nếu có)
+
+    Returns:
+        List dict {"period": ..., "trend": ...} theo thứ tự thời gian; kèm percent_change và
+        days_count như calculate_trend khi df có cột TREND_DETAIL_COLUMNS
+    """
+    if 'trend_period' not in df.columns:
+        return []
+    details = all(column in df.columns for column in TREND_DETAIL_COLUMNS)
+    columns = ['trend_period', 'trend_context'] + (TREND_DETAIL_COLUMNS if details else [])
+    labelled = df.loc[df['trend_period'].notna(), columns]
+    labelled = labelled.drop_duplicates(subset='trend_period')
+    trends = []
+    for row in labelled.itertuples(index=False):
+        trend = {"symbol": symbol, "exchange": exchange} if symbol is not None else {}
+        trend.update({"period": str(row.trend_period), "trend": str(row.trend_context)})
+        if details and pd.notna(row.trend_change):
+            trend["percent_change"] = f"{row.trend_change} %"
+            trend["days_count"] = int(row.trend_days)
+        trends.append(trend)
+    return trends
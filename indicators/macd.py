@@ -16,7 +16,7 @@ def calculate_macd(df: pd.DataFrame, fast_period: int = 12, slow_period: int = 2
     df = df.copy()
     
     # Calculate MACD using ta library
-    macd_indicator = MACD(close=df['Close'], 
+    macd_indicator = MACD(close=df['Close'].astype('float64'), 
                          window_slow=slow_period, 
                          window_fast=fast_period, 
                          window_sign=signal_period)
@@ -0,0 +1,195 @@
+"""
+Engine hỗ trợ/kháng cự dựa trên swing pivots.
+
+- Swing pivot: đỉnh (High) / đáy (Low) cục bộ trong cửa sổ ±window nến,
+  phát hiện bằng rolling max/min căn giữa (vector hóa, O(n)).
+- Các pivot gần nhau về giá được gom thành vùng giá (zone) kèm số lần chạm.
+- Vùng dưới giá đóng cửa cuối cùng là hỗ trợ, vùng trên là kháng cự.
+
+Pivot của một mã được cache: khi có nến mới, chỉ tính lại phần đuôi chưa được
+xác nhận (window nến cuối) thay vì toàn bộ lịch sử.
+"""
+import threading
+from typing import Dict, List, Optional
+import numpy as np
+import pandas as pd
+
+DEFAULT_PIVOT_WINDOW = 5        # Số nến mỗi bên để xác nhận một pivot
+DEFAULT_ZONE_TOLERANCE = 0.02   # Khoảng cách giá tương đối tối đa giữa 2 pivot trong cùng vùng
+DEFAULT_MAX_LEVELS = 3          # Số mức hỗ trợ/kháng cự gần nhất trả về
+
+PIVOT_COLUMNS = ['Date', 'price', 'kind']
+
+
+def find_swing_pivots(df: pd.DataFrame, window: int = DEFAULT_PIVOT_WINDOW) -> pd.DataFrame:
+    """
+    Tìm các swing high/low trong DataFrame
+
+    Một nến là swing high nếu High của nó là lớn nhất trong ±window nến xung quanh
+    (tương tự với swing low và Low). Các nến ở hai đầu không đủ cửa sổ bị bỏ qua.
+
+    Args:
+        df: DataFrame với cột Date, High, Low
+        window: Số nến mỗi bên
+
+    Returns:
+        DataFrame với cột Date, price, kind ('high'/'low'), sắp xếp theo Date
+    """
+    if len(df) < 2 * window + 1:
+        return pd.DataFrame(columns=PIVOT_COLUMNS)
+
+    high = df['High'].astype('float64').reset_index(drop=True)
+    low = df['Low'].astype('float64').reset_index(drop=True)
+    dates = df['Date'].reset_index(drop=True)
+
+    span = 2 * window + 1
+    is_high = (high == high.rolling(span, center=True).max()).to_numpy()
+    is_low = (low == low.rolling(span, center=True).min()).to_numpy()
+
+    pivots = pd.concat([
+        pd.DataFrame({'Date': dates[is_high], 'price': high[is_high], 'kind': 'high'}),
+        pd.DataFrame({'Date': dates[is_low], 'price': low[is_low], 'kind': 'low'}),
+    ], ignore_index=True)
+    return pivots.sort_values('Date', kind='stable').reset_index(drop=True)
+
+
+def cluster_price_zones(pivots: pd.DataFrame, tolerance: float = DEFAULT_ZONE_TOLERANCE) -> pd.DataFrame:
+    """
+    Gom các pivot thành vùng giá
+
+    Pivot được sắp xếp theo giá; hai pivot liên tiếp cách nhau không quá `tolerance`
+    (tương đối) thuộc cùng một vùng.
+
+    Args:
+        pivots: DataFrame từ find_swing_pivots
+        tolerance: Khoảng cách giá tương đối tối đa
+
+    Returns:
+        DataFrame với cột price (trung bình), lower, upper, touches, last_touch
+    """
+    if len(pivots) == 0:
+        return pd.DataFrame(columns=['price', 'lower', 'upper', 'touches', 'last_touch'])
+
+    ordered = pivots.sort_values('price', kind='stable')
+    prices = ordered['price'].to_numpy()
+    gaps = np.diff(prices) / prices[:-1]
+    zone_ids = np.concatenate([[0], np.cumsum(gaps > tolerance)])
+
+    zones = ordered.groupby(zone_ids).agg(
+        price=('price', 'mean'),
+        lower=('price', 'min'),
+        upper=('price', 'max'),
+        touches=('price', 'size'),
+        last_touch=('Date', 'max'),
+    )
+    return zones.reset_index(drop=True)
+
+
+class PivotCache:
+    """
+    Cache pivot theo (symbol, window)
+
+    Pivot ở vị trí p chỉ phụ thuộc vào các nến p-window..p+window, nên mọi pivot
+    có đủ window nến phía sau đã được xác nhận và không đổi khi thêm nến mới.
+    Kết quả luôn bằng find_swing_pivots trên đúng df được truyền vào: pivot trong cache
+    ở window nến đầu/cuối của df bị bỏ và hai đầu được tính lại.
+    """
+
+    def __init__(self):
+        self._entries: Dict[tuple, dict] = {}
+        self._lock = threading.Lock()
+
+    def get_pivots(self, symbol: str, df: pd.DataFrame, window: int = DEFAULT_PIVOT_WINDOW) -> pd.DataFrame:
+        """Lấy pivot cho df, tái sử dụng phần đã xác nhận trong cache nếu có"""
+        key = (symbol.upper(), window)
+        with self._lock:
+            entry = self._entries.get(key)
+
+        dates = df['Date'].reset_index(drop=True)
+        if len(dates) < 2 * window + 1:
+            return pd.DataFrame(columns=PIVOT_COLUMNS)
+
+        confirmed_position = None
+        if entry is not None and entry['first_date'] <= dates.iloc[0]:
+            matches = np.flatnonzero(dates.to_numpy() == np.datetime64(entry['confirmed_until']))
+            if len(matches):
+                confirmed_position = int(matches[0])
+
+        if confirmed_position is None:
+            # Không dùng được cache: tính toàn bộ
+            pivots = find_swing_pivots(df, window)
+            first_date = dates.iloc[0]
+        else:
+            # Chỉ tính lại phần đuôi sau mốc đã xác nhận (kèm window nến phía trước)
+            tail_start = max(0, confirmed_position + 1 - window)
+            tail = find_swing_pivots(df.iloc[tail_start:], window)
+            tail = tail[tail['Date'] > entry['confirmed_until']]
+            # Pivot trong cache chỉ dùng được khi đủ window nến hai bên nằm trong df
+            # (như find_swing_pivots trên df): không dùng nến trước df hay sau nến cuối của df
+            cached = entry['pivots']
+            cached = cached[(cached['Date'] >= dates.iloc[window])
+                            & (cached['Date'] <= min(entry['confirmed_until'], dates.iloc[len(dates) - 1 - window]))]
+            parts = [part for part in (cached, tail) if len(part)]
+            pivots = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=PIVOT_COLUMNS)
+            first_date = dates.iloc[0]
+
+        # Chỉ lưu lại khi df mở rộng dữ liệu so với cache
+        if len(dates) > window and (entry is None or confirmed_position is None or dates.iloc[-1] > entry['last_date']):
+            with self._lock:
+                self._entries[key] = {
+                    'first_date': first_date,
+                    'last_date': dates.iloc[-1],
+                    'confirmed_until': dates.iloc[len(dates) - 1 - window],
+                    'pivots': pivots[pivots['Date'] <= dates.iloc[len(dates) - 1 - window]],
+                }
+        return pivots
+
+    def clear(self, symbol: str = None) -> None:
+        """Xóa cache của một mã (hoặc toàn bộ)"""
+        with self._lock:
+            if symbol is None:
+                self._entries.clear()
+            else:
+                for key in [k for k in self._entries if k[0] == symbol.upper()]:
+                    del self._entries[key]
+
+
+# Cache dùng chung trong tiến trình
+pivot_cache = PivotCache()
+
+
+def get_support_resistance_levels(df: pd.DataFrame, symbol: Optional[str] = None,
+                                  max_levels: int = DEFAULT_MAX_LEVELS,
+                                  window: int = DEFAULT_PIVOT_WINDOW,
+                                  tolerance: float = DEFAULT_ZONE_TOLERANCE) -> Dict[str, List[Dict]]:
+    """
+    Tìm N mức hỗ trợ và kháng cự gần giá đóng cửa cuối cùng nhất
+
+    Args:
+        df: DataFrame với cột Date, High, Low, Close
+        symbol: Mã chứng khoán - nếu có sẽ dùng pivot_cache
+        max_levels: Số mức tối đa mỗi loại
+        window: Số nến mỗi bên để xác nhận pivot
+        tolerance: Khoảng cách giá tương đối khi gom vùng
+
+    Returns:
+        Dict {"support": [...], "resistance": [...]}, mỗi mức gồm price, lower, upper,
+        touches, last_touch - sắp xếp từ gần đến xa giá hiện tại
+    """
+    if df is None or len(df) == 0:
+        return {"support": [], "resistance": []}
+
+    if symbol:
+        pivots = pivot_cache.get_pivots(symbol, df, window)
+    else:
+        pivots = find_swing_pivots(df, window)
+    zones = cluster_price_zones(pivots, tolerance)
+
+    last_close = float(df['Close'].iloc[-1])
+    supports = zones[zones['price'] <= last_close].sort_values('price', ascending=False).head(max_levels)
+    resistances = zones[zones['price'] > last_close].sort_values('price').head(max_levels)
+
+    return {
+        "support": supports.to_dict('records'),
+        "resistance": resistances.to_dict('records'),
+    }
@@ -0,0 +1,177 @@
+"""
+Gộp nến ngày thành nến tuần / tháng theo lịch.
+
+- Tuần: thứ 2 - chủ nhật (W-SUN), tháng: tháng dương lịch.
+- Mỗi nến gộp được gán Date là phiên giao dịch thực tế cuối cùng trong kỳ
+  (không phải ngày cuối kỳ theo lịch), nên tuần có ngày nghỉ lễ vẫn đúng ngày.
+- Open = Open phiên đầu, High = max, Low = min, Close = Close phiên cuối, Volume = tổng.
+
+Nến gộp của một mã được cache: các kỳ đã đóng (trước kỳ của phiên cuối cùng
+đã thấy) không đổi khi có nến ngày mới, nên chỉ cần gộp lại kỳ cuối. Các kỳ dùng
+lại được đối chiếu với nến ngày của lần gọi (số phiên, tổng volume, ngày và giá
+đóng cửa phiên cuối mỗi kỳ); dữ liệu ngày bị sửa (điều chỉnh giá, bổ sung phiên)
+thì gộp lại toàn bộ.
+"""
+import threading
+from typing import Dict, Optional
+import numpy as np
+import pandas as pd
+
+TIMEFRAMES = ('D', 'W', 'M')
+TIMEFRAME_LABELS = {'D': 'Daily', 'W': 'Weekly', 'M': 'Monthly'}
+
+# Số phiên giao dịch xấp xỉ trong một nến của mỗi khung thời gian
+BARS_PER_TIMEFRAME = {'D': 1, 'W': 5, 'M': 21}
+
+_PERIOD_FREQ = {'W': 'W-SUN', 'M': 'M'}
+
+OHLCV_COLUMNS = ['Date', 'Open', 'High', 'Low', 'Close', 'Volume']
+
+
+def normalize_timeframe(timeframe: Optional[str]) -> str:
+    """Chuẩn hóa khung thời gian ('d'/'w'/'m', mặc định 'D'), báo lỗi nếu không hỗ trợ"""
+    value = (timeframe or 'D').strip().upper()
+    if value not in TIMEFRAMES:
+        raise ValueError(f"Timeframe '{timeframe}' không được hỗ trợ. Chỉ hỗ trợ: {', '.join(TIMEFRAMES)}")
+    return value
+
+
+def timeframe_cache_key(symbol: str, timeframe: str) -> str:
+    """Khóa cache theo mã cho từng khung thời gian (giữ nguyên mã với khung ngày)"""
+    return symbol if timeframe == 'D' else f"{symbol}@{timeframe}"
+
+
+def _aggregate(df: pd.DataFrame, freq: str) -> pd.DataFrame:
+    """Gộp nến ngày (đã sắp xếp) theo kỳ, index là Period"""
+    periods = df['Date'].dt.to_period(freq)
+    return df.groupby(periods, sort=True).agg(
+        Date=('Date', 'last'),
+        Open=('Open', 'first'),
+        High=('High', 'max'),
+        Low=('Low', 'min'),
+        Close=('Close', 'last'),
+        Volume=('Volume', 'sum'),
+        first_date=('Date', 'first'),
+        sessions=('Date', 'size'),
+    )
+
+
+def _matches_daily(reused: pd.DataFrame, daily: pd.DataFrame) -> bool:
+    """Các kỳ lấy từ cache có khớp với nến ngày của chúng trong lần gọi này không"""
+    if int(reused['sessions'].sum()) != len(daily):
+        return False
+    if len(daily) == 0:
+        return True
+    if not np.isclose(reused['Volume'].sum(), daily['Volume'].sum(), rtol=1e-9, atol=0):
+        return False
+    # Phiên cuối của mỗi kỳ phải có trong nến ngày với cùng giá đóng cửa
+    dates = daily['Date'].to_numpy()
+    positions = np.searchsorted(dates, reused['Date'].to_numpy())
+    if (positions >= len(dates)).any() or (dates[positions] != reused['Date'].to_numpy()).any():
+        return False
+    return bool(np.array_equal(daily['Close'].to_numpy()[positions], reused['Close'].to_numpy()))
+
+
+def _to_bars(aggregated: pd.DataFrame, source: pd.DataFrame) -> pd.DataFrame:
+    bars = aggregated[OHLCV_COLUMNS].reset_index(drop=True)
+    bars.attrs.update(source.attrs)
+    return bars
+
+
+class ResampleCache:
+    """
+    Cache nến gộp theo (symbol, timeframe)
+
+    Một kỳ trong cache dùng lại được cho cửa sổ mới nếu cửa sổ chứa toàn bộ các
+    phiên của kỳ đó: kỳ đầu cửa sổ phải bắt đầu cùng phiên với kỳ trong cache, và
+    chỉ các kỳ trước kỳ cuối (có thể chưa đóng) mới được dùng lại. Kỳ dùng lại phải
+    khớp với nến ngày của cửa sổ (_matches_daily), nếu không cache được gộp lại từ đầu.
+    """
+
+    def __init__(self):
+        self._entries: Dict[tuple, dict] = {}
+        self._lock = threading.Lock()
+
+    def resample(self, symbol: str, df: pd.DataFrame, timeframe: str) -> pd.DataFrame:
+        """Gộp df theo timeframe, tái sử dụng các kỳ đã đóng trong cache nếu có"""
+        freq = _PERIOD_FREQ[timeframe]
+        key = (symbol.upper(), timeframe)
+        with self._lock:
+            entry = self._entries.get(key)
+
+        daily = df.sort_values('Date').reset_index(drop=True)
+        if len(daily) == 0:
+            return daily[OHLCV_COLUMNS]
+        first_date = daily['Date'].iloc[0]
+        last_date = daily['Date'].iloc[-1]
+        first_period = first_date.to_period(freq)
+
+        aggregated = None
+        stale = False
+        if entry is not None and entry['first_date'] <= first_date:
+            cached = entry['bars']
+            if first_period in cached.index and cached.at[first_period, 'first_date'] == first_date:
+                # Dùng lại các kỳ đã đóng, chỉ gộp lại từ kỳ chưa chắc chắn đầy đủ
+                boundary = min(entry['last_date'].to_period(freq), last_date.to_period(freq))
+                reused = cached[(cached.index >= first_period) & (cached.index < boundary)]
+                cut = int(np.searchsorted(daily['Date'].to_numpy(), np.datetime64(boundary.start_time), side='left'))
+                # Nến ngày đã bị sửa so với lúc cache thì không dùng lại (gộp lại toàn bộ bên dưới)
+                stale = not _matches_daily(reused, daily.iloc[:cut])
+                if not stale:
+                    parts = [part for part in (reused, _aggregate(daily.iloc[cut:], freq)) if len(part)]
+                    aggregated = pd.concat(parts)
+                    older = cached[cached.index < first_period]
+                    if last_date > entry['last_date']:
+                        with self._lock:
+                            self._entries[key] = {
+                                'first_date': entry['first_date'],
+                                'last_date': last_date,
+                                'bars': pd.concat([part for part in (older, aggregated) if len(part)]),
+                            }
+
+        if aggregated is None:
+            # Không dùng được cache: gộp toàn bộ và lưu lại
+            aggregated = _aggregate(daily, freq)
+            if entry is None or stale or last_date >= entry['last_date'] or first_date < entry['first_date']:
+                with self._lock:
+                    self._entries[key] = {
+                        'first_date': first_date,
+                        'last_date': last_date,
+                        'bars': aggregated,
+                    }
+
+        return _to_bars(aggregated, df)
+
+    def clear(self, symbol: str = None) -> None:
+        """Xóa cache của một mã (hoặc toàn bộ)"""
+        with self._lock:
+            if symbol is None:
+                self._entries.clear()
+            else:
+                for key in [k for k in self._entries if k[0] == symbol.upper()]:
+                    del self._entries[key]
+
+
+# Cache dùng chung trong tiến trình
+resample_cache = ResampleCache()
+
+
+def resample_ohlcv(df: pd.DataFrame, timeframe: str = 'D', symbol: Optional[str] = None) -> pd.DataFrame:
+    """
+    Gộp DataFrame OHLCV ngày sang khung thời gian khác
+
+    Args:
+        df: DataFrame với cột Date (datetime64), Open, High, Low, Close, Volume
+        timeframe: 'D' (giữ nguyên), 'W' (tuần) hoặc 'M' (tháng)
+        symbol: Mã chứng khoán - nếu có sẽ dùng resample_cache
+
+    Returns:
+        DataFrame OHLCV với Date là phiên giao dịch cuối cùng của mỗi kỳ
+    """
+    timeframe = normalize_timeframe(timeframe)
+    if timeframe == 'D':
+        return df
+    if symbol:
+        return resample_cache.resample(symbol, df, timeframe)
+    daily = df.sort_values('Date').reset_index(drop=True)
+    return _to_bars(_aggregate(daily, _PERIOD_FREQ[timeframe]), df)
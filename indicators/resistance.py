@@ -1,7 +1,23 @@
 import pandas as pd
+from typing import Optional
+import sys
+import os
 
-def calculate_resistance(df: pd.DataFrame) -> pd.DataFrame:
+# Thêm parent directory vào path để import
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from indicators.pivots import get_support_resistance_levels, DEFAULT_MAX_LEVELS
+
+def calculate_resistance(df: pd.DataFrame, symbol: Optional[str] = None, max_levels: int = DEFAULT_MAX_LEVELS) -> pd.DataFrame:
+    """
+    Tính các mức kháng cự từ swing pivots (xem indicators.pivots)
+    
+    - Resistance: mức kháng cự gần giá đóng cửa cuối cùng nhất
+    - Resistance_2, Resistance_3...: các mức kháng cự xa hơn (nếu có)
+    Nếu không có pivot nào trên giá hiện tại, dùng giá đóng cửa cao nhất.
     """
-    Tính toán điểm kháng cự dựa trên giá đóng cửa trong toàn bộ khoảng thời gian"""
-    df['Resistance'] = df['Close'].max()
-    return df
\ No newline at end of file
+    df = df.copy()
+    levels = get_support_resistance_levels(df, symbol, max_levels)['resistance']
+    df['Resistance'] = levels[0]['price'] if levels else df['Close'].astype('float64').max()
+    for rank, level in enumerate(levels[1:], start=2):
+        df[f'Resistance_{rank}'] = level['price']
+    return df
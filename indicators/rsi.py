@@ -4,6 +4,6 @@ from ta.momentum import RSIIndicator
 def calculate_rsi(df: pd.DataFrame, window: int = 14) -> pd.DataFrame:
     """Calculate RSI (Relative Strength Index)"""
     df = df.copy()
-    rsi = RSIIndicator(close=df['Close'], window=window)
+    rsi = RSIIndicator(close=df['Close'].astype('float64'), window=window)
     df['RSI'] = rsi.rsi()
     return df
@@ -1,6 +1,23 @@
 import pandas as pd
+from typing import Optional
+import sys
+import os
 
-def calculate_support(df: pd.DataFrame) -> pd.DataFrame:
-    """Tính toán điểm hỗ trợ dựa trên giá đóng cửa trong toàn bộ khoảng thời gian"""
-    df['Support'] = df['Close'].min()
-    return df
\ No newline at end of file
+# Thêm parent directory vào path để import
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from indicators.pivots import get_support_resistance_levels, DEFAULT_MAX_LEVELS
+
+def calculate_support(df: pd.DataFrame, symbol: Optional[str] = None, max_levels: int = DEFAULT_MAX_LEVELS) -> pd.DataFrame:
+    """
+    Tính các mức hỗ trợ từ swing pivots (xem indicators.pivots)
+    
+    - Support: mức hỗ trợ gần giá đóng cửa cuối cùng nhất
+    - Support_2, Support_3...: các mức hỗ trợ xa hơn (nếu có)
+    Nếu không có pivot nào dưới giá hiện tại, dùng giá đóng cửa thấp nhất.
+    """
+    df = df.copy()
+    levels = get_support_resistance_levels(df, symbol, max_levels)['support']
+    df['Support'] = levels[0]['price'] if levels else df['Close'].astype('float64').min()
+    for rank, level in enumerate(levels[1:], start=2):
+        df[f'Support_{rank}'] = level['price']
+    return df
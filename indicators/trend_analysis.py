@@ -1,18 +1,31 @@
+import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta
-from typing import List, Dict
+from typing import List, Dict, Tuple
+import sys
+import os
 
-def calculate_trend(df: pd.DataFrame, symbol: str, start_date: str, end_date: str, exchange: str = "Unknown") -> List[Dict]:
-    """Tính xu hướng giá theo chu kỳ 15 ngày dựa trên thay đổi giá đóng cửa và exchange"""
-    # Sao chép dataframe để không ảnh hưởng đến dữ liệu gốc
-    df_temp = df.copy()
-    
-    # Đảm bảo Date là datetime (có thể đã là datetime rồi)
-    if df_temp['Date'].dtype == 'object':
-        df_temp['Date'] = pd.to_datetime(df_temp['Date'], format='%d/%m/%Y')
-    
-    # Sắp xếp theo ngày
-    df_temp = df_temp.sort_values('Date')
+# Thêm parent directory vào path để import
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils import DISPLAY_DATE_FORMAT
+
+# Ngưỡng % thay đổi giá để xác định uptrend/downtrend theo sàn
+TREND_THRESHOLDS = {
+    "HSX": 10,
+    "HOSE": 10,
+    "HNX": 15,
+    "UPCOM": 20,
+}
+
+def calculate_trend(df: pd.DataFrame, symbol: str, start_date: str, end_date: str, exchange: str = "Unknown",
+                    threshold: float = None) -> List[Dict]:
+    """
+    Tính xu hướng giá theo chu kỳ 15 ngày dựa trên thay đổi giá đóng cửa và exchange
+
+    threshold (%) ghi đè ngưỡng mặc định của sàn trong TREND_THRESHOLDS (dùng khi dò tham số).
+    """
+    # Date đã là datetime64 từ build_price_frame, chỉ cần sắp xếp và lọc
+    df_temp = df[['Date', 'Close']].sort_values('Date')
     
     # Lọc dữ liệu trong khoảng thời gian
     start_dt = pd.to_datetime(start_date).tz_localize(None)
@@ -20,98 +33,153 @@ def calculate_trend(df: pd.DataFrame, symbol: str, start_date: str, end_date: st
     
     # Đảm bảo Date column cũng không có timezone
     if df_temp['Date'].dt.tz is not None:
-        df_temp['Date'] = df_temp['Date'].dt.tz_localize(None)
+        df_temp = df_temp.assign(Date=df_temp['Date'].dt.tz_localize(None))
     
     df_temp = df_temp[(df_temp['Date'] >= start_dt) & (df_temp['Date'] <= end_dt)]
     
     if len(df_temp) == 0:
         return []
     
+    # Làm việc trên numpy array, chỉ format ngày cho các chu kỳ được trả về
+    dates = df_temp['Date'].to_numpy()
+    closes = df_temp['Close'].to_numpy(dtype='float64')
+    
     # Thiết lập ngưỡng trend theo exchange
     exchange_upper = exchange.upper()
     
-    if exchange_upper == "HSX" or exchange_upper == "HOSE":
-        up_threshold = 10
-        down_threshold = -10
-    elif exchange_upper == "HNX":
-        up_threshold = 15
-        down_threshold = -15
-    elif exchange_upper == "UPCOM":
-        up_threshold = 20
-        down_threshold = -20
-    else:
+    if exchange_upper not in TREND_THRESHOLDS:
         raise ValueError(f"Exchange '{exchange}' không được hỗ trợ. Chỉ hỗ trợ: HSX, HOSE, HNX, UPCOM")
+    up_threshold = TREND_THRESHOLDS[exchange_upper] if threshold is None else threshold
     
     trends = []
-    start_index = 0
+    for start_index, end_index, trend, percent_change in _scan_trend_windows(closes, up_threshold):
+        # Format ngày
+        start_period = pd.Timestamp(dates[start_index]).strftime(DISPLAY_DATE_FORMAT)
+        end_period = pd.Timestamp(dates[end_index - 1]).strftime(DISPLAY_DATE_FORMAT)
+        
+        trends.append({
+            "symbol": symbol,
+            "exchange": exchange,
+            "period": f"{start_period} to {end_period}",
+            "trend": trend,
+            "percent_change": f"{round(percent_change, 2)} %",
+            "days_count": end_index - start_index
+        })
     
-    while start_index <= len(df_temp) - 7:  # Đảm bảo còn ít nhất 7 ngày
+    return trends
+
+def _scan_trend_windows(closes, up_threshold: float, start: int = 0, stop: int = None) -> List[Tuple[int, int, str, float]]:
+    """
+    Quét chu kỳ xu hướng của calculate_trend trên closes[start:stop]
+    
+    Returns:
+        List tuple (vị trí nến đầu, vị trí sau nến cuối, xu hướng, % thay đổi)
+    """
+    down_threshold = -up_threshold
+    n = len(closes) if stop is None else stop
+    windows = []
+    start_index = start
+    
+    while start_index <= n - 7:  # Đảm bảo còn ít nhất 7 ngày
         # Bắt đầu với window tối đa 15 ngày
-        max_end = min(start_index + 15, len(df_temp))
+        max_end = min(start_index + 15, n)
         trend_found = False
+        first_close = float(closes[start_index])
         
         # Thử từ window 15 ngày xuống đến 7 ngày
         for current_end in range(max_end, start_index + 6, -1):  # Từ max_end xuống start_index + 7
-            window_size = current_end - start_index
-            
-            # Kiểm tra điều kiện tối thiểu 7 ngày
-            if window_size < 7:
-                break
-                
-            period_data = df_temp.iloc[start_index:current_end]
-            
-            # Format ngày
-            start_period = period_data.iloc[0]['Date'].strftime('%d/%m/%Y')
-            end_period = period_data.iloc[-1]['Date'].strftime('%d/%m/%Y')
-            
-            # Lấy giá đóng cửa đầu và cuối chu kỳ
-            first_close = period_data.iloc[0]['Close']
-            last_close = period_data.iloc[-1]['Close']
-            
-            # Tính phần trăm thay đổi
+            # Lấy giá đóng cửa cuối chu kỳ và tính phần trăm thay đổi
+            last_close = float(closes[current_end - 1])
             percent_change = ((last_close - first_close) / first_close) * 100
 
             # Xác định xu hướng
             if percent_change >= up_threshold:
                 trend = "uptrend"
-                trend_found = True
-                
-                trends.append({
-                    "symbol": symbol,
-                    "exchange": exchange,
-                    "period": f"{start_period} to {end_period}",
-                    "trend": trend,
-                    "percent_change": f"{round(percent_change, 2)} %",
-                    "days_count": len(period_data)
-                })
-                
-                # Nhảy đến sau chu kỳ vừa tìm thấy
-                start_index = current_end
-                break
-                
             elif percent_change <= down_threshold:
                 trend = "downtrend"
-                trend_found = True
-                
-                trends.append({
-                    "symbol": symbol,
-                    "exchange": exchange,
-                    "period": f"{start_period} to {end_period}",
-                    "trend": trend,
-                    "percent_change": f"{round(percent_change, 2)} %",
-                    "days_count": len(period_data)
-                })
-                
-                # Nhảy đến sau chu kỳ vừa tìm thấy
-                start_index = current_end
-                break
+            else:
+                continue
+            
+            trend_found = True
+            windows.append((start_index, current_end, trend, percent_change))
+            
+            # Nhảy đến sau chu kỳ vừa tìm thấy
+            start_index = current_end
+            break
         
         # Nếu không tìm thấy trend nào trong tất cả các window size
         if not trend_found:
             # Dịch chuyển start 1 ngày
             start_index += 1
     
-    return trends
+    return windows
+
+def trend_period_tails(df: pd.DataFrame, trends: List[Dict], exchange: str = "Unknown",
+                       threshold: float = None) -> Tuple[np.ndarray, List[List[Tuple[int, int, str]]]]:
+    """
+    Xu hướng đã biết tại từng phiên t (như calculate_trend trên dữ liệu đến t) từ xu hướng của cả chuỗi
+    
+    Chu kỳ của calculate_trend được chọn khi quét tới nến đầu chu kỳ và dùng giá đóng cửa tới
+    14 nến sau đó. Các chu kỳ kết thúc đến t giống hệt khi chỉ có dữ liệu đến t; từ chu kỳ đầu
+    tiên kết thúc sau t trở đi, dữ liệu đến t cho chu kỳ ngắn hơn hoặc không có chu kỳ, nên
+    phần này được quét lại cho từng t (tối đa 14 nến).
+    
+    Args:
+        df: DataFrame có Date, Close đã sắp xếp theo Date
+        trends: Xu hướng của calculate_trend trên toàn bộ df
+        exchange, threshold: Như calculate_trend (sàn không được hỗ trợ thì không có xu hướng)
+        
+    Returns:
+        Tuple (cuts, tails): nhãn xu hướng của cả chuỗi ở các nến trước cuts[t] đã được xác nhận
+        tại t; tails[t] là list (vị trí nến đầu, vị trí nến cuối, xu hướng) của các chu kỳ tìm
+        được trên dữ liệu từ cuts[t] đến t
+    """
+    n = len(df)
+    positions = np.arange(n)
+    up_threshold = TREND_THRESHOLDS.get(str(exchange).upper())
+    if up_threshold is not None and threshold is not None:
+        up_threshold = threshold
+    if not trends or up_threshold is None:
+        return positions + 1, [[] for _ in range(n)]
+    
+    dates = df['Date'].to_numpy(dtype='datetime64[ns]')
+    bounds = parse_trend_periods(trends)
+    start_dates = np.array([start for start, _ in bounds], dtype='datetime64[ns]')
+    end_dates = np.array([end for _, end in bounds], dtype='datetime64[ns]')
+    starts = np.searchsorted(dates, start_dates, side='left')
+    # Chu kỳ kết thúc sau nến cuối của df (df bị cắt) chưa được xác nhận ở phiên nào
+    ends = np.where(end_dates > dates[-1], n, np.searchsorted(dates, end_dates, side='right') - 1)
+    
+    # Chu kỳ đầu tiên kết thúc sau t; từ nến đầu của nó trở đi phải quét lại
+    first_open = np.searchsorted(ends, positions, side='right')
+    cuts = np.where(first_open < len(bounds), np.append(starts, n)[first_open], n)
+    cuts = np.minimum(cuts, positions + 1)
+    
+    closes = df['Close'].to_numpy(dtype='float64')
+    tails = [
+        [(start, end - 1, trend) for start, end, trend, _ in _scan_trend_windows(closes, up_threshold, cut, t + 1)]
+        if cut <= t - 6 else []
+        for t, cut in enumerate(cuts.tolist())
+    ]
+    return cuts, tails
+
+def parse_trend_periods(trends: List[Dict]) -> List[Tuple[pd.Timestamp, pd.Timestamp]]:
+    """
+    Chuyển chuỗi 'period' của các xu hướng về (ngày bắt đầu, ngày kết thúc)
+    
+    Parse toàn bộ trong một lần gọi pd.to_datetime thay vì parse lại cho từng dòng dữ liệu.
+    
+    Args:
+        trends: Danh sách xu hướng từ calculate_trend
+        
+    Returns:
+        List tuple (start, end) theo cùng thứ tự với trends
+    """
+    if not trends:
+        return []
+    bounds = [part for trend in trends for part in trend['period'].split(' to ')]
+    parsed = pd.to_datetime(bounds, format=DISPLAY_DATE_FORMAT)
+    return list(zip(parsed[0::2], parsed[1::2]))
 
 def get_trend_summary(trends: List[Dict]) -> Dict:
     """Tạo tóm tắt xu hướng"""
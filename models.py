@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 class CandleData(BaseModel):
     dates: List[str]
@@ -33,11 +33,59 @@ class ChartRequest(BaseModel):
     highlight_long_legged_doji: bool = False
     highlight_dragonfly_doji: bool = False
     highlight_gravestone_doji: bool = False
+    
+    timeframe: str = "D"  # Khung thời gian nến: D (ngày), W (tuần), M (tháng)
 
 class PredictRequest(BaseModel):
     symbol: str
     range: str = "unknown"
     endDate: Optional[str] = None
+    timeframe: str = "D"  # D (ngày), W (tuần), M (tháng)
+    timing: bool = False  # Trả về wall time của từng analyzer (timing_ms)
+    analyzers: Optional[List[str]] = None  # Chỉ chạy các analyzer này (mặc định tất cả: RSI, Candle, MA, MACD, BB)
+    detail: str = "full"  # full (tín hiệu kèm reason), statements (statement từng analyzer), final (chỉ final_statement)
+
+class PredictLatestRequest(BaseModel):
+    symbol: str
+    range: str = "unknown"
+    endDate: Optional[str] = None
+    timeframe: str = "D"
+    analyzers: Optional[List[str]] = None
+    since: Optional[str] = None  # Ngày nến cuối đã xử lý (YYYY-MM-DD); mặc định theo trạng thái lần gọi trước
+
+class PredictBatchRequest(BaseModel):
+    items: List[PredictRequest]  # Mỗi phần tử như một request /predict
+
+class AnalyzeRequest(ChartRequest):
+    # Biểu đồ và dự đoán dùng chung cửa sổ theo range/endDate/timeframe (startDate không dùng)
+    range: str = "unknown"
+    analyzers: Optional[List[str]] = None
+    detail: str = "full"
+    markers: bool = True  # Vẽ marker BUY/SELL của các analyzer lên biểu đồ giá
+
+class SignalHistoryRequest(BaseModel):
+    symbol: str
+    startDate: Optional[str] = None  # YYYY-MM-DD (mặc định: từ đầu lịch sử)
+    endDate: Optional[str] = None  # YYYY-MM-DD (mặc định: đến nến mới nhất)
+    analyzers: Optional[List[str]] = None  # Mặc định tất cả analyzer
+    action: Optional[str] = None  # Chỉ lấy BUY hoặc SELL
+    limit: Optional[int] = None  # Chỉ lấy limit tín hiệu gần nhất
+
+class ScreenRequest(BaseModel):
+    range: str = "short"  # Cửa sổ như /predict: short (60 nến) hoặc long (180 nến)
+    endDate: Optional[str] = None  # Phiên cần lọc (mặc định phiên gần nhất)
+    exchanges: Optional[List[str]] = None  # Mặc định HSX, HNX, UPCOM
+    analyzers: Optional[List[str]] = None
+    final_statement: Optional[str] = None  # Lọc theo BUY/SELL/HOLD
+    statements: Optional[Dict[str, str]] = None  # Lọc theo statement của analyzer, ví dụ {"RSI": "BUY"}
+    events: Optional[List[str]] = None  # Sự kiện ở phiên cuối, ví dụ ["rsi_oversold"]
+    limit: Optional[int] = None
+
+class WatchlistRequest(BaseModel):
+    symbols: List[str]  # Các mã trong watchlist
+    range: str = "short"  # Cửa sổ như /predict: short (60 nến) hoặc long (180 nến)
+    endDate: Optional[str] = None
+    analyzers: Optional[List[str]] = None
 
 class ChartConfig(BaseModel):
     show_ma: bool = False
@@ -64,3 +112,4 @@ class ChartConfig(BaseModel):
     symbol: str
     start_date: str
     end_date: str
+    timeframe: str = "D"
@@ -19,4 +19,26 @@ def add_resistance_trace(fig, df, row=1, col=1):
                       '<extra></extra>'
     ), row=row, col=col)
     
+    # Các mức kháng cự xa hơn (nếu có) - nét mảnh hơn
+    level_columns = sorted(
+        (column for column in df.columns if column.startswith('Resistance_')),
+        key=lambda column: int(column.split('_')[1])
+    )
+    for column in level_columns:
+        fig.add_trace(go.Scatter(
+            x=df['Date'],
+            y=df[column],
+            mode='lines',
+            name=f"Resistance {column.split('_')[1]}",
+            line=dict(
+                color='red',
+                width=1,
+                dash='dot'
+            ),
+            hovertemplate=f'<b>Resistance {column.split("_")[1]}</b><br>' +
+                          'Date: %{x}<br>' +
+                          'Level: %{y:.2f}<br>' +
+                          '<extra></extra>'
+        ), row=row, col=col)
+    
     return fig
\ No newline at end of file
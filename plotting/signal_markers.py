@@ -0,0 +1,65 @@
+import plotly.graph_objects as go
+import sys
+import os
+
+# Thêm parent directory vào path để import
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from prediction.signals import signal_dicts
+
+# Cấu hình marker cho tín hiệu BUY (dưới nến) và SELL (trên nến)
+SIGNAL_MARKER_CONFIGS = {
+    "BUY": {"symbol": "triangle-up", "color": "#00E676", "column": "Low", "offset": 0.985},
+    "SELL": {"symbol": "triangle-down", "color": "#FF5252", "column": "High", "offset": 1.015},
+}
+
+
+def add_signal_markers(fig, df, signals, row=1, col=1):
+    """
+    Thêm marker BUY/SELL của các analyzer lên biểu đồ giá
+
+    Args:
+        fig: Plotly figure object
+        df: DataFrame đã format Date sang chuỗi hiển thị (plot_df)
+        signals: Dict {tên analyzer: tín hiệu} (SignalArray hoặc list dict) đã tính khi predict
+        row, col: Vị trí subplot giá
+
+    Returns:
+        (fig, số nến có marker); tín hiệu theo kỳ (nhãn không phải ngày của nến) được bỏ qua
+    """
+    positions = {date: i for i, date in enumerate(df['Date'])}
+    # (vị trí nến, action) -> các analyzer cho tín hiệu đó
+    marked = {}
+    for name, analyzer_signals in signals.items():
+        for signal in signal_dicts(analyzer_signals, include_reason=False):
+            position = positions.get(signal.get('date'))
+            action = signal.get('action')
+            if position is None or action not in SIGNAL_MARKER_CONFIGS:
+                continue
+            analyzers = marked.setdefault((position, action), [])
+            if name not in analyzers:
+                analyzers.append(name)
+
+    for action, marker_config in SIGNAL_MARKER_CONFIGS.items():
+        points = sorted((position, names) for (position, marker_action), names in marked.items()
+                        if marker_action == action)
+        if not points:
+            continue
+        prices = df[marker_config["column"]].to_numpy()
+        dates = [df['Date'].iloc[position] for position, _ in points]
+        fig.add_trace(go.Scatter(
+            x=dates,
+            y=[prices[position] * marker_config["offset"] for position, _ in points],
+            mode='markers',
+            name=f"{action} signal",
+            marker=dict(
+                symbol=marker_config["symbol"],
+                size=9,
+                color=marker_config["color"],
+                line=dict(color='white', width=1)
+            ),
+            hoverinfo='text',
+            hovertext=[f"{action}<br>Date: {date}<br>{', '.join(names)}" for date, (_, names) in zip(dates, points)],
+            legendgroup=f"{action}_signal"
+        ), row=row, col=col)
+
+    return fig, len({position for position, _ in marked})
@@ -1,6 +1,7 @@
 """
 Phân tích tín hiệu từ Bollinger Bands
 """
+import numpy as np
 import pandas as pd
 import sys
 import os
@@ -8,9 +9,71 @@ import os
 # Thêm parent directory vào path để import
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from indicators.bollinger_bands import calculate_bollinger_bands
+from prediction.vectorized import first_rule, volume_filter_ratio, rolling_mean, bar_positions
+from prediction.signals import SignalArray, empty_signals, signals_at
 
+LOW_VOLUME_RATIO = 0.5  # Volume thấp hơn 50% trung bình → tín hiệu nhiễu
 
-def analyze_bb_signals(df: pd.DataFrame) -> list:
+# Các luật tạo tín hiệu BUY/SELL theo thứ tự ưu tiên: (action, mẫu reason)
+BB_SIGNAL_RULES = [
+    ("BUY", "Close price ({close:.2f}) below lower BB ({lower:.2f}) - buy signal"),
+    ("SELL", "Close price ({close:.2f}) above upper BB ({upper:.2f}) - sell signal"),
+]
+
+
+def _format_bb_reason(rule: int, close_current: float, bb_upper: float, bb_lower: float) -> str:
+    return BB_SIGNAL_RULES[rule][1].format(close=close_current, upper=bb_upper, lower=bb_lower)
+
+
+def _bb_position(close_current: float, bb_upper: float, bb_lower: float) -> float:
+    """Vị trí giá trong dải BB (0 = lower band, 1 = upper band)"""
+    if bb_upper == bb_lower:
+        return 0.5
+    return (close_current - bb_lower) / (bb_upper - bb_lower)
+
+
+def scan_bb_rules(close: np.ndarray, bb_upper: np.ndarray, bb_lower: np.ndarray,
+                  volume: np.ndarray, volume_avg: np.ndarray, group_ids=None,
+                  low_volume_ratio: float = LOW_VOLUME_RATIO) -> np.ndarray:
+    """
+    Quét Bollinger Bands bằng mặt nạ mảng, tương đương gọi analyze_bb_position_signal cho từng nến
+    (bỏ qua nến đầu tiên của mỗi mã như vòng lặp cũ)
+    
+    Args:
+        close: Mảng giá đóng cửa
+        bb_upper, bb_lower: Mảng dải trên / dải dưới
+        volume: Mảng volume
+        volume_avg: Mảng volume trung bình 20 phiên
+        group_ids: Mã của từng dòng khi quét nhiều mã một lúc (panel mode, screener)
+        low_volume_ratio: Ngưỡng volume thấp (mặc định LOW_VOLUME_RATIO)
+    
+    Returns:
+        Mảng chỉ số luật trong BB_SIGNAL_RULES tại mỗi nến (-1 = HOLD)
+    """
+    close = np.asarray(close, dtype='float64')
+    bb_upper = np.asarray(bb_upper, dtype='float64')
+    bb_lower = np.asarray(bb_lower, dtype='float64')
+    
+    # Volume thấp hoặc thiếu dữ liệu BB thì là HOLD
+    active = (
+        (bar_positions(len(close), group_ids) >= 1)
+        & ~(volume_filter_ratio(volume, volume_avg) < low_volume_ratio)
+    )
+    for values in (close, bb_upper, bb_lower):
+        active &= (values != 0) & ~np.isnan(values)
+    
+    return first_rule([
+        active & (close < bb_lower),
+        active & (close > bb_upper),
+    ])
+
+
+def bb_signal_reason(rule: int, params) -> str:
+    """Reason của tín hiệu BB (params: [giá đóng cửa, dải trên, dải dưới])"""
+    return _format_bb_reason(rule, params[0], params[1], params[2])
+
+
+def analyze_bb_signals(df: pd.DataFrame) -> SignalArray:
     """
     Phân tích tín hiệu giao dịch từ Bollinger Bands theo thuật toán:
     - Giá close chạm/cắt xuống dải dưới → BUY
@@ -21,72 +84,37 @@ def analyze_bb_signals(df: pd.DataFrame) -> list:
         df: DataFrame chứa dữ liệu OHLC
     
     Returns:
-        List tín hiệu từ Bollinger Bands analysis
+        SignalArray tín hiệu từ Bollinger Bands analysis (params: giá đóng cửa, dải trên, dải dưới)
     """
-    bb_signals = []
-    
     if df is None or len(df) == 0:
-        return bb_signals
+        return empty_signals(bb_signal_reason, params=3)
     
-    # Tính Bollinger Bands cho DataFrame
-    df_with_bb = calculate_bollinger_bands(df)
+    # Tính Bollinger Bands cho DataFrame (dùng lại cột đã tính sẵn nếu có)
+    has_bb = all(column in df.columns for column in ['BB_Upper', 'BB_Lower', 'BB_Middle'])
+    df_with_bb = df if has_bb else calculate_bollinger_bands(df)
     
     if df_with_bb is None or len(df_with_bb) == 0:
-        return bb_signals
-    
-    # Tạo copy của DataFrame để xử lý
-    df_processed = df_with_bb.copy()
+        return empty_signals(bb_signal_reason, params=3)
     
     # Tính toán Average Volume của 20 ngày gần nhất
-    if 'Volume_MA20' not in df_processed.columns:
-        df_processed['Volume_MA20'] = df_processed['Volume'].rolling(window=20, min_periods=1).mean()
-    
-    # Chuyển đổi Date nếu cần
-    if 'Date' in df_processed.columns and df_processed['Date'].dtype == 'object':
-        df_processed['Date'] = pd.to_datetime(df_processed['Date'], format='%d/%m/%Y')
-    
-    # Phân tích từng điểm dữ liệu (cần ít nhất 1 điểm trước để so sánh)
-    for i in range(1, len(df_processed)):
-        current_row = df_processed.iloc[i]
-        prev_row = df_processed.iloc[i-1]
-        
-        date = current_row.get('Date', f"Position {i}")
-        close_current = current_row.get('Close', 0)
-        close_prev = prev_row.get('Close', 0)
-        bb_upper_current = current_row.get('BB_Upper', 0)
-        bb_lower_current = current_row.get('BB_Lower', 0)
-        bb_middle_current = current_row.get('BB_Middle', 0)
-        volume_current = current_row.get('Volume', 0)
-        volume_avg = current_row.get('Volume_MA20', 0)
-        
-        # Phân tích tín hiệu Bollinger Bands
-        signal = analyze_bb_position_signal(
-            close_current=close_current,
-            close_prev=close_prev,
-            bb_upper=bb_upper_current,
-            bb_lower=bb_lower_current,
-            bb_middle=bb_middle_current,
-            volume_current=volume_current,
-            volume_avg=volume_avg
-        )
-        
-        # Chỉ thêm tín hiệu nếu không phải HOLD
-        if signal['action'] != 'HOLD':
-            signal_data = {
-                "date": date.strftime('%d/%m/%Y') if hasattr(date, 'strftime') else str(date),
-                "action": signal['action'],
-                "reason": signal['reason'],
-                "close_price": round(close_current, 2),
-                "bb_upper": round(bb_upper_current, 2),
-                "bb_lower": round(bb_lower_current, 2),
-                "bb_middle": round(bb_middle_current, 2),
-                "bb_position": signal.get('bb_position', 0),
-                "volume_ratio": round(volume_current / volume_avg, 2) if volume_avg > 0 else 0,
-                "signal_type": "bb_analysis"
-            }
-            bb_signals.append(signal_data)
-    
-    return bb_signals
+    volume = df_with_bb['Volume'].to_numpy()
+    if 'Volume_MA20' in df_with_bb.columns:
+        volume_ma20 = df_with_bb['Volume_MA20'].to_numpy()
+    else:
+        volume_ma20 = rolling_mean(volume, window=20, min_periods=1)
+    
+    close_values = df_with_bb['Close'].to_numpy()
+    upper_values = df_with_bb['BB_Upper'].to_numpy()
+    lower_values = df_with_bb['BB_Lower'].to_numpy()
+    
+    # Quét tất cả các nến một lần, chỉ giữ lại chỉ số luật và giá của các nến có tín hiệu
+    rules = scan_bb_rules(close_values, upper_values, lower_values, volume, volume_ma20)
+    positions = np.flatnonzero(rules >= 0)
+    params = np.column_stack([close_values[positions], upper_values[positions], lower_values[positions]])
+    return signals_at(
+        df_with_bb, positions, rules[positions], [action for action, _ in BB_SIGNAL_RULES],
+        params, bb_signal_reason
+    )
 
 
 def analyze_bb_position_signal(close_current: float, close_prev: float,
@@ -115,7 +143,7 @@ def analyze_bb_position_signal(close_current: float, close_prev: float,
     # Kiểm tra volume trước - nếu thấp thì tất cả là HOLD
     volume_ratio = volume_current / volume_avg if volume_avg > 0 else 1
     
-    if volume_ratio < 0.5:  # Volume thấp hơn 50% trung bình
+    if volume_ratio < LOW_VOLUME_RATIO:  # Volume thấp hơn 50% trung bình
         return {
             "action": "HOLD",
             "reason": f"Very low volume ({volume_ratio:.2f}x avg) - BB signal may be unreliable"
@@ -129,17 +157,14 @@ def analyze_bb_position_signal(close_current: float, close_prev: float,
         }
     
     # Tính toán vị trí trong dải BB (0 = lower band, 1 = upper band)
-    if bb_upper == bb_lower:
-        bb_position = 0.5
-    else:
-        bb_position = (close_current - bb_lower) / (bb_upper - bb_lower)
+    bb_position = _bb_position(close_current, bb_upper, bb_lower)
 
     # === PHÂN TÍCH TÍN HIỆU BOLLINGER BANDS ===
     # 1. Giá đóng cửa < Lower Band → MUA
     if close_current < bb_lower:
         return {
             "action": "BUY",
-            "reason": f"Close price ({close_current:.2f}) below lower BB ({bb_lower:.2f}) - buy signal",
+            "reason": _format_bb_reason(0, close_current, bb_upper, bb_lower),
             "bb_position": bb_position
         }
     
@@ -147,7 +172,7 @@ def analyze_bb_position_signal(close_current: float, close_prev: float,
     elif close_current > bb_upper:
         return {
             "action": "SELL",
-            "reason": f"Close price ({close_current:.2f}) above upper BB ({bb_upper:.2f}) - sell signal",
+            "reason": _format_bb_reason(1, close_current, bb_upper, bb_lower),
             "bb_position": bb_position
         }
     
@@ -1,6 +1,7 @@
 """
 Phân tích tín hiệu từ Candlestick Patterns
 """
+import numpy as np
 import pandas as pd
 import sys
 import os
@@ -8,160 +9,379 @@ import os
 # Thêm parent directory vào path để import
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from indicators.candle_patterns import classify_candle_pattern
+from indicators.trend_analysis import parse_trend_periods
+from prediction.signals import SignalArray, empty_signals, signals_at, concat_signals
 
+# Các pattern đặc biệt được đưa vào kết quả phân tích
+SPECIAL_PATTERNS = ['Hammer', 'Inverted Hammer', 'Hanging Man', 'Shooting Star',
+                    'Star Doji', 'Long Legged Doji', 'Dragonfly Doji', 'Gravestone Doji', 'Marubozu']
 
-def analyze_candle_signals(df: pd.DataFrame, trends: list, exchange: str) -> list:
+# Bảng tín hiệu pattern x ngữ cảnh: (action, strength, reason)
+# Ngữ cảnh là xu hướng ('uptrend'/'downtrend'), với Star Doji là xu hướng đã được nến sau xác nhận,
+# với Marubozu là màu nến ('green'/'red'); None là tín hiệu mặc định của pattern
+CANDLE_SIGNAL_TABLE = {
+    'Standard': {
+        None: ("HOLD", 0, "Standard candle - no special signal"),
+    },
+    'Hammer': {
+        'downtrend': ("BUY", 3, "Hammer pattern in downtrend suggests bullish reversal"),
+        None: ("HOLD", 0, "Hammer needs downtrend for reversal signal"),
+    },
+    'Inverted Hammer': {
+        'downtrend': ("BUY", 2, "Inverted Hammer in downtrend suggests potential bullish reversal"),
+        None: ("HOLD", 0, "Inverted Hammer needs downtrend for reversal signal"),
+    },
+    'Hanging Man': {
+        None: ("SELL", -3, "Hanging Man pattern in uptrend suggests bearish reversal"),
+    },
+    'Shooting Star': {
+        None: ("SELL", -3, "Shooting Star pattern in uptrend suggests bearish reversal"),
+    },
+    'Star Doji': {
+        'uptrend': ("SELL", -3, "Star Doji with confirmation: Star Doji in uptrend confirmed by bearish candle"),
+        'downtrend': ("BUY", 3, "Star Doji with confirmation: Star Doji in downtrend confirmed by bullish candle"),
+        None: ("HOLD", 0, "Star Doji needs confirmation from next candle"),
+    },
+    'Long Legged Doji': {
+        'uptrend': ("SELL", -2, "Long Legged Doji in uptrend suggests potential reversal to downside"),
+        'downtrend': ("BUY", 2, "Long Legged Doji in downtrend suggests potential reversal to upside"),
+        None: ("HOLD", 0, "Long Legged Doji needs clear trend for reversal signal"),
+    },
+    'Dragonfly Doji': {
+        None: ("BUY", 3, "Dragonfly Doji in downtrend suggests bullish reversal"),
+    },
+    'Gravestone Doji': {
+        None: ("SELL", -3, "Gravestone Doji in uptrend suggests bearish reversal"),
+    },
+    'Marubozu': {
+        'green': ("BUY", 4, "Green Marubozu with {movement:.1f}% bullish movement"),
+        'red': ("SELL", -4, "Red Marubozu with {movement:.1f}% bearish movement"),
+    },
+}
+
+_TABLE_PATTERNS = list(CANDLE_SIGNAL_TABLE)
+_TABLE_CONTEXTS = [None, 'uptrend', 'downtrend', 'green', 'red']
+
+
+def _build_entry_lookup():
     """
-    Phân tích tín hiệu giao dịch từ các pattern nến
+    Trải phẳng bảng tín hiệu thành danh sách entry và ma trận (pattern x ngữ cảnh) → chỉ số entry
+    (ngữ cảnh không có trong bảng dùng entry mặc định None của pattern, -1 nếu không có)
+    """
+    entries = []
+    lookup = np.full((len(_TABLE_PATTERNS), len(_TABLE_CONTEXTS)), -1)
+    for p, contexts in enumerate(CANDLE_SIGNAL_TABLE.values()):
+        offsets = {context: len(entries) + k for k, context in enumerate(contexts)}
+        entries.extend(contexts.values())
+        for c, context in enumerate(_TABLE_CONTEXTS):
+            lookup[p, c] = offsets.get(context, offsets.get(None, -1))
+    return entries, lookup
+
+
+_TABLE_ENTRIES, _ENTRY_LOOKUP = _build_entry_lookup()
+_ENTRY_STRENGTH = np.array([strength for _, strength, _ in _TABLE_ENTRIES])
+# Action / strength của từng entry theo chỉ số trả về bởi scan_candle_signals
+CANDLE_ENTRY_ACTIONS = [action for action, _, _ in _TABLE_ENTRIES]
+CANDLE_ENTRY_STRENGTHS = [strength for _, strength, _ in _TABLE_ENTRIES]
+# Mã ổn định của từng entry ("pattern:ngữ cảnh"), dùng cho lịch sử tín hiệu
+CANDLE_ENTRY_CODES = [
+    f"{pattern}:{context or 'default'}" for pattern, contexts in CANDLE_SIGNAL_TABLE.items() for context in contexts
+]
+_ENTRY_PATTERNS = [pattern for pattern, contexts in CANDLE_SIGNAL_TABLE.items() for _ in contexts]
+
+# Tín hiệu gộp của một trend period trong SignalArray (rule >= 0 là entry của một nến)
+CANDLE_PERIOD_RULE = -1
+# Số tín hiệu thành phần đưa vào reason của tín hiệu gộp
+CANDLE_REASON_MEMBERS = 3
+# params: [ngữ cảnh xu hướng, strength, (entry, % thân nến) của tối đa CANDLE_REASON_MEMBERS nến]
+_CANDLE_PARAMS = 2 + 2 * CANDLE_REASON_MEMBERS
+
+
+def _entry_reason(entry: int, movement: float) -> str:
+    """Reason của một entry (reason của Marubozu được format theo % thân nến)"""
+    reason = _TABLE_ENTRIES[entry][2]
+    if _ENTRY_PATTERNS[entry] == 'Marubozu':
+        reason = reason.format(movement=movement)
+    return reason
+
+
+def candle_signal_reason(rule: int, params) -> str:
+    """Reason của tín hiệu nến (một nến) hoặc tín hiệu gộp theo trend period"""
+    if rule != CANDLE_PERIOD_RULE:
+        return _entry_reason(rule, params[3])
+    parts = []
+    for k in range(CANDLE_REASON_MEMBERS):
+        entry = params[2 + 2 * k]
+        if np.isnan(entry):
+            break
+        parts.append(f"{_entry_reason(int(entry), params[3 + 2 * k])} (strength = {_TABLE_ENTRIES[int(entry)][1]})")
+    trend_type = _TABLE_CONTEXTS[int(params[0])]
+    return f"Signals in {trend_type} (strength: {int(params[1])}): " + "; ".join(parts)
+
+
+def candle_signal_code(rule: int, params) -> str:
+    """Mã ổn định: "pattern:ngữ cảnh" của entry, "period:<xu hướng>" với tín hiệu gộp"""
+    if rule == CANDLE_PERIOD_RULE:
+        return f"period:{_TABLE_CONTEXTS[int(params[0])]}"
+    return CANDLE_ENTRY_CODES[rule]
+
+
+def _trend_codes(trend_contexts: np.ndarray) -> np.ndarray:
+    """Chỉ số ngữ cảnh xu hướng trong _TABLE_CONTEXTS (0 = không có xu hướng)"""
+    return np.select([trend_contexts == 'uptrend', trend_contexts == 'downtrend'], [1, 2], default=0)
+
+
+def _body_movements(open_prices: np.ndarray, close_prices: np.ndarray) -> np.ndarray:
+    """% thân nến so với giá mở cửa (dùng trong reason của Marubozu)"""
+    open_prices = np.asarray(open_prices, dtype='float64')
+    close_prices = np.asarray(close_prices, dtype='float64')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.abs((close_prices - open_prices) / open_prices) * 100
+
+
+def _bar_params(entries: np.ndarray, trend_codes: np.ndarray, movements: np.ndarray) -> np.ndarray:
+    """params của tín hiệu một nến"""
+    params = np.full((len(entries), _CANDLE_PARAMS), np.nan)
+    params[:, 0] = trend_codes
+    params[:, 1] = _ENTRY_STRENGTH[entries]
+    params[:, 2] = entries
+    params[:, 3] = movements
+    return params
+
+
+def lookup_candle_signal(pattern: str, context: str = None) -> dict:
+    """
+    Tra bảng CANDLE_SIGNAL_TABLE cho một pattern trong một ngữ cảnh
+    
+    Returns:
+        Dict chứa action, reason (mẫu chưa format với Marubozu), strength
+    """
+    contexts = CANDLE_SIGNAL_TABLE.get(pattern)
+    if contexts is None:
+        return {"action": "HOLD", "reason": f"Unknown pattern: {pattern}", "strength": 0}
+    action, strength, reason = contexts.get(context, contexts.get(None))
+    return {"action": action, "reason": reason, "strength": strength}
+
+
+def scan_candle_signals(patterns: np.ndarray, trends: np.ndarray,
+                        open_prices: np.ndarray, close_prices: np.ndarray, group_ids=None) -> np.ndarray:
+    """
+    Gán tín hiệu cho toàn bộ các nến bằng bảng pattern x ngữ cảnh, tương đương gọi
+    analyze_position_signal cho từng nến
+    
+    Star Doji được xác nhận bằng mảng dịch của nến kế tiếp (theo vị trí): nến sau giảm
+    trong uptrend hoặc nến sau tăng trong downtrend.
     
     Args:
-        df: DataFrame chứa dữ liệu OHLC
-        trends: Danh sách xu hướng
-        exchange: Sàn giao dịch để xác định ngưỡng Marubozu (HSX/HNX/UPCOM)
+        patterns: Mảng tên pattern
+        trends: Mảng xu hướng (trend_context)
+        open_prices, close_prices: Mảng giá mở / đóng cửa
+        group_ids: Mã của từng dòng khi quét nhiều mã một lúc (nến cuối của mỗi mã không có nến xác nhận)
     
     Returns:
-        List tín hiệu từ candle patterns
+        Mảng chỉ số entry trong bảng tại mỗi nến (-1 = pattern không có trong bảng)
+    """
+    patterns = np.asarray(patterns, dtype=object)
+    trends = np.asarray(trends, dtype=object)
+    open_prices = np.asarray(open_prices, dtype='float64')
+    close_prices = np.asarray(close_prices, dtype='float64')
+    
+    pattern_codes = pd.Categorical(patterns, categories=_TABLE_PATTERNS).codes
+    trend_codes = np.select([trends == 'uptrend', trends == 'downtrend'], [1, 2], default=0)
+    
+    # Nến kế tiếp để xác nhận Star Doji (nến cuối không có nến xác nhận)
+    next_open = np.full(len(patterns), np.nan)
+    next_close = np.full(len(patterns), np.nan)
+    next_open[:-1] = open_prices[1:]
+    next_close[:-1] = close_prices[1:]
+    if group_ids is not None and len(patterns) > 1:
+        groups = np.asarray(group_ids)
+        crossed = np.append(groups[1:] != groups[:-1], True)
+        next_open[crossed] = np.nan
+        next_close[crossed] = np.nan
+    confirmed = (
+        ((trend_codes == 1) & (next_close < next_open))
+        | ((trend_codes == 2) & (next_close > next_open))
+    )
+    
+    is_marubozu = patterns == 'Marubozu'
+    contexts = np.select(
+        [
+            is_marubozu & (close_prices > open_prices),
+            is_marubozu,
+            (patterns == 'Star Doji') & ~confirmed,
+        ],
+        [3, 4, 0],
+        default=trend_codes
+    )
+    return np.where(pattern_codes >= 0, _ENTRY_LOOKUP[pattern_codes, contexts], -1)
+
+
+def select_candle_signals(patterns: np.ndarray, trends: np.ndarray) -> np.ndarray:
+    """Mặt nạ các nến được đưa vào kết quả: pattern đặc biệt VÀ có trend rõ ràng (trừ Marubozu)"""
+    patterns = np.asarray(patterns, dtype=object)
+    has_trend = np.array([trend is not None for trend in trends], dtype=bool)
+    return np.isin(patterns, SPECIAL_PATTERNS) & (has_trend | (patterns == 'Marubozu'))
+
+
+def candle_bar_signals(df: pd.DataFrame, positions) -> SignalArray:
     """
-    candle_signals = []
+    Tín hiệu nến của từng nến tại các vị trí cho trước, không gộp theo trend period
+    
+    Dùng cho chế độ chỉ phân tích nến mới (prediction/incremental.py); df phải có sẵn nhãn
+    candle_pattern / trend_context (feature store hoặc classify_candle_pattern).
     
+    Args:
+        df: DataFrame đã có nhãn nến (thường chỉ là phần cuối của cửa sổ)
+        positions: Vị trí các nến cần lấy tín hiệu
+    
+    Returns:
+        SignalArray tín hiệu (strength của entry) theo thứ tự vị trí
+    """
     if df is None or len(df) == 0:
-        return candle_signals
+        return empty_signals(candle_signal_reason, candle_signal_code, params=_CANDLE_PARAMS)
+    patterns = df['candle_pattern'].astype(object).to_numpy()
+    trend_contexts = df['trend_context'].astype(object).to_numpy()
+    open_prices = df['Open'].to_numpy()
+    close_prices = df['Close'].to_numpy()
+    entries = scan_candle_signals(patterns, trend_contexts, open_prices, close_prices)
+    selected = select_candle_signals(patterns, trend_contexts)
+    rows = np.array([i for i in sorted(positions) if selected[i] and entries[i] >= 0], dtype=np.int64)
+    row_entries = entries[rows]
+    params = _bar_params(row_entries, _trend_codes(trend_contexts[rows]),
+                         _body_movements(open_prices[rows], close_prices[rows]))
+    return signals_at(df, rows, row_entries, CANDLE_ENTRY_ACTIONS, params,
+                      candle_signal_reason, candle_signal_code, strengths=_ENTRY_STRENGTH[row_entries])
+
+
+def candle_signal_counts(df: pd.DataFrame, trends: list) -> tuple:
+    """
+    Số tín hiệu BUY/SELL trong kết quả của analyze_candle_signals mà không dựng danh sách tín hiệu
     
-    # Gọi classify_candle_pattern trực tiếp để phân tích patterns với exchange
-    df_with_patterns = classify_candle_pattern(df, exchange, trends)
+    Tín hiệu trong cùng trend period được gộp thành một (dấu của tổng strength), tín hiệu
+    ngoài period được đếm riêng; df phải có sẵn nhãn candle_pattern / trend_context / trend_period.
     
-    if df_with_patterns is None or len(df_with_patterns) == 0:
-        return candle_signals
+    Returns:
+        Tuple (buy_count, sell_count)
+    """
+    if df is None or len(df) == 0:
+        return 0, 0
+    patterns = df['candle_pattern'].astype(object).to_numpy()
+    trend_contexts = df['trend_context'].astype(object).to_numpy()
+    periods = df['trend_period'].astype(object).to_numpy() if 'trend_period' in df.columns \
+        else np.full(len(df), None, dtype=object)
+    entries = scan_candle_signals(patterns, trend_contexts, df['Open'], df['Close'])
+    selected = select_candle_signals(patterns, trend_contexts) & (entries >= 0)
+    
+    grouped = selected & np.array(
+        [bool(trends) and bool(trend) and bool(period) for trend, period in zip(trend_contexts, periods)], dtype=bool
+    )
+    alone = entries[selected & ~grouped]
+    alone_actions = np.array(CANDLE_ENTRY_ACTIONS, dtype=object)[alone]
+    buy = int(np.sum(alone_actions == 'BUY'))
+    sell = int(np.sum(alone_actions == 'SELL'))
+    if grouped.any():
+        totals = pd.Series(_ENTRY_STRENGTH[entries[grouped]]).groupby(periods[grouped], sort=False).sum()
+        buy += int((totals > 0).sum())
+        sell += int((totals < 0).sum())
+    return buy, sell
+
+
+def analyze_candle_signals(df: pd.DataFrame, trends: list, exchange: str) -> SignalArray:
+    """
+    Phân tích tín hiệu giao dịch từ các pattern nến
     
-    # Chuyển đổi DataFrame để dễ xử lý
-    df_processed = df_with_patterns.copy()
-    if 'Date' in df_processed.columns and df_processed['Date'].dtype == 'object':
-        df_processed['Date'] = pd.to_datetime(df_processed['Date'], format='%d/%m/%Y')
+    Action và strength của mọi nến được tra bảng một lần (scan_candle_signals), strength
+    của từng trend period được cộng dồn theo nhóm.
     
-    # Nhóm các tín hiệu theo trend period để tổng hợp strength
-    trend_signals = {}
+    Args:
+        df: DataFrame chứa dữ liệu OHLC
+        trends: Danh sách xu hướng
+        exchange: Sàn giao dịch để xác định ngưỡng Marubozu (HSX/HNX/UPCOM)
     
-    # Phân tích từng vị trí trong DataFrame
-    for i, row in df_processed.iterrows():
-        position_date = row.get('Date', f"Position {i}")
-        pattern = row.get('candle_pattern', 'Standard')
-        close_price = row.get('Close', 0)
-        # Lấy trend trực tiếp từ trường trend_context đã được phân loại
-        current_trend = row.get('trend_context', None)
-        trend_period = None
-        # Nếu có danh sách trends, xác định period cho thống kê
-        if trends and current_trend:
-            for trend in trends:
-                trend_start = pd.to_datetime(trend['period'].split(' to ')[0], format='%d/%m/%Y')
-                trend_end = pd.to_datetime(trend['period'].split(' to ')[1], format='%d/%m/%Y')
-                if isinstance(position_date, str):
-                    pos_date = pd.to_datetime(position_date, format='%d/%m/%Y')
-                else:
-                    pos_date = position_date
-                if trend_start <= pos_date <= trend_end:
-                    trend_period = trend['period']
-                    break
-        # Phân tích tín hiệu tại vị trí này
-        signal = analyze_position_signal(pattern, current_trend, row, i, df_processed)
-        
-        # Chỉ xét các pattern đặc biệt và các Doji đặc biệt
-        special_patterns = ['Hammer', 'Inverted Hammer', 'Hanging Man', 'Shooting Star',
-                          'Star Doji', 'Long Legged Doji', 'Dragonfly Doji', 'Gravestone Doji', 'Marubozu']
-        
-        # Chỉ thêm vào kết quả nếu pattern đặc biệt VÀ có trend rõ ràng (trừ Marubozu)
-        if pattern in special_patterns and (current_trend is not None or pattern == 'Marubozu'):
-            signal_data = {
-                "date": position_date.strftime('%d/%m/%Y') if hasattr(position_date, 'strftime') else str(position_date),
-                "pattern": pattern,
-                "trend": current_trend,
-                "action": signal['action'],
-                "reason": signal['reason'],
-                "strength": signal['strength'],
-                "price": close_price
-            }
-            
-            # Nhóm theo trend period để tổng hợp
-            if trend_period:
-                if trend_period not in trend_signals:
-                    trend_signals[trend_period] = {
-                        'trend': current_trend,
-                        'signals': [],
-                        'total_strength': 0
-                    }
-                trend_signals[trend_period]['signals'].append(signal_data)
-                trend_signals[trend_period]['total_strength'] += signal['strength']
-            else:
-                # Marubozu không cần trend - thêm trực tiếp
-                candle_signals.append(signal_data)
-    
-    # Tổng hợp tín hiệu cho từng trend period
-    for period, trend_data in trend_signals.items():
-        total_strength = trend_data['total_strength']
-        signals = trend_data['signals']
-        trend_type = trend_data['trend']
-        
-        # Xác định tín hiệu tổng hợp
-        if total_strength > 0:
-            combined_action = "BUY"
-        elif total_strength < 0:
-            combined_action = "SELL"
-        else:
-            combined_action = "HOLD"
-        
-        # Thêm tín hiệu tổng hợp cho trend period này
-        if signals:  # Nếu có tín hiệu trong period này
-            # Tạo danh sách pattern với trend context và chi tiết
-            pattern_list = []
-            for signal in signals:
-                # Xử lý đặc biệt cho Marubozu để hiển thị Green/Red
-                if signal['pattern'] == 'Marubozu':
-                    # Xác định loại Marubozu từ action
-                    marubozu_type = "Green Marubozu" if signal['action'] == 'BUY' else "Red Marubozu"
-                    pattern_with_trend = f"{marubozu_type}"
-                else:
-                    # Các pattern khác giữ nguyên
-                    pattern_with_trend = f"{signal['pattern']}"
-                    if signal['trend']:
-                        pattern_with_trend += f" in {signal['trend']}"
-                pattern_list.append(pattern_with_trend)
-            
-            # Tạo combined pattern string
-            combined_pattern = ", ".join(pattern_list)
-            
-            # Tạo combined reason với strength chi tiết cho từng signal
-            reason_parts = []
-            for signal in signals[:3]:  # Giới hạn 3 signals đầu
-                reason_with_strength = f"{signal['reason']} (strength = {signal['strength']})"
-                reason_parts.append(reason_with_strength)
-            
-            combined_reason = f"Signals in {trend_type} (strength: {total_strength}): " + "; ".join(reason_parts)
-            
-            candle_signals.append({
-                "date": f"{period}",
-                "pattern": combined_pattern,
-                "trend": trend_type,
-                "action": combined_action,
-                "reason": combined_reason,
-                "strength": total_strength,
-                "price": signals[-1]['price'],  # Giá của tín hiệu cuối cùng
-                "individual_signals": len(signals)
-            })
-    
-    # Sắp xếp tất cả signal positions theo thời gian
-    def parse_date_for_sorting(date_str):
-        """Parse date string để sắp xếp, xử lý cả single date và period"""
-        if ' to ' in date_str:
-            # Với period, lấy ngày bắt đầu để sắp xếp
-            start_date = date_str.split(' to ')[0]
-            return pd.to_datetime(start_date, format='%d/%m/%Y')
-        else:
-            # Single date
-            return pd.to_datetime(date_str, format='%d/%m/%Y')
+    Returns:
+        SignalArray tín hiệu từ candle patterns: tín hiệu một nến (rule = entry) và tín hiệu gộp
+        của từng trend period (rule = CANDLE_PERIOD_RULE, date là chuỗi period), theo thời gian
+    """
+    if df is None or len(df) == 0:
+        return empty_signals(candle_signal_reason, candle_signal_code, params=_CANDLE_PARAMS)
     
-    # Sắp xếp candle_signals theo thời gian
-    candle_signals.sort(key=lambda x: parse_date_for_sorting(x["date"]))
+    # Gọi classify_candle_pattern trực tiếp để phân tích patterns với exchange
+    # (bỏ qua nếu nhãn đã được tính sẵn trong feature store)
+    if 'candle_pattern' in df.columns and 'trend_period' in df.columns:
+        df_with_patterns = df
+    else:
+        df_with_patterns = classify_candle_pattern(df, exchange, trends)
     
-    return candle_signals
+    if df_with_patterns is None or len(df_with_patterns) == 0:
+        return empty_signals(candle_signal_reason, candle_signal_code, params=_CANDLE_PARAMS)
+    
+    df_processed = df_with_patterns
+    length = len(df_processed)
+    
+    def column_values(column, default):
+        if column not in df_processed.columns:
+            return np.full(length, default, dtype=object)
+        return df_processed[column].astype(object).to_numpy()
+    
+    patterns = column_values('candle_pattern', 'Standard')
+    # Lấy trend trực tiếp từ trường trend_context đã được phân loại
+    trend_contexts = column_values('trend_context', None)
+    # Period đã được map sẵn trong _map_trends_to_dataframe
+    trend_periods = column_values('trend_period', None)
+    open_prices = df_processed['Open'].to_numpy() if 'Open' in df_processed.columns else np.zeros(length)
+    close_prices = df_processed['Close'].to_numpy() if 'Close' in df_processed.columns else np.zeros(length)
+    
+    entries = scan_candle_signals(patterns, trend_contexts, open_prices, close_prices)
+    
+    # Chỉ thêm vào kết quả nếu pattern đặc biệt VÀ có trend rõ ràng (trừ Marubozu)
+    rows = np.flatnonzero(select_candle_signals(patterns, trend_contexts))
+    # Nhóm theo trend period để tổng hợp; Marubozu không cần trend - giữ tín hiệu từng nến
+    grouped = np.array(
+        [bool(trends) and bool(trend_contexts[i]) and bool(trend_periods[i]) for i in rows], dtype=bool
+    )
+    trend_codes = _trend_codes(trend_contexts)
+    movements = _body_movements(open_prices, close_prices)
+    
+    alone = rows[~grouped]
+    bar_signals = signals_at(
+        df_processed, alone, entries[alone], CANDLE_ENTRY_ACTIONS,
+        _bar_params(entries[alone], trend_codes[alone], movements[alone]),
+        candle_signal_reason, candle_signal_code, strengths=_ENTRY_STRENGTH[entries[alone]]
+    )
+    
+    # Tổng strength của từng trend period (nhóm theo thứ tự xuất hiện)
+    period_rows = rows[grouped]
+    period_codes, periods = pd.factorize(trend_periods[period_rows])
+    total_strengths = np.bincount(period_codes, weights=_ENTRY_STRENGTH[entries[period_rows]],
+                                  minlength=len(periods)).astype(np.int64) if len(periods) else np.array([], dtype=np.int64)
+    
+    # Ngày bắt đầu của từng period (parse một lần cho mỗi trend) để sắp xếp
+    period_starts = {
+        trend['period']: start
+        for trend, (start, _) in zip(trends or [], parse_trend_periods(trends))
+    }
+    period_params = np.full((len(periods), _CANDLE_PARAMS), np.nan)
+    first_rows = np.zeros(len(periods), dtype=np.int64)
+    for code in range(len(periods)):
+        members = period_rows[period_codes == code]
+        first_rows[code] = members[0]
+        period_params[code, 0] = trend_codes[members[0]]
+        period_params[code, 1] = total_strengths[code]
+        # Reason gồm strength chi tiết của các tín hiệu đầu (giới hạn CANDLE_REASON_MEMBERS)
+        for k, member in enumerate(members[:CANDLE_REASON_MEMBERS]):
+            period_params[code, 2 + 2 * k] = entries[member]
+            period_params[code, 3 + 2 * k] = movements[member]
+    
+    # Xác định tín hiệu tổng hợp theo dấu của tổng strength
+    period_signals = SignalArray(
+        [period_starts[period] for period in periods], np.sign(total_strengths),
+        np.full(len(periods), CANDLE_PERIOD_RULE), period_params, candle_signal_reason, candle_signal_code,
+        strengths=total_strengths, labels=[f"{period}" for period in periods], positions=first_rows
+    )
+    
+    # Sắp xếp candle_signals theo thời gian (tín hiệu một nến trước period khi trùng ngày)
+    return concat_signals([bar_signals, period_signals], sort=True)
 
 
 def analyze_position_signal(pattern: str, trend: str, row: pd.Series, position: int, df: pd.DataFrame) -> dict:
@@ -179,128 +399,22 @@ def analyze_position_signal(pattern: str, trend: str, row: pd.Series, position:
         Dict chứa action, reason, strength
     """
     
-    if pattern == 'Standard':
-        return {
-            "action": "HOLD",
-            "reason": "Standard candle - no special signal",
-            "strength": 0
-        }
-    
-    # === REVERSAL PATTERNS ===
-    if pattern == 'Hammer':
-        if trend == 'downtrend':
-            # Hammer in downtrend = bullish reversal
-            return {
-                "action": "BUY",
-                "reason": "Hammer pattern in downtrend suggests bullish reversal",
-                "strength": 3
-            }
-        else:
-            return {"action": "HOLD", "reason": "Hammer needs downtrend for reversal signal", "strength": 0}
-    
-    elif pattern == 'Inverted Hammer':
-            if trend == 'downtrend':
-            # Inverted Hammer in downtrend = potential bullish reversal (weaker than Hammer)
-                return {
-                    "action": "BUY",
-                    "reason": "Inverted Hammer in downtrend suggests potential bullish reversal",
-                    "strength": 2
-                }
-            else: return {
-                "action": "HOLD",
-                "reason": "Inverted Hammer needs downtrend for reversal signal",
-                "strength": 0
-            }
-    elif pattern == 'Hanging Man':
-            # Hanging Man in uptrend = bearish reversal
-            return {
-                "action": "SELL",
-                "reason": "Hanging Man pattern in uptrend suggests bearish reversal",
-                "strength": -3
-            }
-    
-    elif pattern == 'Shooting Star':
-            # Shooting Star in uptrend = bearish reversal
-            return {
-                "action": "SELL",
-                "reason": "Shooting Star pattern in uptrend suggests bearish reversal",
-                "strength": -3
-            }
-    
-    # === DOJI PATTERNS ===
-    elif pattern == 'Star Doji':
-        # Star Doji cần xác nhận với nến tiếp theo
+    # Star Doji cần xác nhận với nến tiếp theo
+    if pattern == 'Star Doji':
         confirmation = check_star_doji_confirmation(position, df, trend)
-        if confirmation['confirmed']:
-            return {
-                "action": confirmation['action'],
-                "reason": f"Star Doji with confirmation: {confirmation['reason']}",
-                "strength": confirmation['strength']
-            }
-        else:
-            return {"action": "HOLD", "reason": "Star Doji needs confirmation from next candle", "strength": 0}
-    
-    elif pattern == 'Long Legged Doji':
-        if trend == 'uptrend':
-            return {
-                "action": "SELL",
-                "reason": "Long Legged Doji in uptrend suggests potential reversal to downside",
-                "strength": -2
-            }
-        elif trend == 'downtrend':
-            return {
-                "action": "BUY", 
-                "reason": "Long Legged Doji in downtrend suggests potential reversal to upside",
-                "strength": 2
-            }
-        else:
-            return {"action": "HOLD", 
-                    "reason": "Long Legged Doji needs clear trend for reversal signal", 
-                    "strength": 0}
-    
-    elif pattern == 'Dragonfly Doji':
-            return {
-                "action": "BUY",
-                "reason": "Dragonfly Doji in downtrend suggests bullish reversal",
-                "strength": 3
-            }
-    
-    elif pattern == 'Gravestone Doji':
-            return {
-                "action": "SELL",
-                "reason": "Gravestone Doji in uptrend suggests bearish reversal",
-                "strength": -3
-            }
+        return lookup_candle_signal(pattern, trend if confirmation['confirmed'] else None)
     
-    # === CONTINUATION PATTERNS ===
-    elif pattern == 'Marubozu':
-        # Marubozu không phụ thuộc vào trend - chỉ dựa vào body color
+    # Marubozu không phụ thuộc vào trend - chỉ dựa vào body color
+    if pattern == 'Marubozu':
         open_price = row.get('Open', 0)
         close_price = row.get('Close', 0)
-        
-        # Kiểm tra body movement threshold 15%
+        signal = lookup_candle_signal(pattern, 'green' if close_price > open_price else 'red')
         body_movement = abs((close_price - open_price) / open_price) * 100
-        if close_price > open_price:
-            # Green Marubozu = Bullish
-            return {
-                "action": "BUY",
-                "reason": f"Green Marubozu with {body_movement:.1f}% bullish movement",
-                "strength": 4
-            }
-        else:
-            # Red Marubozu = Bearish
-            return {
-                "action": "SELL",
-                "reason": f"Red Marubozu with {body_movement:.1f}% bearish movement",
-                "strength": -4
-            }
+        signal['reason'] = signal['reason'].format(movement=body_movement)
+        return signal
     
-    # Default case
-    return {
-        "action": "HOLD",
-        "reason": f"Unknown pattern: {pattern}",
-        "strength": 0
-    }
+    # Các pattern còn lại: tra bảng theo xu hướng
+    return lookup_candle_signal(pattern, trend)
 
 
 def check_star_doji_confirmation(position: int, df: pd.DataFrame, trend: str) -> dict:
@@ -0,0 +1,136 @@
+"""
+Chạy các analyzer song song trên executor có thể cấu hình.
+
+Các analyzer độc lập với nhau (mỗi analyzer tự copy DataFrame trước khi thêm
+cột), nên có thể chạy đồng thời; độ trễ của /predict khi đó xấp xỉ analyzer
+chậm nhất thay vì tổng của cả 5.
+
+Mỗi analyzer có thể khai báo chế độ phù hợp với nó (register_analyzer(..., executor=...)):
+"thread" cho các kernel NumPy vốn nhả GIL (cả 5 analyzer mặc định), "process" chỉ đáng dùng
+cho analyzer nặng phần Python thuần vì DataFrame phải pickle sang tiến trình khác và lần
+gọi đầu phải khởi động pool. Với chế độ "auto" mỗi analyzer chạy trên pool theo chế độ của
+nó (mặc định thread), các pool thread/process chạy đồng thời với nhau.
+
+Thời gian của mỗi analyzer được đo trong tiến trình gọi, từ lúc gửi vào pool đến khi có kết
+quả (gồm cả pickle, IPC và thời gian chờ trong hàng đợi của pool).
+
+Biến môi trường:
+- ANALYZER_EXECUTOR: "auto" (mặc định, theo chế độ khai báo của từng analyzer), hoặc một chế độ
+  chung cho mọi analyzer: "thread", "process" hay "serial" (chạy tuần tự như trước).
+- ANALYZER_WORKERS: số worker tối đa của pool (mặc định 5 - mỗi analyzer một worker).
+"""
+import os
+import time
+import threading
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Callable, Dict, Optional, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+EXECUTOR_MODES = ('serial', 'thread', 'process')
+ANALYZER_EXECUTOR = os.getenv('ANALYZER_EXECUTOR', 'auto').lower()
+# Chế độ của analyzer không khai báo executor khi chạy "auto"
+DEFAULT_ANALYZER_MODE = 'thread'
+ANALYZER_WORKERS = int(os.getenv('ANALYZER_WORKERS', '5'))
+
+# Pool dùng chung trong tiến trình theo (tên, chế độ), tạo khi cần lần đầu
+_executors: Dict[Tuple[str, str], Executor] = {}
+_executors_lock = threading.Lock()
+
+
+def normalize_executor_mode(mode: Optional[str] = None, allow_auto: bool = False) -> str:
+    """
+    Chuẩn hóa chế độ executor (mặc định theo ANALYZER_EXECUTOR), báo lỗi nếu không hỗ trợ
+
+    Args:
+        allow_auto: Chấp nhận "auto" (chỉ có nghĩa khi chạy các analyzer)
+    """
+    value = (mode or ANALYZER_EXECUTOR).strip().lower()
+    modes = EXECUTOR_MODES + ('auto',) if allow_auto else EXECUTOR_MODES
+    if value not in modes:
+        raise ValueError(f"ANALYZER_EXECUTOR '{mode or ANALYZER_EXECUTOR}' không hợp lệ. Chỉ hỗ trợ: {', '.join(modes)}")
+    return value
+
+
+def get_executor(mode: str, name: str = 'analyzer', max_workers: Optional[int] = None) -> Optional[Executor]:
+    """
+    Pool dùng chung cho chế độ thread/process (None với serial)
+
+    Args:
+        mode: "serial" / "thread" / "process"
+        name: Tên pool - mỗi tên có pool riêng (vd. "predict_batch" cho /predict/batch)
+        max_workers: Số worker khi tạo pool lần đầu (mặc định ANALYZER_WORKERS)
+    """
+    mode = normalize_executor_mode(mode)
+    if mode == 'serial':
+        return None
+    with _executors_lock:
+        executor = _executors.get((name, mode))
+        if executor is None:
+            workers = max_workers or ANALYZER_WORKERS
+            if mode == 'thread':
+                executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+            else:
+                executor = ProcessPoolExecutor(max_workers=workers)
+            _executors[(name, mode)] = executor
+    return executor
+
+
+def shutdown_executors() -> None:
+    """Đóng các pool đã tạo (dùng khi tắt server)"""
+    with _executors_lock:
+        for executor in _executors.values():
+            executor.shutdown(wait=False, cancel_futures=True)
+        _executors.clear()
+
+
+def _timed_call(func: Callable, args: tuple) -> Tuple[object, float]:
+    """Gọi func(*args) tại chỗ và đo wall time (giây)"""
+    started = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - started
+
+
+def _submit_timed(executor: Executor, func: Callable, args: tuple):
+    """Gửi func(*args) vào pool; ghi lại thời điểm gửi và thời điểm future hoàn thành trong tiến trình gọi"""
+    timing = {'submitted': time.perf_counter()}
+    future = executor.submit(func, *args)
+    future.add_done_callback(lambda _: timing.setdefault('done', time.perf_counter()))
+    return future, timing
+
+
+def run_analyzers(tasks: Dict[str, Tuple[Callable, tuple]], mode: Optional[str] = None,
+                  hints: Optional[Dict[str, Optional[str]]] = None) -> Dict[str, Tuple[object, float]]:
+    """
+    Chạy các analyzer trên executor đã cấu hình
+
+    Args:
+        tasks: {tên analyzer: (hàm, tham số)} - hàm phải ở cấp module nếu dùng process
+        mode: "auto" / "serial" / "thread" / "process" (mặc định theo ANALYZER_EXECUTOR);
+              chế độ khác "auto" áp dụng cho mọi analyzer
+        hints: {tên analyzer: chế độ khai báo khi đăng ký} dùng với "auto"
+
+    Returns:
+        {tên analyzer: (kết quả, wall time tính bằng giây)} theo đúng thứ tự của tasks; wall time
+        đo từ lúc gửi vào pool đến khi có kết quả
+    """
+    mode = normalize_executor_mode(mode, allow_auto=True)
+    if len(tasks) <= 1:
+        return {name: _timed_call(func, args) for name, (func, args) in tasks.items()}
+    if mode == 'auto':
+        modes = {name: (hints or {}).get(name) or DEFAULT_ANALYZER_MODE for name in tasks}
+    else:
+        modes = {name: mode for name in tasks}
+
+    # Gửi các analyzer chạy trên pool trước, analyzer serial chạy tại chỗ trong lúc chờ
+    submitted = {}
+    for name, (func, args) in tasks.items():
+        executor = get_executor(modes[name])
+        if executor is not None:
+            submitted[name] = _submit_timed(executor, func, args)
+    results = {name: _timed_call(func, args) for name, (func, args) in tasks.items() if name not in submitted}
+    for name, (future, timing) in submitted.items():
+        result = future.result()
+        results[name] = (result, timing.get('done', time.perf_counter()) - timing['submitted'])
+    return {name: results[name] for name in tasks}
@@ -1,18 +1,21 @@
-from typing import List, Dict
+from typing import List, Dict, Optional
+import time
 import pandas as pd
-from .candle_signal_analysis import analyze_candle_signals
-from .rsi_signal_analysis import analyze_rsi_signals
-from .ma_signal_analysis import analyze_ma_signals
-from .macd_signal_analysis import analyze_macd_signals
-from .bb_signal_analysis import analyze_bb_signals
+from .executor import run_analyzers
+from .registry import get_analyzers, prepare_frame
+from .signals import signal_counts, signal_dicts
+
+# Số statement cùng loại tối thiểu để ra quyết định BUY/SELL
+FINAL_STATEMENT_MIN_AGREEMENT = 3
+
+# Mức chi tiết của kết quả: full = tín hiệu kèm reason, statements = statement từng analyzer,
+# final = chỉ final_statement (hai mức sau không format reason của tín hiệu)
+PREDICT_DETAIL_LEVELS = ("full", "statements", "final")
 
 
 def calculate_statement(signals):
-    """Tính statement cho tất cả các phương pháp dựa trên số lượng BUY vs SELL"""
-    if not signals:
-        return "HOLD"
-    buy_count = sum(1 for signal in signals if signal.get('action') == 'BUY')
-    sell_count = sum(1 for signal in signals if signal.get('action') == 'SELL')
+    """Tính statement cho tất cả các phương pháp dựa trên số lượng BUY vs SELL (SignalArray hoặc list dict)"""
+    buy_count, sell_count = signal_counts(signals)
     if buy_count > sell_count:
         return "BUY"
     elif sell_count > buy_count:
@@ -21,15 +24,15 @@ def calculate_statement(signals):
         return "HOLD"
 
 def format_analysis_result(signals, method_name):
-    """Format kết quả analysis theo format yêu cầu"""
-    if not signals:
+    """Format kết quả analysis theo format yêu cầu (reason của SignalArray được format tại đây)"""
+    if signals is None or len(signals) == 0:
         return {
             "analysis": [],
             "statement": "HOLD"
         }
     
     formatted_signals = []
-    for signal in signals:
+    for signal in signal_dicts(signals):
         formatted_signal = {
             "signal": signal.get('action', 'HOLD'),
             "reason": signal.get('reason', 'No reason provided'),
@@ -50,83 +53,97 @@ def format_analysis_result(signals, method_name):
         "statement": statement
     }
 
-def predict_future_trend(df: pd.DataFrame, trends: list, exchange: str = "HSX") -> dict:
+def required_agreement(analyzer_count: int) -> int:
+    """Số statement cùng loại cần có để ra BUY/SELL: 3 với đủ 5 analyzer, đa số khi chỉ bật một phần"""
+    return min(FINAL_STATEMENT_MIN_AGREEMENT, analyzer_count // 2 + 1)
+
+
+def decide_final_statement(statements: List[str]) -> str:
+    """Quyết định cuối cùng: >= 3 statements cùng loại (đa số nếu chỉ bật một phần analyzer)"""
+    buy_count = statements.count('BUY')
+    sell_count = statements.count('SELL')
+    required = required_agreement(len(statements))
+    if buy_count >= required and buy_count > sell_count:
+        return "BUY"
+    elif sell_count >= required and sell_count > buy_count:
+        return "SELL"
+    return "HOLD"
+
+
+def predict_future_trend(df: pd.DataFrame, trends: list, exchange: str = "HSX",
+                         executor: Optional[str] = None, include_timing: bool = False,
+                         analyzers: Optional[List[str]] = None, detail: str = "full",
+                         include_signals: bool = False) -> dict:
     """
-    Dự đoán xu hướng tương lai dựa trên phân tích tổng hợp 5 phương pháp
+    Dự đoán xu hướng tương lai dựa trên phân tích tổng hợp các analyzer đã đăng ký
+    (mặc định 5 phương pháp RSI, Candle, MA, MACD, BB - xem prediction/registry.py)
+    
+    Chỉ báo mà các analyzer khai báo được tính một lần, sau đó các analyzer độc lập
+    được chạy đồng thời trên executor (xem prediction/executor.py).
     
     Args:
-        df: DataFrame chứa dữ liệu OHLC gốc
+        df: DataFrame chứa dữ liệu OHLC gốc (có thể đã có sẵn cột chỉ báo)
         trends: Danh sách các xu hướng đã phát hiện
         exchange: Sàn giao dịch để xác định ngưỡng Marubozu (HSX/HNX/UPCOM)
+        executor: "auto" / "serial" / "thread" / "process" (mặc định theo ANALYZER_EXECUTOR)
+        include_timing: Thêm "timing_ms" (wall time của bước tính chỉ báo, từng analyzer và tổng) vào kết quả
+        analyzers: Tên các analyzer cần chạy (mặc định tất cả); tên không hợp lệ → ValueError
+        detail: Một trong PREDICT_DETAIL_LEVELS
+        include_signals: Thêm "signals" {tên analyzer: tín hiệu chưa format} (vẽ marker trên biểu đồ)
     
     Returns:
-        Dict chứa tín hiệu giao dịch tổng hợp với final_statement và analysis
+        Dict chứa final_statement và analysis (detail="full") hoặc statements
+        {tên analyzer: statement} (detail="statements" / "final")
     """
+    started = time.perf_counter()
+    selected = get_analyzers(analyzers)
     
     if df is None or len(df) == 0:
+        if detail != "full":
+            return {
+                "final_statement": "HOLD",
+                "statements": {analyzer.name: "HOLD" for analyzer in selected}
+            }
         return {
             "final_statement": "HOLD",
-            "analysis": {
-                "RSI": [],
-                "Candle": [],
-                "MA": [],
-                "MACD": [],
-                "BB": []
-            }
+            "analysis": {analyzer.name: [] for analyzer in selected}
         }
     
-    # 1. Phân tích tín hiệu từ RSI (tự gọi calculate_rsi)
-    rsi_signals = analyze_rsi_signals(df)
+    # Tính hợp các chỉ báo cần dùng một lần, mọi analyzer đọc chung frame này
+    frame = prepare_frame(df, selected, trends, exchange)
+    indicators_elapsed = time.perf_counter() - started
     
-    # 2. Phân tích tín hiệu từ Candle Patterns (tự gọi analyze_candle_patterns với exchange)
-    candle_signals = analyze_candle_signals(df, trends, exchange)
+    results = run_analyzers(
+        {analyzer.name: (analyzer.func, (frame, trends, exchange)) for analyzer in selected},
+        executor,
+        hints={analyzer.name: analyzer.executor for analyzer in selected}
+    )
     
-    # 3. Phân tích tín hiệu từ Moving Averages (tự gọi calculate_moving_averages)
-    ma_signals = analyze_ma_signals(df)
-    
-    # 4. Phân tích tín hiệu từ MACD (tự gọi calculate_macd)
-    macd_signals = analyze_macd_signals(df)
-    
-    # 5. Phân tích tín hiệu từ Bollinger Bands (tự gọi calculate_bollinger_bands)
-    bb_signals = analyze_bb_signals(df)
-    
-    # Format kết quả analysis theo yêu cầu
-    rsi_analysis = format_analysis_result(rsi_signals, "RSI")
-    candle_analysis = format_analysis_result(candle_signals, "Candle") 
-    ma_analysis = format_analysis_result(ma_signals, "MA")
-    macd_analysis = format_analysis_result(macd_signals, "MACD")
-    bb_analysis = format_analysis_result(bb_signals, "BB")
-    
-    # Tổng hợp tất cả signals để đưa ra quyết định cuối cùng
-    all_statements = [
-        rsi_analysis["statement"],
-        candle_analysis["statement"], 
-        ma_analysis["statement"],
-        macd_analysis["statement"],
-        bb_analysis["statement"]
-    ]
+    if detail == "full":
+        # Format kết quả analysis theo yêu cầu
+        analysis = {name: format_analysis_result(signals, name) for name, (signals, _) in results.items()}
+        statements = [result["statement"] for result in analysis.values()]
+    else:
+        # Chỉ đếm BUY/SELL, không format reason
+        analysis = None
+        statement_map = {name: calculate_statement(signals) for name, (signals, _) in results.items()}
+        statements = list(statement_map.values())
     
-    # Đếm statements
-    buy_count = all_statements.count('BUY')
-    sell_count = all_statements.count('SELL')
+    # Tổng hợp tất cả statements để đưa ra quyết định cuối cùng
+    final_statement = decide_final_statement(statements)
     
-    # Quyết định cuối cùng: >= 3 statements cùng loại
-    if buy_count >= 3 and buy_count > sell_count:
-        final_statement = "BUY"
-    elif sell_count >= 3 and sell_count > buy_count:
-        final_statement = "SELL"
+    prediction = {"final_statement": final_statement}
+    if analysis is not None:
+        prediction["analysis"] = analysis
     else:
-        final_statement = "HOLD"
+        prediction["statements"] = statement_map
+    if include_signals:
+        prediction["signals"] = {name: signals for name, (signals, _) in results.items()}
     
-    return {
-        "final_statement": final_statement,
-        "analysis": {
-            "RSI": rsi_analysis,
-            "Candle": candle_analysis,
-            "MA": ma_analysis,
-            "MACD": macd_analysis,
-            "BB": bb_analysis
-        }
-    }
-
-
+    if include_timing:
+        timing = {"indicators": round(indicators_elapsed * 1000, 2)}
+        timing.update({name: round(elapsed * 1000, 2) for name, (_, elapsed) in results.items()})
+        timing["total"] = round((time.perf_counter() - started) * 1000, 2)
+        prediction["timing_ms"] = timing
+    
+    return prediction
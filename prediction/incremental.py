@@ -0,0 +1,307 @@
+"""
+Chế độ "chỉ nến mới" của /predict cho cảnh báo theo dõi.
+
+Trạng thái của lần đánh giá trước (nến cuối, statement của từng analyzer, final_statement)
+được giữ theo (mã, range, khung nến, version các analyzer); mỗi lần gọi chỉ phân tích các
+nến được thêm từ đó và trả về tín hiệu mới cùng final_statement đã cập nhật:
+
+- Chỉ báo và nhãn nến vẫn có sẵn cho cả cửa sổ như /predict (feature store hoặc tính một
+  lần dạng vector), nhưng analyzer chỉ chạy trên các nến mới cộng LATEST_CONTEXT_BARS nến
+  trước đó (đủ cho so sánh với nến trước và volume trung bình 20 phiên), nên tín hiệu tại
+  nến mới giống /predict mà không phải dựng và format lại toàn bộ lịch sử tín hiệu.
+- Tín hiệu nến được trả về theo từng nến (không gộp theo trend period). Star Doji ở nến
+  cuối của lần trước chỉ có tín hiệu khi có nến xác nhận, nên được trả về lại ở lần sau.
+- Statement của từng analyzer vẫn cần số BUY/SELL của cả cửa sổ (tín hiệu ở đầu cửa sổ
+  phụ thuộc vào vị trí bắt đầu), nhưng được đếm bằng các hàm scan theo nến của registry
+  (và candle_signal_counts) thay vì chạy và format lại toàn bộ tín hiệu; kết quả bằng
+  đúng statement / final_statement của /predict.
+- Mã trong feature store chưa có nến mới thì trả về trạng thái cũ mà không đọc dữ liệu.
+
+Lần gọi đầu tiên (chưa có trạng thái) chỉ phân tích nến cuối. Request có endDate trước nến
+cuối của trạng thái (xem lại quá khứ) được xử lý như lần gọi đầu và không làm trạng thái lùi
+lại. Trạng thái nằm trong bộ nhớ tiến trình; khi chạy nhiều worker, client có thể truyền
+`since` (ngày nến cuối đã xử lý).
+
+update_signal_history dùng cùng cách chỉ chạy analyzer trên nến mới để ghi thêm lịch sử
+tín hiệu (storage/signal_store.py) trong job build_feature_store.py.
+
+Biến môi trường:
+- LATEST_STATE_SIZE: số trạng thái tối đa giữ trong bộ nhớ (mặc định 4096)
+"""
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+import sys
+
+# Thêm parent directory vào path để import
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils import DISPLAY_DATE_FORMAT
+from indicators.features import trends_from_frame
+from indicators.candle_patterns import as_of_candle_labels
+from prediction.registry import get_analyzers, prepare_frame, analyzer_versions
+from prediction.future_prediction import format_analysis_result, calculate_statement, decide_final_statement
+from prediction.candle_signal_analysis import candle_bar_signals, candle_signal_counts
+from prediction.signals import SignalArray, signal_dicts
+from prediction.service import resolve_predict_window, prepare_predict_frame, store_bar_key, PredictError
+from prediction.screener import screen_columns
+
+load_dotenv()
+
+LATEST_STATE_SIZE = int(os.getenv('LATEST_STATE_SIZE', '4096'))
+# Số nến trước nến mới cần đưa vào analyzer: volume trung bình 20 phiên và so sánh 2 nến trước
+LATEST_CONTEXT_BARS = 22
+
+_latest_states: "OrderedDict[tuple, Dict]" = OrderedDict()
+_latest_states_lock = threading.Lock()
+
+
+def _get_state(key: tuple) -> Optional[Dict]:
+    with _latest_states_lock:
+        state = _latest_states.get(key)
+        if state is not None:
+            _latest_states.move_to_end(key)
+        return state
+
+
+def _put_state(key: tuple, state: Dict) -> None:
+    with _latest_states_lock:
+        _latest_states[key] = state
+        _latest_states.move_to_end(key)
+        while len(_latest_states) > LATEST_STATE_SIZE:
+            _latest_states.popitem(last=False)
+
+
+def clear_latest_states() -> None:
+    """Xóa trạng thái của chế độ nến mới"""
+    with _latest_states_lock:
+        _latest_states.clear()
+
+
+def window_statements(frame: pd.DataFrame, trends: list, exchange: str,
+                      analyzers: Optional[List[str]] = None) -> Tuple[Dict[str, str], Dict[str, np.ndarray]]:
+    """
+    Statement của từng analyzer trên cả cửa sổ (như /predict) từ số tín hiệu BUY/SELL
+
+    Analyzer có scan được đếm bằng mảng; Candle gộp theo trend period như analyzer;
+    analyzer không có scan thì chạy hàm phân tích như /predict.
+
+    Returns:
+        Tuple (statement theo analyzer, {analyzer có scan: mặt nạ các nến có tín hiệu})
+    """
+    statements = {}
+    signal_bars = {}
+    for analyzer in get_analyzers(analyzers):
+        if analyzer.name == 'Candle':
+            buy, sell = candle_signal_counts(frame, trends)
+        elif analyzer.scan is not None:
+            buy_counts, sell_counts = analyzer.scan(frame, trends, exchange)
+            signal_bars[analyzer.name] = (np.asarray(buy_counts) + np.asarray(sell_counts)) > 0
+            buy, sell = int(np.sum(buy_counts)), int(np.sum(sell_counts))
+        else:
+            statements[analyzer.name] = calculate_statement(analyzer.func(frame, trends, exchange))
+            continue
+        statements[analyzer.name] = "BUY" if buy > sell else "SELL" if sell > buy else "HOLD"
+    return statements, signal_bars
+
+
+def new_bar_raw_signals(frame: pd.DataFrame, trends: list, exchange: str, first_new: int,
+                        analyzers: Optional[List[str]] = None,
+                        signal_bars: Optional[Dict[str, np.ndarray]] = None) -> Dict[str, list]:
+    """
+    Tín hiệu (dạng gốc của analyzer) của các analyzer tại các nến từ vị trí first_new đến cuối frame
+
+    Args:
+        frame: Cửa sổ đã có đủ chỉ báo (prepare_frame)
+        trends: Xu hướng của cửa sổ
+        exchange: Sàn giao dịch
+        first_new: Vị trí nến mới đầu tiên trong frame
+        analyzers: Tên các analyzer (mặc định tất cả)
+        signal_bars: Mặt nạ nến có tín hiệu theo analyzer (window_statements); analyzer không có
+                     tín hiệu ở nến mới thì không cần chạy
+
+    Returns:
+        {tên analyzer: tín hiệu mới} (SignalArray hoặc list dict của analyzer, reason chưa format)
+    """
+    selected = get_analyzers(analyzers)
+    if first_new >= len(frame):
+        return {analyzer.name: [] for analyzer in selected}
+    tail_start = max(first_new - LATEST_CONTEXT_BARS, 0)
+    tail = frame.iloc[tail_start:].reset_index(drop=True)
+    new_positions = range(first_new - tail_start, len(tail))
+    new_dates = tail['Date'].iloc[first_new - tail_start:].to_numpy(dtype='datetime64[ns]')
+
+    signals = {}
+    for analyzer in selected:
+        if analyzer.name == 'Candle':
+            # Từng nến mới, và Star Doji ở nến cuối lần trước (nay mới có nến xác nhận)
+            positions = list(new_positions)
+            previous = first_new - tail_start - 1
+            if previous >= 0 and tail['candle_pattern'].iloc[previous] == 'Star Doji':
+                positions.insert(0, previous)
+            found = candle_bar_signals(tail, positions)
+        elif signal_bars is not None and analyzer.name in signal_bars and not signal_bars[analyzer.name][first_new:].any():
+            found = []
+        else:
+            found = analyzer.func(tail, trends, exchange)
+            if isinstance(found, SignalArray):
+                found = found.select(np.isin(found.dates, new_dates))
+            else:
+                labels = set(pd.DatetimeIndex(new_dates).strftime(DISPLAY_DATE_FORMAT))
+                found = [signal for signal in found if signal.get('date') in labels]
+        signals[analyzer.name] = found
+    return signals
+
+
+def new_bar_signals(frame: pd.DataFrame, trends: list, exchange: str, first_new: int,
+                    analyzers: Optional[List[str]] = None,
+                    signal_bars: Optional[Dict[str, np.ndarray]] = None) -> Dict[str, list]:
+    """
+    Tín hiệu mới như new_bar_raw_signals, cùng định dạng với analysis của /predict
+    """
+    raw = new_bar_raw_signals(frame, trends, exchange, first_new, analyzers, signal_bars)
+    return {name: format_analysis_result(found, name)["analysis"] for name, found in raw.items()}
+
+
+def update_signal_history(store, symbol: str, features: pd.DataFrame, exchange: str,
+                          analyzers: Optional[List[str]] = None) -> int:
+    """
+    Ghi vào lịch sử tín hiệu (storage.signal_store) các tín hiệu BUY/SELL tại nến chưa được đánh giá
+
+    Frame là toàn bộ lịch sử trong feature store nên tín hiệu tại mỗi nến không phụ thuộc
+    cửa sổ của /predict. Lần đầu đánh giá cả lịch sử; các lần sau chỉ chạy analyzer trên
+    nến mới (new_bar_raw_signals). Tín hiệu nến được ghi theo từng nến (không gộp theo
+    trend period) với nhãn nến "as of" chính nến đó (as_of_candle_labels), nên tín hiệu đã
+    ghi không đổi khi có thêm nến và khớp với bar_signal_counts của backtest; Star Doji ở
+    nến cuối chỉ được ghi khi đã có nến xác nhận.
+
+    Args:
+        store: SignalStore
+        symbol: Mã chứng khoán
+        features: Feature frame của mã (đọc từ hoặc vừa ghi vào feature store)
+        exchange: Sàn giao dịch
+        analyzers: Tên các analyzer (mặc định tất cả)
+
+    Returns:
+        Số tín hiệu mới được ghi
+    """
+    if features is None or len(features) == 0:
+        return 0
+    selected = get_analyzers(analyzers)
+    versions = dict(analyzer_versions(analyzers))
+    done = store.evaluated_until(symbol, versions.items())
+    last_date = pd.Timestamp(features['Date'].iloc[-1]).strftime('%Y-%m-%d')
+    if all(previous is not None and previous >= last_date for previous in done.values()):
+        return 0
+    trends = trends_from_frame(features)
+    frame = prepare_frame(features.reset_index(drop=True), selected, trends, exchange)
+    if 'trend_context' in frame.columns:
+        # Nhãn nến "as of" từng nến như backtest (bar_signal_counts), không dùng xu hướng nhìn về sau
+        frame = as_of_candle_labels(frame, exchange, trends)
+    dates = frame['Date'].to_numpy()
+
+    rows = []
+    progress = {}
+    for analyzer in selected:
+        previous = done[analyzer.name]
+        if previous is not None and previous >= last_date:
+            continue
+        first_new = 0 if previous is None else int(
+            np.searchsorted(dates, np.datetime64(pd.Timestamp(previous)), side='right')
+        )
+        found = new_bar_raw_signals(frame, trends, exchange, first_new, [analyzer.name])[analyzer.name]
+        for signal in signal_dicts(found):
+            if signal.get('action') not in ('BUY', 'SELL'):
+                continue
+            reason = signal.get('reason', '')
+            rows.append({
+                "date": pd.to_datetime(signal['date'], format=DISPLAY_DATE_FORMAT).strftime('%Y-%m-%d'),
+                "analyzer": analyzer.name,
+                "version": analyzer.version,
+                "action": signal['action'],
+                "strength": signal.get('strength'),
+                "code": signal.get('code') or reason,
+                "reason": reason,
+            })
+        progress[(analyzer.name, analyzer.version)] = last_date
+    if not progress:
+        return 0
+    return store.append(symbol, rows, progress)
+
+
+def predict_latest(symbol: str, range_value: str, end_date: Optional[str] = None, timeframe: str = "D",
+                   analyzers: Optional[List[str]] = None, since: Optional[str] = None) -> Dict:
+    """
+    Tín hiệu mới từ lần đánh giá trước và final_statement đã cập nhật
+
+    Args:
+        symbol, range_value, end_date, timeframe, analyzers: Như PredictRequest
+        since: Ngày (YYYY-MM-DD) của nến cuối đã xử lý; mặc định lấy từ trạng thái đã lưu
+
+    Returns:
+        Dict gồm previousDate / endDate (nến cuối lần trước / hiện tại), new_bars,
+        new_signals (tín hiệu mới theo analyzer), statements, final_statement,
+        previous_final_statement và changed
+
+    Raises:
+        PredictError: Như /predict
+    """
+    symbol = symbol.upper()
+    range_name, timeframe, start_date, end_date_str = resolve_predict_window(range_value, end_date, timeframe, analyzers)
+    if since:
+        try:
+            since = pd.to_datetime(since, format='%Y-%m-%d').strftime('%Y-%m-%d')
+        except ValueError:
+            raise PredictError(400, f"Tham số 'since' phải có dạng YYYY-MM-DD, giá trị nhận được: '{since}'")
+    key = (symbol, range_name, timeframe, analyzer_versions(analyzers))
+    stored_state = _get_state(key)
+    # Cửa sổ kết thúc trước nến cuối đã lưu (xem lại quá khứ): không dùng và không ghi đè trạng thái
+    rewind = stored_state is not None and end_date_str < stored_state["endDate"]
+    state = None if rewind else stored_state
+    previous_date = since or (state["endDate"] if state else None)
+    previous_final = state["final_statement"] if state and state["endDate"] == previous_date else None
+
+    # Mã trong store chưa có nến mới: giữ nguyên kết quả lần trước
+    if state is not None and previous_date == state["endDate"] and timeframe == "D":
+        bar_key = store_bar_key(symbol, start_date, end_date_str)
+        if bar_key is not None and bar_key[1] == previous_date and bar_key[1] <= end_date_str:
+            return dict(state, previousDate=previous_date, new_bars=0,
+                        new_signals={name: [] for name in state["statements"]},
+                        previous_final_statement=previous_final, changed=False)
+
+    # Chỉ đọc các cột mà analyzer cần từ feature store
+    df, trends, exchange, data_start_date, data_end_date = prepare_predict_frame(
+        symbol, timeframe, start_date, end_date_str, columns=screen_columns(analyzers)
+    )
+    selected = get_analyzers(analyzers)
+    frame = prepare_frame(df.reset_index(drop=True), selected, trends, exchange)
+
+    # Nến mới: sau nến cuối lần trước (lần đầu chỉ nến cuối)
+    dates = frame['Date'].to_numpy()
+    if previous_date is None:
+        first_new = len(frame) - 1
+    else:
+        first_new = int(np.searchsorted(dates, np.datetime64(pd.Timestamp(previous_date)), side='right'))
+
+    statements, signal_bars = window_statements(frame, trends, exchange, analyzers)
+    final_statement = decide_final_statement(list(statements.values()))
+
+    result = {
+        "symbol": symbol,
+        "startDate": data_start_date,
+        "endDate": data_end_date,
+        "range": range_value,
+        "exchange": exchange,
+        "timeframe": timeframe,
+        "final_statement": final_statement,
+        "statements": statements,
+    }
+    if not rewind:
+        _put_state(key, result)
+    return dict(result, previousDate=previous_date, new_bars=len(frame) - first_new,
+                new_signals=new_bar_signals(frame, trends, exchange, first_new, analyzers, signal_bars),
+                previous_final_statement=previous_final,
+                changed=previous_final is not None and previous_final != final_statement)
@@ -1,6 +1,7 @@
 """
 Phân tích tín hiệu từ Moving Averages (MA10, MA50, MA100, MA200)
 """
+import numpy as np
 import pandas as pd
 import sys
 import os
@@ -8,9 +9,86 @@ import os
 # Thêm parent directory vào path để import
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from indicators.moving_averages import calculate_moving_averages
+from prediction.vectorized import shift, first_rule, volume_filter_ratio, rolling_mean
+from prediction.signals import SignalArray, empty_signals, signals_at
 
+LOW_VOLUME_RATIO = 0.5  # Volume thấp hơn 50% trung bình → tín hiệu nhiễu
 
-def analyze_ma_signals(df: pd.DataFrame) -> list:
+# Các cặp MA để phân tích (MA nhỏ, MA lớn)
+MA_PAIRS = [
+    ('MA10', 'MA50'),
+    ('MA10', 'MA100'), 
+    ('MA10', 'MA200'),
+    ('MA50', 'MA100'),
+    ('MA50', 'MA200'),
+    ('MA100', 'MA200')
+]
+
+# Các luật tạo tín hiệu BUY/SELL: (action, mẫu reason)
+MA_SIGNAL_RULES = [
+    ("BUY", "Golden cross confirmed: {pair} cross with positive difference ({diff:.2f})"),
+    ("SELL", "Death cross confirmed: {pair} cross with negative difference ({diff:.2f})"),
+]
+
+
+def scan_ma_cross_rules(ma_small: np.ndarray, ma_large: np.ndarray,
+                        volume: np.ndarray, volume_avg: np.ndarray, group_ids=None,
+                        low_volume_ratio: float = LOW_VOLUME_RATIO) -> np.ndarray:
+    """
+    Phát hiện cross + confirmation cho tất cả các cặp MA cùng lúc trên ma trận (nến x cặp)
+    
+    Tương đương gọi analyze_ma_cross_signal cho từng nến và từng cặp.
+    
+    Args:
+        ma_small: Ma trận MA nhỏ, mỗi cột là một cặp
+        ma_large: Ma trận MA lớn tương ứng
+        volume: Mảng volume
+        volume_avg: Mảng volume trung bình 20 phiên
+        group_ids: Mã của từng dòng khi quét nhiều mã một lúc (panel mode)
+        low_volume_ratio: Ngưỡng volume thấp (mặc định LOW_VOLUME_RATIO)
+    
+    Returns:
+        Ma trận chỉ số luật trong MA_SIGNAL_RULES (-1 = HOLD)
+    """
+    ma_small = np.asarray(ma_small, dtype='float64')
+    ma_large = np.asarray(ma_large, dtype='float64')
+    
+    # Đủ dữ liệu: 6 giá trị (hiện tại, 1 và 2 nến trước) khác 0 và không NaN
+    values = [ma_small, ma_large]
+    values += [shift(ma_small, 1, group_ids), shift(ma_large, 1, group_ids)]
+    values += [shift(ma_small, 2, group_ids), shift(ma_large, 2, group_ids)]
+    valid = np.logical_and.reduce([(value != 0) & ~np.isnan(value) for value in values])
+    
+    diff_current = ma_small - ma_large
+    diff_prev = values[2] - values[3]
+    diff_prev2 = values[4] - values[5]
+    
+    # Volume thấp thì tất cả là HOLD
+    volume_ok = ~(volume_filter_ratio(volume, volume_avg) < low_volume_ratio)
+    active = valid & volume_ok[:, None]
+    
+    return first_rule([
+        # Golden cross hôm trước, xác nhận hôm nay
+        active & (diff_prev2 <= 0) & (diff_prev > 0) & (diff_current > 0),
+        # Death cross hôm trước, xác nhận hôm nay
+        active & (diff_prev2 >= 0) & (diff_prev < 0) & (diff_current < 0),
+    ])
+
+
+def _pair_name(pair: int) -> str:
+    return "{}/{}".format(*MA_PAIRS[pair])
+
+
+def ma_signal_reason(rule: int, params) -> str:
+    """Reason của tín hiệu MA cross (params: [chỉ số cặp MA, chênh lệch])"""
+    return MA_SIGNAL_RULES[rule][1].format(pair=_pair_name(int(params[0])), diff=params[1])
+
+
+def ma_signal_code(rule: int, params) -> str:
+    return f"rule_{rule}:{_pair_name(int(params[0]))}"
+
+
+def analyze_ma_signals(df: pd.DataFrame) -> SignalArray:
     """
     Phân tích tín hiệu giao dịch từ Moving Averages theo thuật toán:
     - MA nhỏ cắt MA lớn và sau 1 ngày MA_nhỏ - MA_lớn > 0 → BUY (golden cross + confirmation)
@@ -21,80 +99,39 @@ def analyze_ma_signals(df: pd.DataFrame) -> list:
         df: DataFrame chứa dữ liệu OHLC
     
     Returns:
-        List tín hiệu từ MA cross analysis
+        SignalArray tín hiệu từ MA cross analysis (params: cặp MA, chênh lệch MA nhỏ - MA lớn)
     """
-    ma_signals = []
-    
     if df is None or len(df) == 0:
-        return ma_signals
+        return empty_signals(ma_signal_reason, ma_signal_code, params=2)
     
-    # Tính Moving Averages cho DataFrame
-    df_with_ma = calculate_moving_averages(df)
+    # Tính Moving Averages cho DataFrame (dùng lại cột đã tính sẵn nếu có)
+    has_ma = all(column in df.columns for column in ['MA10', 'MA50', 'MA100', 'MA200'])
+    df_with_ma = df if has_ma else calculate_moving_averages(df)
     
     if df_with_ma is None or len(df_with_ma) == 0:
-        return ma_signals
-    
-    # Tạo copy của DataFrame để xử lý
-    df_processed = df_with_ma.copy()
+        return empty_signals(ma_signal_reason, ma_signal_code, params=2)
     
     # Tính toán Average Volume của 20 ngày gần nhất
-    if 'Volume_MA20' not in df_processed.columns:
-        df_processed['Volume_MA20'] = df_processed['Volume'].rolling(window=20, min_periods=1).mean()
-    
-    # Chuyển đổi Date nếu cần
-    if 'Date' in df_processed.columns and df_processed['Date'].dtype == 'object':
-        df_processed['Date'] = pd.to_datetime(df_processed['Date'], format='%d/%m/%Y')
-    
-    # Các cặp MA để phân tích (MA nhỏ, MA lớn)
-    ma_pairs = [
-        ('MA10', 'MA50'),
-        ('MA10', 'MA100'), 
-        ('MA10', 'MA200'),
-        ('MA50', 'MA100'),
-        ('MA50', 'MA200'),
-        ('MA100', 'MA200')
-    ]
-    
-    # Phân tích từng điểm dữ liệu (cần ít nhất 2 điểm để phát hiện cross)
-    for i in range(2, len(df_processed)):  # Bắt đầu từ index 2 để có đủ dữ liệu cho cross confirmation
-        current_row = df_processed.iloc[i]
-        prev_row = df_processed.iloc[i-1]
-        prev_prev_row = df_processed.iloc[i-2]
-        
-        date = current_row.get('Date', f"Position {i}")
-        volume_current = current_row.get('Volume', 0)
-        volume_avg = current_row.get('Volume_MA20', 0)
-        
-        # Phân tích từng cặp MA
-        for ma_small, ma_large in ma_pairs:
-            signal = analyze_ma_cross_signal(
-                ma_small_prev2=prev_prev_row.get(ma_small, 0),
-                ma_large_prev2=prev_prev_row.get(ma_large, 0),
-                ma_small_prev=prev_row.get(ma_small, 0),
-                ma_large_prev=prev_row.get(ma_large, 0),
-                ma_small_current=current_row.get(ma_small, 0),
-                ma_large_current=current_row.get(ma_large, 0),
-                volume_current=volume_current,
-                volume_avg=volume_avg,
-                ma_pair_name=f"{ma_small}/{ma_large}"
-            )
-            
-            # Chỉ thêm tín hiệu nếu không phải HOLD
-            if signal['action'] != 'HOLD':
-                signal_data = {
-                    "date": date.strftime('%d/%m/%Y') if hasattr(date, 'strftime') else str(date),
-                    "action": signal['action'],
-                    "reason": signal['reason'],
-                    "ma_pair": f"{ma_small}/{ma_large}",
-                    "ma_small_value": round(current_row.get(ma_small, 0), 2),
-                    "ma_large_value": round(current_row.get(ma_large, 0), 2),
-                    "ma_difference": round(current_row.get(ma_small, 0) - current_row.get(ma_large, 0), 2),
-                    "volume_ratio": round(volume_current / volume_avg, 2) if volume_avg > 0 else 0,
-                    "signal_type": "ma_cross_analysis"
-                }
-                ma_signals.append(signal_data)
-    
-    return ma_signals
+    volume = df_with_ma['Volume'].to_numpy()
+    if 'Volume_MA20' in df_with_ma.columns:
+        volume_ma20 = df_with_ma['Volume_MA20'].to_numpy()
+    else:
+        volume_ma20 = rolling_mean(volume, window=20, min_periods=1)
+    
+    # Ma trận (nến x cặp MA) cho MA nhỏ và MA lớn
+    ma_small = np.column_stack([df_with_ma[small].to_numpy(dtype='float64') for small, _ in MA_PAIRS])
+    ma_large = np.column_stack([df_with_ma[large].to_numpy(dtype='float64') for _, large in MA_PAIRS])
+    
+    # Quét tất cả các nến và cặp MA một lần (cần ít nhất 2 nến trước để xác nhận cross)
+    rules = scan_ma_cross_rules(ma_small, ma_large, volume, volume_ma20)
+    
+    # nonzero duyệt theo nến rồi theo cặp - cùng thứ tự với vòng lặp cũ
+    positions, pairs = np.nonzero(rules >= 0)
+    params = np.column_stack([pairs, ma_small[positions, pairs] - ma_large[positions, pairs]])
+    return signals_at(
+        df_with_ma, positions, rules[positions, pairs], [action for action, _ in MA_SIGNAL_RULES],
+        params, ma_signal_reason, ma_signal_code
+    )
 
 
 def analyze_ma_cross_signal(ma_small_prev2: float, ma_large_prev2: float,
@@ -132,7 +169,7 @@ def analyze_ma_cross_signal(ma_small_prev2: float, ma_large_prev2: float,
     # Kiểm tra volume trước - nếu thấp thì tất cả là HOLD
     volume_ratio = volume_current / volume_avg if volume_avg > 0 else 1
     
-    if volume_ratio < 0.5:  # Volume thấp hơn 50% trung bình
+    if volume_ratio < LOW_VOLUME_RATIO:  # Volume thấp hơn 50% trung bình
         return {
             "action": "HOLD",
             "reason": f"Very low volume ({volume_ratio:.2f}x avg) - MA cross signal may be unreliable"
@@ -157,8 +194,8 @@ def analyze_ma_cross_signal(ma_small_prev2: float, ma_large_prev2: float,
         # Confirmation hôm nay
         if diff_current > 0:  # MA nhỏ vẫn trên MA lớn → xác nhận golden cross
             return {
-                "action": "BUY",
-                "reason": f"Golden cross confirmed: {ma_pair_name} cross with positive difference ({diff_current:.2f})"
+                "action": MA_SIGNAL_RULES[0][0],
+                "reason": MA_SIGNAL_RULES[0][1].format(pair=ma_pair_name, diff=diff_current)
             }
         else:  # MA nhỏ đã quay xuống dưới MA lớn → cross thất bại
             return {
@@ -171,8 +208,8 @@ def analyze_ma_cross_signal(ma_small_prev2: float, ma_large_prev2: float,
         # Confirmation hôm nay
         if diff_current < 0:  # MA nhỏ vẫn dưới MA lớn → xác nhận death cross
             return {
-                "action": "SELL",
-                "reason": f"Death cross confirmed: {ma_pair_name} cross with negative difference ({diff_current:.2f})"
+                "action": MA_SIGNAL_RULES[1][0],
+                "reason": MA_SIGNAL_RULES[1][1].format(pair=ma_pair_name, diff=diff_current)
             }
         else:  # MA nhỏ đã quay lên trên MA lớn → cross thất bại
             return {
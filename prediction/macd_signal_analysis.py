@@ -1,3 +1,4 @@
+import numpy as np
 import pandas as pd
 import sys
 import os
@@ -5,6 +6,71 @@ import os
 # Thêm parent directory vào path để import
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from indicators.macd import calculate_macd
+from prediction.vectorized import shift, first_rule, rolling_mean, bar_positions
+from prediction.signals import SignalArray, empty_signals, signals_at
+
+LOW_VOLUME_RATIO = 0.5      # Volume < 0.5 * average → bỏ qua
+MACD_NEUTRAL_GAP = 0.01     # |MACD - Signal| nhỏ hơn ngưỡng này ...
+MACD_NEUTRAL_LEVEL = 0.05   # ... và |MACD| nhỏ hơn ngưỡng này → vùng sideway
+
+# Các luật tạo tín hiệu BUY/SELL theo thứ tự ưu tiên: (action, reason, signal_type)
+MACD_SIGNAL_RULES = [
+    ('BUY', 'MACD line crossed above signal line below zero axis - bullish crossover', 'bullish_crossover'),
+    ('SELL', 'MACD line crossed below signal line above zero axis - bearish crossover', 'bearish_crossover'),
+    ('BUY', 'Bullish divergence - price declining but MACD rising', 'bullish_divergence'),
+    ('SELL', 'Bearish divergence - price rising but MACD declining', 'bearish_divergence'),
+]
+
+
+def _rule_signal(rule: int) -> dict:
+    action, reason, signal_type = MACD_SIGNAL_RULES[rule]
+    return {'action': action, 'reason': reason, 'signal_type': signal_type}
+
+
+def scan_macd_rules(macd: np.ndarray, signal: np.ndarray, close: np.ndarray,
+                    volume: np.ndarray, volume_avg: np.ndarray, group_ids=None,
+                    low_volume_ratio: float = LOW_VOLUME_RATIO) -> np.ndarray:
+    """
+    Quét MACD bằng mặt nạ mảng theo cùng thứ tự ưu tiên với analyze_macd_position_signal:
+    volume filter → crossover → divergence → neutral (vùng neutral luôn là HOLD)
+    
+    Args:
+        macd, signal: Mảng MACD Line và Signal Line
+        close: Mảng giá đóng cửa
+        volume: Mảng volume
+        volume_avg: Volume trung bình 20 phiên (NaN khi chưa đủ dữ liệu)
+        group_ids: Mã của từng dòng khi quét nhiều mã một lúc (panel mode)
+        low_volume_ratio: Ngưỡng volume thấp (mặc định LOW_VOLUME_RATIO)
+    
+    Returns:
+        Mảng chỉ số luật trong MACD_SIGNAL_RULES tại mỗi nến (-1 = HOLD)
+    """
+    macd = np.asarray(macd, dtype='float64')
+    signal = np.asarray(signal, dtype='float64')
+    close = np.asarray(close, dtype='float64')
+    volume = np.asarray(volume, dtype='float64')
+    volume_avg = np.asarray(volume_avg, dtype='float64')
+    
+    macd_prev = shift(macd, 1, group_ids)
+    signal_prev = shift(signal, 1, group_ids)
+    close_prev = shift(close, 1, group_ids)
+    close_prev2 = shift(close, 2, group_ids)
+    
+    # Bắt đầu từ nến thứ 3 của mỗi mã, bỏ qua volume thấp và MACD chưa có dữ liệu
+    active = (
+        (bar_positions(len(macd), group_ids) >= 2)
+        & ~(~np.isnan(volume_avg) & (volume < low_volume_ratio * volume_avg))
+        & ~np.isnan(macd) & ~np.isnan(signal)
+    )
+    
+    current_above = macd > signal
+    prev_above = macd_prev > signal_prev
+    return first_rule([
+        active & ~prev_above & current_above & (macd < 0),
+        active & prev_above & ~current_above & (macd > 0),
+        active & (close < close_prev) & (close_prev < close_prev2) & (macd > macd_prev),
+        active & (close > close_prev) & (close_prev > close_prev2) & (macd < macd_prev),
+    ])
 
 
 def analyze_macd_position_signal(
@@ -55,7 +121,7 @@ def analyze_macd_position_signal(
         Dict chứa action (BUY/SELL/HOLD), reason và signal_type
     """
     # Volume filter (< 0.5 * average)
-    if pd.notna(volume_avg) and volume_current < 0.5 * volume_avg:
+    if pd.notna(volume_avg) and volume_current < LOW_VOLUME_RATIO * volume_avg:
         return {
             'action': 'HOLD',
             'reason': f'Very low volume ({volume_current/volume_avg:.2f}x avg) - MACD signal may be unreliable',
@@ -79,7 +145,7 @@ def analyze_macd_position_signal(
         return divergence_signal
     
     # 3. Sideways/Neutral Zone
-    if abs(macd_current - signal_current) < 0.01 and abs(macd_current) < 0.05:
+    if abs(macd_current - signal_current) < MACD_NEUTRAL_GAP and abs(macd_current) < MACD_NEUTRAL_LEVEL:
         return {
             'action': 'HOLD',
             'reason': f'MACD near signal line and close to zero axis - sideways movement',
@@ -104,19 +170,11 @@ def detect_macd_crossover_signal(macd_current: float, signal_current: float,
     
     # MACD Line cắt lên Signal Line và dưới trục 0 -> MUA
     if not prev_above and current_above and macd_current < 0:
-        return {
-            'action': 'BUY',
-            'reason': f'MACD line crossed above signal line below zero axis - bullish crossover',
-            'signal_type': 'bullish_crossover'
-        }
+        return _rule_signal(0)
     
     # MACD Line cắt xuống Signal Line và trên trục 0 -> BÁN  
     elif prev_above and not current_above and macd_current > 0:
-        return {
-            'action': 'SELL',
-            'reason': f'MACD line crossed below signal line above zero axis - bearish crossover',
-            'signal_type': 'bearish_crossover'
-        }
+        return _rule_signal(1)
     
     return {
         'action': 'HOLD',
@@ -133,19 +191,11 @@ def analyze_macd_price_divergence(macd_current: float, macd_prev: float,
     # Phân kỳ dương: giá giảm trong 3 ngày, MACD tăng -> MUA
     
     if close_current < close_prev < close_prev2  and macd_current > macd_prev :
-        return {
-            'action': 'BUY',
-            'reason': f'Bullish divergence - price declining but MACD rising',
-            'signal_type': 'bullish_divergence'
-        }
+        return _rule_signal(2)
     
     # Phân kỳ âm: giá tăng trong 3 ngày, MACD giảm -> BÁN
     if close_current > close_prev > close_prev2 and macd_current < macd_prev :
-        return {
-            'action': 'SELL',
-            'reason': f'Bearish divergence - price rising but MACD declining',
-            'signal_type': 'bearish_divergence'
-        }
+        return _rule_signal(3)
     
     return {
         'action': 'HOLD',
@@ -154,7 +204,16 @@ def analyze_macd_price_divergence(macd_current: float, macd_prev: float,
     }
 
 
-def analyze_macd_signals(df: pd.DataFrame) -> list:
+def macd_signal_reason(rule: int, params) -> str:
+    """Reason của tín hiệu MACD (cố định theo luật)"""
+    return MACD_SIGNAL_RULES[rule][1]
+
+
+def macd_signal_code(rule: int, params) -> str:
+    return MACD_SIGNAL_RULES[rule][2]
+
+
+def analyze_macd_signals(df: pd.DataFrame) -> SignalArray:
     """
     Phân tích tín hiệu giao dịch từ MACD
     
@@ -162,78 +221,33 @@ def analyze_macd_signals(df: pd.DataFrame) -> list:
         df: DataFrame chứa dữ liệu OHLC
     
     Returns:
-        List tín hiệu từ MACD analysis
+        SignalArray tín hiệu từ MACD analysis (code là signal_type của luật)
     """
-    macd_signals = []
-    
     if df is None or len(df) <= 2:
-        return macd_signals
+        return empty_signals(macd_signal_reason, macd_signal_code)
     
-    # Tính MACD cho DataFrame
-    df_with_macd = calculate_macd(df)
+    # Tính MACD cho DataFrame (dùng lại cột đã tính sẵn nếu có)
+    has_macd = all(column in df.columns for column in ['MACD', 'MACD_Signal', 'MACD_Histogram'])
+    df_with_macd = df if has_macd else calculate_macd(df)
     
     if df_with_macd is None or len(df_with_macd) <= 2:
-        return macd_signals
-    
-    # Tạo copy của DataFrame để xử lý
-    df_processed = df_with_macd.copy()
+        return empty_signals(macd_signal_reason, macd_signal_code)
     
     # Filter volume similar to other algorithms (< 0.5 * average)
-    average_volume = df_processed['Volume'].rolling(window=20).mean()
-    
-    for i in range(2, len(df_processed)):
-        current_row = df_processed.iloc[i]
-        previous_row = df_processed.iloc[i-1]
-        prev2_row = df_processed.iloc[i-2]
-        
-        date = current_row.get('Date', f'Day_{i}')
-        volume_current = current_row['Volume']
-        volume_avg = average_volume.iloc[i]
-        
-        # Skip if volume is too low (< 0.5 * average)
-        if pd.notna(volume_avg) and volume_current < 0.5 * volume_avg:
-            continue
-            
-        # Get MACD values
-        macd_current = current_row.get('MACD', 0)
-        signal_current = current_row.get('MACD_Signal', 0)
-        histogram_current = current_row.get('MACD_Histogram', 0)
-        
-        macd_prev = previous_row.get('MACD', 0)
-        signal_prev = previous_row.get('MACD_Signal', 0)
-        
-        # Skip if MACD data is not available
-        if pd.isna(macd_current) or pd.isna(signal_current):
-            continue
-        
-        # Analyze MACD signal
-        macd_signal = analyze_macd_position_signal(
-            macd_current=macd_current,
-            signal_current=signal_current,
-            histogram_current=histogram_current,
-            macd_prev=macd_prev,
-            signal_prev=signal_prev,
-            close_current=current_row['Close'],
-            close_prev=previous_row['Close'],
-            close_prev2=prev2_row['Close'],
-            volume_current=volume_current,
-            volume_avg=volume_avg
-        )
-        
-        if macd_signal['action'] != 'HOLD':
-            macd_signals.append({
-                "date": date,
-                "action": macd_signal['action'],
-                "reason": macd_signal['reason'],
-                "macd_value": round(macd_current, 4),
-                "signal_line": round(signal_current, 4), 
-                "histogram": round(histogram_current, 4),
-                "signal_type": macd_signal['signal_type'],
-                "close_price": current_row['Close'],
-                "volume_ratio": round(volume_current / volume_avg, 2) if pd.notna(volume_avg) else 0
-            })
-    
-    return macd_signals
+    volume = df_with_macd['Volume'].to_numpy()
+    average_volume = rolling_mean(volume, window=20)
+    
+    macd_values = df_with_macd['MACD'].to_numpy()
+    signal_values = df_with_macd['MACD_Signal'].to_numpy()
+    close_values = df_with_macd['Close'].to_numpy()
+    
+    # Quét tất cả các nến một lần, chỉ giữ lại chỉ số luật của các nến có tín hiệu
+    rules = scan_macd_rules(macd_values, signal_values, close_values, volume, average_volume)
+    positions = np.flatnonzero(rules >= 0)
+    return signals_at(
+        df_with_macd, positions, rules[positions], [action for action, _, _ in MACD_SIGNAL_RULES],
+        np.empty((len(positions), 0)), macd_signal_reason, macd_signal_code, label_format="Day_{}"
+    )
 
 
 
@@ -0,0 +1,260 @@
+"""
+Registry các analyzer của /predict và chỉ báo mà chúng cần.
+
+Mỗi analyzer khai báo danh sách chỉ báo (theo tên trong INDICATORS) mà nó đọc.
+Engine (predict_future_trend) lấy hợp các chỉ báo của những analyzer được bật,
+tính mỗi chỉ báo đúng một lần (bỏ qua nếu frame đã có sẵn cột, ví dụ đọc từ
+feature store) rồi truyền cùng một frame cho tất cả analyzer. Analyzer chỉ được
+đọc frame này, không được sửa tại chỗ.
+
+Thêm analyzer mới:
+
+    register_analyzer("MyAnalyzer", my_func, requires=["RSI", "VOLUME_MA20"])
+
+với my_func(df, trends, exchange) -> tín hiệu: SignalArray (prediction/signals.py, reason được
+format khi trả ra ngoài) hoặc list dict có "action", "reason", "date".
+Hàm phải ở cấp module nếu chạy với ANALYZER_EXECUTOR=process.
+
+Analyzer có thể khai báo executor ("thread" / "process" / "serial") - chế độ chạy phù hợp với nó
+khi ANALYZER_EXECUTOR=auto (xem prediction/executor.py): thread cho kernel NumPy, process chỉ cho
+analyzer nặng phần Python thuần (chi phí pickle DataFrame lớn hơn thời gian chạy của các analyzer
+vector hóa). Không khai báo thì chạy trên thread.
+
+Analyzer có thể khai báo thêm scan(df, trends, exchange) -> (buy_counts, sell_counts):
+số tín hiệu BUY/SELL tại mỗi nến tính bằng mảng, gán vào nến mà tín hiệu được biết
+(dùng cho backtest trên toàn bộ lịch sử).
+
+Mỗi analyzer có version (mặc định 1) nằm trong khóa cache kết quả của /predict: tăng
+version khi sửa logic của analyzer để kết quả cũ không được dùng lại.
+"""
+from typing import Callable, Dict, List, Optional
+import numpy as np
+import pandas as pd
+import sys
+import os
+
+# Thêm parent directory vào path để import
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from indicators.moving_averages import calculate_moving_averages
+from indicators.bollinger_bands import calculate_bollinger_bands
+from indicators.rsi import calculate_rsi
+from indicators.macd import calculate_macd
+from indicators.candle_patterns import classify_candle_pattern
+from prediction.rsi_signal_analysis import analyze_rsi_signals, scan_rsi_rules, RSI_SIGNAL_RULES
+from prediction.candle_signal_analysis import (
+    analyze_candle_signals, scan_candle_signals, select_candle_signals, CANDLE_ENTRY_ACTIONS
+)
+from prediction.ma_signal_analysis import analyze_ma_signals, scan_ma_cross_rules, MA_PAIRS, MA_SIGNAL_RULES
+from prediction.macd_signal_analysis import analyze_macd_signals, scan_macd_rules, MACD_SIGNAL_RULES
+from prediction.bb_signal_analysis import analyze_bb_signals, scan_bb_rules, BB_SIGNAL_RULES
+from prediction.vectorized import action_counts, rolling_mean
+from prediction.executor import normalize_executor_mode
+
+
+class IndicatorSpec:
+    """Chỉ báo dùng chung: các cột nó tạo ra và hàm tính compute(df, trends, exchange) -> df mới"""
+
+    def __init__(self, name: str, columns: List[str], compute: Callable):
+        self.name = name
+        self.columns = list(columns)
+        self.compute = compute
+
+    def is_present(self, df: pd.DataFrame) -> bool:
+        return all(column in df.columns for column in self.columns)
+
+
+class AnalyzerSpec:
+    """
+    Analyzer đã đăng ký: hàm func(df, trends, exchange) -> list tín hiệu, chỉ báo cần có, scan (tùy chọn),
+    version và executor (chế độ chạy khi ANALYZER_EXECUTOR=auto, None = mặc định)
+    """
+
+    def __init__(self, name: str, func: Callable, requires: List[str], scan: Optional[Callable] = None,
+                 version: int = 1, executor: Optional[str] = None):
+        self.name = name
+        self.func = func
+        self.requires = list(requires)
+        self.scan = scan
+        self.version = version
+        self.executor = executor
+
+
+INDICATORS: Dict[str, IndicatorSpec] = {}
+ANALYZERS: Dict[str, AnalyzerSpec] = {}
+
+
+def register_indicator(name: str, columns: List[str], compute: Callable) -> IndicatorSpec:
+    """Đăng ký (hoặc thay thế) một chỉ báo dùng chung"""
+    spec = IndicatorSpec(name, columns, compute)
+    INDICATORS[name] = spec
+    return spec
+
+
+def register_analyzer(name: str, func: Callable, requires: List[str] = None,
+                      scan: Optional[Callable] = None, version: int = 1,
+                      executor: Optional[str] = None) -> AnalyzerSpec:
+    """Đăng ký (hoặc thay thế) một analyzer; chỉ báo trong requires phải đã được đăng ký"""
+    if executor is not None:
+        executor = normalize_executor_mode(executor)
+    unknown = [indicator for indicator in requires or [] if indicator not in INDICATORS]
+    if unknown:
+        raise ValueError(f"Chỉ báo chưa được đăng ký: {', '.join(unknown)}")
+    spec = AnalyzerSpec(name, func, requires or [], scan, version, executor)
+    ANALYZERS[name] = spec
+    return spec
+
+
+def get_analyzers(names: Optional[List[str]] = None) -> List[AnalyzerSpec]:
+    """
+    Danh sách analyzer theo thứ tự đăng ký (hoặc theo names nếu có), báo lỗi nếu tên không tồn tại
+
+    Tên không phân biệt hoa thường (ví dụ "rsi", "candle").
+    """
+    if names is None:
+        return list(ANALYZERS.values())
+    by_lower = {name.lower(): spec for name, spec in ANALYZERS.items()}
+    unknown = [name for name in names if name.lower() not in by_lower]
+    if unknown:
+        raise ValueError(
+            f"Analyzer không hợp lệ: {', '.join(unknown)}. Chỉ hỗ trợ: {', '.join(ANALYZERS)}"
+        )
+    selected = []
+    for name in names:
+        spec = by_lower[name.lower()]
+        if spec not in selected:
+            selected.append(spec)
+    return selected
+
+
+def analyzer_versions(names: Optional[List[str]] = None) -> tuple:
+    """Tên và version của các analyzer được bật (dùng làm một phần khóa cache)"""
+    return tuple((spec.name, spec.version) for spec in get_analyzers(names))
+
+
+def resolve_indicators(analyzers: List[AnalyzerSpec]) -> List[str]:
+    """Hợp các chỉ báo cần tính của các analyzer (giữ thứ tự, không trùng)"""
+    resolved = []
+    for analyzer in analyzers:
+        for indicator in analyzer.requires:
+            if indicator not in resolved:
+                resolved.append(indicator)
+    return resolved
+
+
+def prepare_frame(df: pd.DataFrame, analyzers: List[AnalyzerSpec], trends: list, exchange: str) -> pd.DataFrame:
+    """
+    Tính một lần các chỉ báo mà các analyzer cần (bỏ qua chỉ báo đã có sẵn cột)
+
+    Returns:
+        DataFrame dùng chung (chỉ đọc) cho tất cả analyzer
+    """
+    frame = df
+    for name in resolve_indicators(analyzers):
+        indicator = INDICATORS[name]
+        if not indicator.is_present(frame):
+            frame = indicator.compute(frame, trends, exchange)
+    return frame
+
+
+# === Chỉ báo mặc định ===
+
+def _compute_moving_averages(df, trends, exchange):
+    return calculate_moving_averages(df)
+
+
+def _compute_bollinger_bands(df, trends, exchange):
+    return calculate_bollinger_bands(df)
+
+
+def _compute_rsi(df, trends, exchange):
+    return calculate_rsi(df)
+
+
+def _compute_macd(df, trends, exchange):
+    return calculate_macd(df)
+
+
+def _compute_volume_ma20(df, trends, exchange):
+    # Volume trung bình 20 phiên dùng cho bộ lọc volume của RSI, MA và BB
+    return df.assign(Volume_MA20=df['Volume'].rolling(window=20, min_periods=1).mean())
+
+
+def _compute_candle_labels(df, trends, exchange):
+    return classify_candle_pattern(df, exchange, trends)
+
+
+register_indicator('MA', ['MA10', 'MA50', 'MA100', 'MA200'], _compute_moving_averages)
+register_indicator('BB', ['BB_Upper', 'BB_Lower', 'BB_Middle'], _compute_bollinger_bands)
+register_indicator('RSI', ['RSI'], _compute_rsi)
+register_indicator('MACD', ['MACD', 'MACD_Signal', 'MACD_Histogram'], _compute_macd)
+register_indicator('VOLUME_MA20', ['Volume_MA20'], _compute_volume_ma20)
+register_indicator('CANDLE', ['candle_pattern', 'trend_context', 'trend_period'], _compute_candle_labels)
+
+
+# === Analyzer mặc định (hàm cấp module để dùng được với process pool) ===
+
+def _run_rsi(df, trends, exchange):
+    return analyze_rsi_signals(df)
+
+
+def _run_candle(df, trends, exchange):
+    return analyze_candle_signals(df, trends, exchange)
+
+
+def _run_ma(df, trends, exchange):
+    return analyze_ma_signals(df)
+
+
+def _run_macd(df, trends, exchange):
+    return analyze_macd_signals(df)
+
+
+def _run_bb(df, trends, exchange):
+    return analyze_bb_signals(df)
+
+
+# === Scan theo nến cho backtest (cùng luật với analyzer, trả về số tín hiệu BUY/SELL mỗi nến) ===
+
+def _scan_rsi(df, trends, exchange):
+    rules = scan_rsi_rules(df['RSI'], df['Volume'], df['Volume_MA20'])
+    return action_counts(rules, [action for action, _ in RSI_SIGNAL_RULES])
+
+
+def _scan_candle(df, trends, exchange):
+    patterns = df['candle_pattern'].astype(object).to_numpy()
+    trend_contexts = df['trend_context'].astype(object).to_numpy()
+    entries = scan_candle_signals(patterns, trend_contexts, df['Open'], df['Close'])
+    entries = np.where(select_candle_signals(patterns, trend_contexts), entries, -1)
+    buy, sell = action_counts(entries, CANDLE_ENTRY_ACTIONS)
+    # Star Doji chỉ được xác nhận khi nến kế tiếp đóng cửa → tín hiệu được biết trễ 1 nến
+    is_star = patterns == 'Star Doji'
+    delayed_buy, delayed_sell = np.where(is_star, 0, buy), np.where(is_star, 0, sell)
+    delayed_buy[1:] += np.where(is_star, buy, 0)[:-1]
+    delayed_sell[1:] += np.where(is_star, sell, 0)[:-1]
+    return delayed_buy, delayed_sell
+
+
+def _scan_ma(df, trends, exchange):
+    ma_small = np.column_stack([df[small].to_numpy(dtype='float64') for small, _ in MA_PAIRS])
+    ma_large = np.column_stack([df[large].to_numpy(dtype='float64') for _, large in MA_PAIRS])
+    rules = scan_ma_cross_rules(ma_small, ma_large, df['Volume'], df['Volume_MA20'])
+    return action_counts(rules, [action for action, _ in MA_SIGNAL_RULES])
+
+
+def _scan_macd(df, trends, exchange):
+    volume_avg = rolling_mean(df['Volume'], window=20)
+    rules = scan_macd_rules(df['MACD'], df['MACD_Signal'], df['Close'], df['Volume'], volume_avg)
+    return action_counts(rules, [action for action, _, _ in MACD_SIGNAL_RULES])
+
+
+def _scan_bb(df, trends, exchange):
+    rules = scan_bb_rules(df['Close'], df['BB_Upper'], df['BB_Lower'], df['Volume'], df['Volume_MA20'])
+    return action_counts(rules, [action for action, _ in BB_SIGNAL_RULES])
+
+
+# Cả 5 analyzer mặc định là kernel NumPy (Candle tra bảng và cộng theo period bằng mảng) nên chạy trên thread
+register_analyzer('RSI', _run_rsi, requires=['RSI', 'VOLUME_MA20'], scan=_scan_rsi, executor='thread')
+register_analyzer('Candle', _run_candle, requires=['CANDLE'], scan=_scan_candle, executor='thread')
+register_analyzer('MA', _run_ma, requires=['MA', 'VOLUME_MA20'], scan=_scan_ma, executor='thread')
+register_analyzer('MACD', _run_macd, requires=['MACD'], scan=_scan_macd, executor='thread')
+register_analyzer('BB', _run_bb, requires=['BB', 'VOLUME_MA20'], scan=_scan_bb, executor='thread')
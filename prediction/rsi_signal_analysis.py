@@ -1,6 +1,7 @@
 """
 Phân tích tín hiệu từ RSI (Relative Strength Index)
 """
+import numpy as np
 import pandas as pd
 import sys
 import os
@@ -8,9 +9,80 @@ import os
 # Thêm parent directory vào path để import
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from indicators.rsi import calculate_rsi
+from prediction.vectorized import shift, first_rule, volume_filter_ratio, rolling_mean
+from prediction.signals import SignalArray, empty_signals, signals_at
 
+# Ngưỡng RSI
+RSI_OVERBOUGHT = 70
+RSI_OVERSOLD = 30
+RSI_EXTREME_OVERBOUGHT = 90
+RSI_EXTREME_OVERSOLD = 10
+RSI_STRONG_OVERBOUGHT = 75
+RSI_DEEP_OVERSOLD = 25
+LOW_VOLUME_RATIO = 0.5  # Volume thấp hơn 50% trung bình → tín hiệu nhiễu
 
-def analyze_rsi_signals(df: pd.DataFrame) -> list:
+# Các luật tạo tín hiệu BUY/SELL theo thứ tự ưu tiên: (action, mẫu reason)
+RSI_SIGNAL_RULES = [
+    ("BUY", "RSI hit extreme overbought ({rsi:.1f}) ≥ {extreme_overbought} - reversal expectation signal (flip from SELL to BUY)"),
+    ("SELL", "RSI hit extreme oversold ({rsi:.1f}) ≤ {extreme_oversold} - reversal expectation signal (flip from BUY to SELL)"),
+    ("SELL", "RSI entered overbought zone ({rsi:.1f}) ≥ {overbought} - sell signal"),
+    ("BUY", "RSI entered oversold zone ({rsi:.1f}) ≤ {oversold} - buy signal"),
+    ("BUY", "RSI deepening in oversold zone ({rsi:.1f}) ≤ {deep_oversold} - strong buy signal"),
+    ("SELL", "RSI rising in overbought zone ({rsi:.1f}) ≥ {strong_overbought} - strong sell signal"),
+]
+
+
+def _format_rsi_reason(rule: int, rsi_current: float) -> str:
+    return RSI_SIGNAL_RULES[rule][1].format(
+        rsi=rsi_current,
+        overbought=RSI_OVERBOUGHT, oversold=RSI_OVERSOLD,
+        extreme_overbought=RSI_EXTREME_OVERBOUGHT, extreme_oversold=RSI_EXTREME_OVERSOLD,
+        strong_overbought=RSI_STRONG_OVERBOUGHT, deep_oversold=RSI_DEEP_OVERSOLD
+    )
+
+
+def scan_rsi_rules(rsi: np.ndarray, volume: np.ndarray, volume_avg: np.ndarray, group_ids=None,
+                   oversold: float = RSI_OVERSOLD, overbought: float = RSI_OVERBOUGHT,
+                   extreme_oversold: float = RSI_EXTREME_OVERSOLD, extreme_overbought: float = RSI_EXTREME_OVERBOUGHT,
+                   low_volume_ratio: float = LOW_VOLUME_RATIO) -> np.ndarray:
+    """
+    Quét toàn bộ chuỗi RSI bằng mặt nạ mảng, tương đương gọi analyze_rsi_position_signal cho từng nến
+    
+    Args:
+        rsi: Mảng RSI
+        volume: Mảng volume
+        volume_avg: Mảng volume trung bình 20 phiên
+        group_ids: Mã của từng dòng khi quét nhiều mã một lúc (panel mode)
+        oversold, overbought, extreme_oversold, extreme_overbought, low_volume_ratio:
+            Ngưỡng RSI và ngưỡng volume thấp (mặc định theo hằng số của module; dùng khi dò tham số)
+    
+    Returns:
+        Mảng chỉ số luật trong RSI_SIGNAL_RULES tại mỗi nến (-1 = HOLD)
+    """
+    current = np.asarray(rsi, dtype='float64')
+    prev = shift(current, 1, group_ids)
+    # Volume thấp thì tất cả là HOLD
+    volume_ok = ~(volume_filter_ratio(volume, volume_avg) < low_volume_ratio)
+    
+    below_extreme_high = current < extreme_overbought
+    above_extreme_low = current > extreme_oversold
+    conditions = [
+        (current >= extreme_overbought) & (prev < extreme_overbought),
+        (current <= extreme_oversold) & (prev > extreme_oversold),
+        (current >= overbought) & below_extreme_high & (prev < overbought),
+        (current <= oversold) & above_extreme_low & (prev > oversold),
+        (current <= RSI_DEEP_OVERSOLD) & above_extreme_low & (prev <= oversold) & (prev > current),
+        (current >= RSI_STRONG_OVERBOUGHT) & below_extreme_high & (prev >= overbought) & (prev < current),
+    ]
+    return first_rule([condition & volume_ok for condition in conditions])
+
+
+def rsi_signal_reason(rule: int, params) -> str:
+    """Reason của tín hiệu RSI (params: [RSI tại nến])"""
+    return _format_rsi_reason(rule, params[0])
+
+
+def analyze_rsi_signals(df: pd.DataFrame) -> SignalArray:
     """
     Phân tích tín hiệu giao dịch từ RSI theo thuật toán mới:
     - RSI >= 70: Overbought zone → SELL signal 
@@ -23,59 +95,32 @@ def analyze_rsi_signals(df: pd.DataFrame) -> list:
         df: DataFrame chứa dữ liệu OHLC
     
     Returns:
-        List tín hiệu từ RSI analysis
+        SignalArray tín hiệu từ RSI analysis (params: RSI tại nến; reason format khi cần)
     """
-    rsi_signals = []
-    
     if df is None or len(df) == 0:
-        return rsi_signals
+        return empty_signals(rsi_signal_reason, params=1)
     
-    # Tính RSI cho DataFrame
-    df_with_rsi = calculate_rsi(df)
+    # Tính RSI cho DataFrame (dùng lại cột đã tính sẵn nếu có, ví dụ từ feature store)
+    df_with_rsi = df if 'RSI' in df.columns else calculate_rsi(df)
     
     if df_with_rsi is None or len(df_with_rsi) == 0:
-        return rsi_signals
-    
-    # Tạo copy của DataFrame để xử lý  
-    df_processed = df_with_rsi.copy()
+        return empty_signals(rsi_signal_reason, params=1)
     
     # Tính toán Average Volume của 20 ngày gần nhất
-    df_processed['Volume_MA20'] = df_processed['Volume'].rolling(window=20, min_periods=1).mean()
-    
-    # Chuyển đổi Date nếu cần
-    if 'Date' in df_processed.columns and df_processed['Date'].dtype == 'object':
-        df_processed['Date'] = pd.to_datetime(df_processed['Date'], format='%d/%m/%Y')
-    
-    # Phân tích từng điểm dữ liệu
-    for i in range(1, len(df_processed)):  # Bắt đầu từ index 1 để so sánh với điểm trước
-        current_row = df_processed.iloc[i]
-        prev_row = df_processed.iloc[i-1]
-        
-        date = current_row.get('Date', f"Position {i}")
-        rsi_current = current_row.get('RSI', 50)
-        rsi_prev = prev_row.get('RSI', 50)
-        volume_current = current_row.get('Volume', 0)
-        volume_avg = current_row.get('Volume_MA20', 0)
-        
-        # Phân tích tín hiệu RSI với mức cố định
-        signal = analyze_rsi_position_signal(
-            rsi_current, rsi_prev, 
-            volume_current, volume_avg
-        )
-        
-        # Chỉ thêm tín hiệu nếu không phải HOLD
-        if signal['action'] != 'HOLD':
-            signal_data = {
-                "date": date.strftime('%d/%m/%Y') if hasattr(date, 'strftime') else str(date),
-                "action": signal['action'],
-                "reason": signal['reason'],
-                "rsi_value": round(rsi_current, 2),
-                "volume_ratio": round(volume_current / volume_avg, 2) if volume_avg > 0 else 0,
-                "signal_type": "rsi_analysis"
-            }
-            rsi_signals.append(signal_data)
-    
-    return rsi_signals
+    rsi_values = df_with_rsi['RSI'].to_numpy()
+    volume = df_with_rsi['Volume'].to_numpy()
+    if 'Volume_MA20' in df_with_rsi.columns:
+        volume_ma20 = df_with_rsi['Volume_MA20'].to_numpy()
+    else:
+        volume_ma20 = rolling_mean(volume, window=20, min_periods=1)
+    
+    # Quét tất cả các nến một lần, chỉ giữ lại chỉ số luật và RSI của các nến có tín hiệu
+    rules = scan_rsi_rules(rsi_values, volume, volume_ma20)
+    positions = np.flatnonzero(rules >= 0)
+    return signals_at(
+        df_with_rsi, positions, rules[positions], [action for action, _ in RSI_SIGNAL_RULES],
+        rsi_values[positions], rsi_signal_reason
+    )
 
 
 def analyze_rsi_position_signal(rsi_current: float, rsi_prev: float, 
@@ -105,60 +150,44 @@ def analyze_rsi_position_signal(rsi_current: float, rsi_prev: float,
     # Kiểm tra volume trước - nếu thấp thì tất cả là HOLD
     volume_ratio = volume_current / volume_avg if volume_avg > 0 else 1
     
-    if volume_ratio < 0.5:  # Volume thấp hơn 50% trung bình
+    if volume_ratio < LOW_VOLUME_RATIO:  # Volume thấp hơn 50% trung bình
         return {
             "action": "HOLD",
             "reason": f"Very low volume ({volume_ratio:.2f}x avg) - RSI signal may be unreliable"
         }
     
     # === PHÂN TÍCH TÍN HIỆU RSI VỚI REVERSAL EXPECTATION ===
+    # (cùng thứ tự ưu tiên với RSI_SIGNAL_RULES / scan_rsi_rules)
     
     # 1. Kiểm tra Extreme levels (10/90) - Reversal Expectation Signals
-    if rsi_current >= 90 and rsi_prev < 90:  # Vừa chạm extreme overbought - đảo chiều từ SELL thành BUY
-        return {
-            "action": "BUY",
-            "reason": f"RSI hit extreme overbought ({rsi_current:.1f}) ≥ 90 - reversal expectation signal (flip from SELL to BUY)"
-        }
+    if rsi_current >= RSI_EXTREME_OVERBOUGHT and rsi_prev < RSI_EXTREME_OVERBOUGHT:  # Vừa chạm extreme overbought - đảo chiều từ SELL thành BUY
+        rule = 0
     
-    elif rsi_current <= 10 and rsi_prev > 10:  # Vừa chạm extreme oversold - đảo chiều từ BUY thành SELL
-        return {
-            "action": "SELL",
-            "reason": f"RSI hit extreme oversold ({rsi_current:.1f}) ≤ 10 - reversal expectation signal (flip from BUY to SELL)"
-        }
+    elif rsi_current <= RSI_EXTREME_OVERSOLD and rsi_prev > RSI_EXTREME_OVERSOLD:  # Vừa chạm extreme oversold - đảo chiều từ BUY thành SELL
+        rule = 1
     
     # 2. Kiểm tra Standard levels (30/70) - Oversold/Overbought Signals (chỉ khi chưa chạm extreme)
-    elif rsi_current >= 70 and rsi_current < 90 and rsi_prev < 70:  # Vào overbought nhưng chưa chạm extreme
-        return {
-            "action": "SELL",
-            "reason": f"RSI entered overbought zone ({rsi_current:.1f}) ≥ 70 - sell signal"
-        }
+    elif RSI_OVERBOUGHT <= rsi_current < RSI_EXTREME_OVERBOUGHT and rsi_prev < RSI_OVERBOUGHT:  # Vào overbought nhưng chưa chạm extreme
+        rule = 2
     
-    elif rsi_current <= 30 and rsi_current > 10 and rsi_prev > 30:  # Vào oversold nhưng chưa chạm extreme
-        return {
-            "action": "BUY",
-            "reason": f"RSI entered oversold zone ({rsi_current:.1f}) ≤ 30 - buy signal"
-        }
+    elif RSI_EXTREME_OVERSOLD < rsi_current <= RSI_OVERSOLD and rsi_prev > RSI_OVERSOLD:  # Vào oversold nhưng chưa chạm extreme
+        rule = 3
     
     # 2.1 Kiểm tra giảm sâu trong vùng oversold hoặc tăng cao trong vùng overbought
-    elif rsi_current <= 25 and rsi_current > 10 and rsi_prev <= 30 and rsi_prev > rsi_current:  # Tiếp tục giảm sâu trong vùng oversold
-        return {
-            "action": "BUY",
-            "reason": f"RSI deepening in oversold zone ({rsi_current:.1f}) ≤ 25 - strong buy signal"
-        }
+    elif RSI_EXTREME_OVERSOLD < rsi_current <= RSI_DEEP_OVERSOLD and rsi_prev <= RSI_OVERSOLD and rsi_prev > rsi_current:  # Tiếp tục giảm sâu trong vùng oversold
+        rule = 4
+    
+    elif RSI_STRONG_OVERBOUGHT <= rsi_current < RSI_EXTREME_OVERBOUGHT and rsi_prev >= RSI_OVERBOUGHT and rsi_prev < rsi_current:  # Tiếp tục tăng cao trong vùng overbought
+        rule = 5
     
-    elif rsi_current >= 75 and rsi_current < 90 and rsi_prev >= 70 and rsi_prev < rsi_current:  # Tiếp tục tăng cao trong vùng overbought
-        return {
-            "action": "SELL",
-            "reason": f"RSI rising in overbought zone ({rsi_current:.1f}) ≥ 75 - strong sell signal"
-        }
     # 3. Kiểm tra exit signals - thoát khỏi extreme zones
-    elif rsi_prev <= 10 and rsi_current > 10:  # Thoát khỏi extreme oversold
+    elif rsi_prev <= RSI_EXTREME_OVERSOLD and rsi_current > RSI_EXTREME_OVERSOLD:  # Thoát khỏi extreme oversold
         return {
             "action": "HOLD",
             "reason": f"RSI exited extreme oversold zone ({rsi_current:.1f}) - wait for confirmation"
         }
     
-    elif rsi_prev >= 90 and rsi_current < 90:  # Thoát khỏi extreme overbought
+    elif rsi_prev >= RSI_EXTREME_OVERBOUGHT and rsi_current < RSI_EXTREME_OVERBOUGHT:  # Thoát khỏi extreme overbought
         return {
             "action": "HOLD",
             "reason": f"RSI exited extreme overbought zone ({rsi_current:.1f}) - wait for confirmation"
@@ -168,5 +197,10 @@ def analyze_rsi_position_signal(rsi_current: float, rsi_prev: float,
     else:
         return {
             "action": "HOLD",
-            "reason": f"RSI at {rsi_current:.1f} - no significant level break (30/70 oversold/overbought, 10/90 extreme)"
+            "reason": f"RSI at {rsi_current:.1f} - no significant level break ({RSI_OVERSOLD}/{RSI_OVERBOUGHT} oversold/overbought, {RSI_EXTREME_OVERSOLD}/{RSI_EXTREME_OVERBOUGHT} extreme)"
         }
+    
+    return {
+        "action": RSI_SIGNAL_RULES[rule][0],
+        "reason": _format_rsi_reason(rule, rsi_current)
+    }
@@ -0,0 +1,362 @@
+"""
+Screener toàn thị trường: chạy các analyzer của /predict cho tất cả các mã trong
+một lần tính dạng panel thay vì gọi predict cho từng mã.
+
+Cửa sổ dữ liệu của mỗi mã giống /predict khi đọc feature store (cùng khoảng ngày),
+các mã được nối liền nhau và quét bằng các kernel mảng với group_ids. Statement
+của từng analyzer và final_statement bằng đúng kết quả của predict_future_trend trên
+cửa sổ đó; ngoài ra screener trả về các sự kiện xảy ra ở phiên cuối (events) để lọc,
+ví dụ "rsi_oversold" = RSI vừa đi vào vùng quá bán trong phiên hôm nay.
+
+Chi phí chủ yếu là đọc cửa sổ của ~1.600 mã từ feature store: việc đọc được chia
+cho SCREEN_WORKERS tiến trình, và kết quả (chưa lọc) được giữ trong bộ nhớ cho đến
+khi feature store thay đổi, nên các lần lọc sau trong cùng phiên chỉ còn bước lọc.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+import threading
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+import sys
+import os
+
+# Thêm parent directory vào path để import
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from indicators.features import trends_from_frame, OHLCV_COLUMNS
+from prediction.registry import INDICATORS, get_analyzers, resolve_indicators
+from prediction.future_prediction import required_agreement, calculate_statement
+from prediction.vectorized import action_counts, rolling_mean
+from prediction.rsi_signal_analysis import scan_rsi_rules, RSI_SIGNAL_RULES
+from prediction.ma_signal_analysis import scan_ma_cross_rules, MA_PAIRS, MA_SIGNAL_RULES
+from prediction.macd_signal_analysis import scan_macd_rules, MACD_SIGNAL_RULES
+from prediction.bb_signal_analysis import scan_bb_rules, BB_SIGNAL_RULES
+from prediction.candle_signal_analysis import (
+    scan_candle_signals, select_candle_signals, CANDLE_ENTRY_ACTIONS, CANDLE_ENTRY_STRENGTHS
+)
+
+load_dotenv()
+
+SCREEN_EXCHANGES = ['HSX', 'HNX', 'UPCOM']
+SCREEN_WORKERS = int(os.getenv('SCREEN_WORKERS', str(min(os.cpu_count() or 1, 8))))
+
+# Sự kiện ở phiên cuối: tên → (analyzer, chỉ số luật trong bảng luật của analyzer)
+SCREEN_EVENTS = {
+    'rsi_extreme_overbought': ('RSI', 0),
+    'rsi_extreme_oversold': ('RSI', 1),
+    'rsi_overbought': ('RSI', 2),
+    'rsi_oversold': ('RSI', 3),
+    'rsi_deep_oversold': ('RSI', 4),
+    'rsi_strong_overbought': ('RSI', 5),
+    'golden_cross': ('MA', 0),
+    'death_cross': ('MA', 1),
+    'macd_bullish_crossover': ('MACD', 0),
+    'macd_bearish_crossover': ('MACD', 1),
+    'macd_bullish_divergence': ('MACD', 2),
+    'macd_bearish_divergence': ('MACD', 3),
+    'bb_below_lower': ('BB', 0),
+    'bb_above_upper': ('BB', 1),
+    'candle_buy': ('Candle', 'BUY'),
+    'candle_sell': ('Candle', 'SELL'),
+}
+
+STATEMENT_LABELS = {1: 'BUY', -1: 'SELL', 0: 'HOLD'}
+
+
+def _group_sum(values: np.ndarray, group_ids: np.ndarray, groups: int) -> np.ndarray:
+    return np.bincount(group_ids, weights=values, minlength=groups)
+
+
+def _with_indicators(frame: pd.DataFrame, indicators: list, trends: list, exchange: str) -> pd.DataFrame:
+    for indicator in indicators:
+        if not indicator.is_present(frame):
+            frame = indicator.compute(frame, trends, exchange)
+    return frame
+
+
+def _candle_votes(panel: pd.DataFrame, group_ids: np.ndarray, groups: int):
+    """
+    Số tín hiệu BUY/SELL của analyzer Candle cho từng mã và entry ở nến cuối
+
+    Tín hiệu trong cùng trend period được gộp thành một (dấu của tổng strength) như
+    analyze_candle_signals; tín hiệu ngoài period được đếm riêng từng nến.
+    """
+    patterns = panel['candle_pattern'].astype(object).to_numpy()
+    trend_contexts = panel['trend_context'].astype(object).to_numpy()
+    periods = panel['trend_period'].astype(object).to_numpy()
+    entries = scan_candle_signals(patterns, trend_contexts, panel['Open'], panel['Close'], group_ids)
+    entries = np.where(select_candle_signals(patterns, trend_contexts), entries, -1)
+    buy, sell = action_counts(entries, CANDLE_ENTRY_ACTIONS)
+    strengths = np.append(np.array(CANDLE_ENTRY_STRENGTHS), 0)[entries]
+
+    in_period = np.array([bool(period) and bool(trend) for period, trend in zip(periods, trend_contexts)], dtype=bool)
+    votes_buy = _group_sum(np.where(in_period, 0, buy), group_ids, groups)
+    votes_sell = _group_sum(np.where(in_period, 0, sell), group_ids, groups)
+
+    # Cộng strength theo (mã, trend period) của các nến có tín hiệu
+    rows = np.flatnonzero(in_period & (entries >= 0))
+    if len(rows):
+        keys = pd.MultiIndex.from_arrays([group_ids[rows], periods[rows]])
+        codes, uniques = pd.factorize(keys)
+        totals = np.bincount(codes, weights=strengths[rows], minlength=len(uniques))
+        period_groups = uniques.get_level_values(0).to_numpy()
+        votes_buy += np.bincount(period_groups, weights=totals > 0, minlength=groups)
+        votes_sell += np.bincount(period_groups, weights=totals < 0, minlength=groups)
+    return votes_buy, votes_sell, entries
+
+
+def screen_panel(frames: List[pd.DataFrame], exchanges: List[str], analyzers: Optional[List[str]] = None):
+    """
+    Statement của từng analyzer, final_statement và sự kiện phiên cuối cho nhiều mã
+
+    Args:
+        frames: Cửa sổ dữ liệu của từng mã (đã có chỉ báo/nhãn từ feature store)
+        exchanges: Sàn của từng mã
+        analyzers: Tên các analyzer (mặc định tất cả)
+
+    Returns:
+        Tuple (statements {analyzer: mảng +1/-1/0 theo mã}, mảng final +1/-1/0, list sự kiện theo mã)
+    """
+    selected = get_analyzers(analyzers)
+    groups = len(frames)
+    lengths = np.array([len(frame) for frame in frames])
+    group_ids = np.repeat(np.arange(groups), lengths)
+    last_rows = np.cumsum(lengths) - 1
+    # Feature store đã có sẵn chỉ báo/nhãn; chỉ tính các cột còn thiếu (volume trung bình tính trên panel)
+    indicators = [INDICATORS[name] for name in resolve_indicators(selected) if name != 'VOLUME_MA20']
+    if any(not indicator.is_present(frame) for frame in frames for indicator in indicators):
+        frames = [_with_indicators(frame, indicators, trends_from_frame(frame), exchange)
+                  for frame, exchange in zip(frames, exchanges)]
+    panel = pd.concat(frames, ignore_index=True)
+
+    volume = panel['Volume'].to_numpy()
+    close = panel['Close']
+    volume_ma20 = rolling_mean(volume, window=20, min_periods=1, group_ids=group_ids)
+    statements = {}
+    events = [[] for _ in range(groups)]
+
+    def record_events(name, last_rules):
+        for event, (analyzer, rule) in SCREEN_EVENTS.items():
+            if analyzer == name:
+                for group in np.flatnonzero(np.any(last_rules == rule, axis=tuple(range(1, last_rules.ndim)))):
+                    events[group].append(event)
+
+    for analyzer in selected:
+        name = analyzer.name
+        if name == 'RSI':
+            rules = scan_rsi_rules(panel['RSI'], volume, volume_ma20, group_ids)
+            buy, sell = action_counts(rules, [action for action, _ in RSI_SIGNAL_RULES])
+        elif name == 'MA':
+            ma_small = np.column_stack([panel[small].to_numpy(dtype='float64') for small, _ in MA_PAIRS])
+            ma_large = np.column_stack([panel[large].to_numpy(dtype='float64') for _, large in MA_PAIRS])
+            rules = scan_ma_cross_rules(ma_small, ma_large, volume, volume_ma20, group_ids)
+            buy, sell = action_counts(rules, [action for action, _ in MA_SIGNAL_RULES])
+        elif name == 'MACD':
+            volume_avg = rolling_mean(volume, window=20, group_ids=group_ids)
+            rules = scan_macd_rules(panel['MACD'], panel['MACD_Signal'], close, volume, volume_avg, group_ids)
+            buy, sell = action_counts(rules, [action for action, _, _ in MACD_SIGNAL_RULES])
+        elif name == 'BB':
+            rules = scan_bb_rules(close, panel['BB_Upper'], panel['BB_Lower'], volume, volume_ma20, group_ids)
+            buy, sell = action_counts(rules, [action for action, _ in BB_SIGNAL_RULES])
+        elif name == 'Candle':
+            votes_buy, votes_sell, entries = _candle_votes(panel, group_ids, groups)
+            statements[name] = np.sign(votes_buy - votes_sell).astype(int)
+            last_actions = np.array(CANDLE_ENTRY_ACTIONS + ['HOLD'])[entries[last_rows]]
+            record_events(name, last_actions)
+            continue
+        else:
+            # Analyzer đăng ký thêm: chạy theo từng mã
+            statements[name] = np.array([
+                {'BUY': 1, 'SELL': -1}.get(calculate_statement(analyzer.func(frame, trends_from_frame(frame), exchange)), 0)
+                for frame, exchange in zip(frames, exchanges)
+            ])
+            continue
+        statements[name] = np.sign(_group_sum(buy, group_ids, groups) - _group_sum(sell, group_ids, groups)).astype(int)
+        record_events(name, rules[last_rows])
+
+    buy_votes = sum(statement > 0 for statement in statements.values())
+    sell_votes = sum(statement < 0 for statement in statements.values())
+    required = required_agreement(len(selected))
+    final = np.select(
+        [(buy_votes >= required) & (buy_votes > sell_votes),
+         (sell_votes >= required) & (sell_votes > buy_votes)],
+        [1, -1],
+        default=0
+    )
+    return statements, final, events
+
+
+def screen_columns(analyzers: Optional[List[str]] = None) -> List[str]:
+    """Các cột cần đọc từ feature store cho các analyzer (OHLCV + cột chỉ báo/nhãn)"""
+    columns = list(OHLCV_COLUMNS)
+    for name in resolve_indicators(get_analyzers(analyzers)):
+        columns += [column for column in INDICATORS[name].columns if column not in columns]
+    return columns
+
+
+def _read_windows(store, symbols: List[str], start_date: str, end_date: str, wanted: set, columns: List[str]):
+    """
+    Đọc cửa sổ của một nhóm mã (hàm cấp module để chạy trên process pool)
+
+    Returns:
+        List theo mã: (DataFrame, exchange) nếu đủ dữ liệu, False nếu phải bỏ qua, None nếu thuộc sàn khác
+    """
+    loaded = []
+    for symbol in symbols:
+        meta = store.metadata(symbol)
+        if meta is None or str(meta.get('exchange', '')).upper() not in wanted:
+            loaded.append(None)
+            continue
+        frame = store.read(symbol, start_date, end_date, columns) if store.covers(meta, start_date, end_date) else None
+        loaded.append((frame, meta['exchange']) if frame is not None and len(frame) >= 2 else False)
+    return loaded
+
+
+def load_screen_frames(store, start_date: str, end_date: str, exchanges: List[str],
+                       columns: Optional[List[str]] = None, workers: int = None,
+                       symbols: Optional[List[str]] = None) -> Tuple[List[str], List[pd.DataFrame], List[str], int]:
+    """
+    Đọc cửa sổ [start_date, end_date] của tất cả các mã trong feature store thuộc các sàn cho trước
+
+    Mã chưa cập nhật đến phiên gần nhất (hoặc thiếu lịch sử) bị bỏ qua như khi /predict
+    không dùng được store.
+
+    Args:
+        symbols: Chỉ đọc các mã này (mặc định tất cả các mã trong store); mã không có trong store bị bỏ qua
+
+    Returns:
+        Tuple (symbols, frames, exchanges, số mã bị bỏ qua)
+    """
+    wanted = {exchange.upper() for exchange in exchanges}
+    if 'HSX' in wanted:
+        wanted.add('HOSE')
+    all_symbols = store.symbols() if symbols is None else list(symbols)
+    workers = max(workers or SCREEN_WORKERS, 1)
+
+    if workers == 1 or len(all_symbols) < 2 * workers:
+        loaded = _read_windows(store, all_symbols, start_date, end_date, wanted, columns)
+    else:
+        chunk_size = -(-len(all_symbols) // workers)
+        chunks = [all_symbols[i:i + chunk_size] for i in range(0, len(all_symbols), chunk_size)]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_read_windows, store, chunk, start_date, end_date, wanted, columns) for chunk in chunks]
+            loaded = [item for future in futures for item in future.result()]
+
+    symbols, frames, symbol_exchanges, skipped = [], [], [], 0
+    for symbol, item in zip(all_symbols, loaded):
+        if item is None:
+            continue
+        if item is False:
+            skipped += 1
+            continue
+        symbols.append(symbol)
+        frames.append(item[0])
+        symbol_exchanges.append(item[1])
+    return symbols, frames, symbol_exchanges, skipped
+
+
+# Kết quả chưa lọc theo (khoảng ngày, sàn, analyzer), dùng lại cho đến khi feature store thay đổi
+_screen_cache: Dict[tuple, tuple] = {}
+_screen_cache_lock = threading.Lock()
+_SCREEN_CACHE_SIZE = 8
+
+
+def _store_signature(store) -> tuple:
+    """Số file và thời điểm sửa đổi mới nhất của feature store"""
+    entries = [entry for entry in os.scandir(store.root_dir) if entry.name.endswith('.npz')]
+    return len(entries), max((entry.stat().st_mtime_ns for entry in entries), default=0)
+
+
+def screen_market(store, start_date: str, end_date: str, exchanges: Optional[List[str]] = None,
+                  analyzers: Optional[List[str]] = None) -> Tuple[pd.DataFrame, int]:
+    """
+    Chạy screener cho tất cả các mã trong feature store
+
+    Returns:
+        Tuple (DataFrame mỗi dòng một mã: symbol, exchange, date, close, final_statement,
+               statements (dict), events (list); số mã bị bỏ qua)
+    """
+    exchanges = sorted({exchange.upper() for exchange in exchanges or SCREEN_EXCHANGES})
+    key = (store.root_dir, start_date, end_date, tuple(exchanges), tuple(analyzers) if analyzers else None)
+    signature = _store_signature(store)
+    with _screen_cache_lock:
+        cached = _screen_cache.get(key)
+    if cached is not None and cached[0] == signature:
+        return cached[1], cached[2]
+
+    symbols, frames, symbol_exchanges, skipped = load_screen_frames(
+        store, start_date, end_date, exchanges, screen_columns(analyzers)
+    )
+    columns = ['symbol', 'exchange', 'date', 'close', 'final_statement', 'statements', 'events']
+    if not frames:
+        return pd.DataFrame(columns=columns), skipped
+
+    statements, final, events = screen_panel(frames, symbol_exchanges, analyzers)
+    results = pd.DataFrame({
+        'symbol': symbols,
+        'exchange': symbol_exchanges,
+        'date': [frame['Date'].iloc[-1].strftime('%Y-%m-%d') for frame in frames],
+        'close': [float(frame['Close'].iloc[-1]) for frame in frames],
+        'final_statement': [STATEMENT_LABELS[value] for value in final],
+        'statements': [
+            {name: STATEMENT_LABELS[values[i]] for name, values in statements.items()}
+            for i in range(len(frames))
+        ],
+        'events': events,
+    }, columns=columns)
+
+    with _screen_cache_lock:
+        if len(_screen_cache) >= _SCREEN_CACHE_SIZE and key not in _screen_cache:
+            _screen_cache.pop(next(iter(_screen_cache)))
+        _screen_cache[key] = (signature, results, skipped)
+    return results, skipped
+
+
+def filter_screen(results: pd.DataFrame, final_statement: Optional[str] = None,
+                  statements: Optional[Dict[str, str]] = None, events: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Lọc kết quả screener (các điều kiện kết hợp bằng AND)
+
+    Args:
+        final_statement: BUY/SELL/HOLD
+        statements: {analyzer: BUY/SELL/HOLD}; tên analyzer không phân biệt hoa thường
+        events: Các sự kiện trong SCREEN_EVENTS phải cùng xảy ra ở phiên cuối
+    """
+    mask = np.ones(len(results), dtype=bool)
+    if final_statement:
+        mask &= (results['final_statement'] == final_statement.upper()).to_numpy()
+    for name, value in (statements or {}).items():
+        name = get_analyzers([name])[0].name
+        mask &= np.array([row.get(name) == value.upper() for row in results['statements']], dtype=bool)
+    for event in events or []:
+        mask &= np.array([event in row for row in results['events']], dtype=bool)
+    return results[mask].reset_index(drop=True)
+
+
+def validate_screen_criteria(statements: Optional[Dict[str, str]] = None, events: Optional[List[str]] = None,
+                             final_statement: Optional[str] = None, exchanges: Optional[List[str]] = None,
+                             analyzers: Optional[List[str]] = None) -> None:
+    """
+    Báo lỗi ValueError nếu điều kiện lọc không hợp lệ
+
+    Args:
+        analyzers: Các analyzer được quét (mặc định tất cả); statements chỉ được lọc theo các analyzer này
+    """
+    labels = set(STATEMENT_LABELS.values())
+    if final_statement and final_statement.upper() not in labels:
+        raise ValueError(f"final_statement '{final_statement}' không hợp lệ. Chỉ hỗ trợ: BUY, SELL, HOLD")
+    screened = {analyzer.name for analyzer in get_analyzers(analyzers)}
+    for name, value in (statements or {}).items():
+        canonical = get_analyzers([name])[0].name
+        if canonical not in screened:
+            raise ValueError(
+                f"Analyzer '{name}' không nằm trong các analyzer được quét: {', '.join(sorted(screened))}"
+            )
+        if value.upper() not in labels:
+            raise ValueError(f"Statement '{value}' của {name} không hợp lệ. Chỉ hỗ trợ: BUY, SELL, HOLD")
+    unknown = [event for event in events or [] if event not in SCREEN_EVENTS]
+    if unknown:
+        raise ValueError(f"Sự kiện không hợp lệ: {', '.join(unknown)}. Chỉ hỗ trợ: {', '.join(SCREEN_EVENTS)}")
+    unknown = [exchange for exchange in exchanges or [] if exchange.upper() not in SCREEN_EXCHANGES]
+    if unknown:
+        raise ValueError(f"Sàn không hợp lệ: {', '.join(unknown)}. Chỉ hỗ trợ: {', '.join(SCREEN_EXCHANGES)}")
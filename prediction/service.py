@@ -0,0 +1,508 @@
+"""
+Lõi của /predict dùng chung cho endpoint đơn lẻ và /predict/batch.
+
+predict_symbol nhận các tham số của PredictRequest, đọc dữ liệu (feature store hoặc
+API, hoặc bản ghi đã lấy sẵn theo lô) và trả về đúng response của /predict. Lỗi có
+mã HTTP được báo bằng PredictError (pickle được để chạy trên process pool).
+
+iter_predict_batch chạy nhiều yêu cầu trên pool riêng và trả về từng kết quả ngay khi
+xong: các mã có trong feature store được tính trước, các mã còn lại được lấy từ API
+theo lô (một truy vấn phân trang cho nhiều mã) rồi mới tính.
+
+Kết quả được cache trong bộ nhớ theo (mã, range, khung nến, cửa sổ ngày, nến cuối, version
+các analyzer). Với mã trong feature store, nến cuối được xác định từ file của mã (last_date
+và thời điểm ghi) trước khi đọc dữ liệu nên request lặp lại chỉ tốn một lần stat; khi job
+ghi nến mới vào store khóa thay đổi và kết quả được tính lại. Với dữ liệu lấy từ API, khóa
+gồm ngày và OHLCV của nến cuối (nến trong phiên vẫn thay đổi) nên chỉ bỏ qua phần tính toán.
+
+Biến môi trường:
+- PREDICT_BATCH_EXECUTOR: "process" (mặc định), "thread" hoặc "serial" - pool chạy các yêu cầu của batch
+- PREDICT_BATCH_WORKERS: số worker của pool (mặc định số CPU, tối đa 8)
+- PREDICT_BATCH_FETCH_SIZE: số mã mỗi truy vấn lấy dữ liệu theo lô (mặc định 50)
+- PREDICT_CACHE_SIZE: số kết quả tối đa giữ trong cache (mặc định 4096, 0 để tắt)
+"""
+import os
+import datetime
+import threading
+import traceback
+from collections import OrderedDict
+from functools import lru_cache
+from concurrent.futures import Future, as_completed
+from typing import Dict, Iterator, List, Optional, Tuple
+import pandas as pd
+from dotenv import load_dotenv
+import sys
+
+# Thêm parent directory vào path để import
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils import (
+    fetch_stock_data, fetch_stock_history, fetch_stocks_history, records_to_price_frame,
+    get_start_date_for_trading_days
+)
+from indicators.trend_analysis import calculate_trend
+from indicators.features import trends_from_frame, OHLCV_COLUMNS
+from indicators.resample import resample_ohlcv, normalize_timeframe, BARS_PER_TIMEFRAME
+from prediction.future_prediction import predict_future_trend, PREDICT_DETAIL_LEVELS
+from prediction.registry import get_analyzers, analyzer_versions, prepare_frame
+from prediction.executor import get_executor
+from prediction.screener import screen_columns
+from storage.feature_store import feature_store
+
+load_dotenv()
+
+PREDICT_RANGES = {'short': 60, 'long': 180}
+PREDICT_BATCH_EXECUTOR = os.getenv('PREDICT_BATCH_EXECUTOR', 'process').lower()
+PREDICT_BATCH_WORKERS = int(os.getenv('PREDICT_BATCH_WORKERS', str(min(os.cpu_count() or 1, 8))))
+PREDICT_BATCH_FETCH_SIZE = int(os.getenv('PREDICT_BATCH_FETCH_SIZE', '50'))
+PREDICT_CACHE_SIZE = int(os.getenv('PREDICT_CACHE_SIZE', '4096'))
+
+
+class PredictError(Exception):
+    """Lỗi của /predict kèm mã HTTP"""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(status_code, detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def load_precomputed_window(symbol: str, start_date: str, end_date: str, timeframe: str = "D",
+                            columns: Optional[List[str]] = None):
+    """
+    Đọc cửa sổ dữ liệu đã tính sẵn từ feature store
+
+    Feature store lưu chỉ báo theo nến ngày; với khung tuần/tháng chỉ dùng lại OHLCV
+    và chỉ báo sẽ được tính trên nến đã gộp.
+
+    Args:
+        columns: Chỉ đọc các cột này (mặc định tất cả)
+
+    Returns:
+        (DataFrame, exchange) hoặc None nếu store không được cấu hình / chưa đủ dữ liệu
+    """
+    if feature_store is None:
+        return None
+    try:
+        precomputed = feature_store.read_fresh_window(symbol, start_date, end_date, columns)
+    except Exception:
+        # Store lỗi thì quay về tính trực tiếp
+        traceback.print_exc()
+        return None
+    if precomputed is not None and timeframe != "D":
+        df, exchange = precomputed
+        return df[OHLCV_COLUMNS], exchange
+    return precomputed
+
+
+def fetch_candles(symbol: str, start_date: str = None, end_date: str = None, timeframe: str = "D") -> list:
+    """Lấy dữ liệu nến ngày; khung tuần/tháng cần nhiều năm nên duyệt qua tất cả các trang"""
+    if timeframe != "D" and start_date and end_date:
+        return fetch_stock_history(symbol, start_date, end_date)
+    return fetch_stock_data(symbol, start_date, end_date)
+
+
+def resolve_predict_window(range_value: str, end_date: Optional[str] = None, timeframe: str = "D",
+                           analyzers: Optional[List[str]] = None, detail: str = "full") -> Tuple[str, str, str, str]:
+    """
+    Kiểm tra tham số (gồm mức chi tiết detail) và tính khoảng ngày cần lấy cho /predict
+
+    Returns:
+        Tuple (range, timeframe, start_date, end_date) với ngày dạng YYYY-MM-DD
+    """
+    if not range_value or range_value.lower() not in PREDICT_RANGES:
+        raise PredictError(400, f"Tham số 'range' phải là 'short' hoặc 'long', giá trị nhận được: '{range_value}'")
+    if detail not in PREDICT_DETAIL_LEVELS:
+        raise PredictError(
+            400, f"Tham số 'detail' phải là một trong: {', '.join(PREDICT_DETAIL_LEVELS)}, giá trị nhận được: '{detail}'"
+        )
+    end_key = end_date or datetime.datetime.now().strftime('%Y-%m-%d')
+    try:
+        _parse_end_date(end_key)
+    except ValueError:
+        raise PredictError(400, f"Tham số 'endDate' phải có dạng YYYY-MM-DD, giá trị nhận được: '{end_date}'")
+    range_value = range_value.lower()
+    try:
+        timeframe = normalize_timeframe(timeframe)
+        get_analyzers(analyzers)
+    except ValueError as e:
+        raise PredictError(400, str(e))
+
+    # Số nến x số phiên mỗi nến để đảm bảo đủ ngày giao dịch
+    required_trading_days = PREDICT_RANGES[range_value] * BARS_PER_TIMEFRAME[timeframe]
+    return (range_value, timeframe) + _trading_window(end_key, required_trading_days)
+
+
+@lru_cache(maxsize=1024)
+def _parse_end_date(end_date: str) -> pd.Timestamp:
+    return pd.to_datetime(end_date, format='%Y-%m-%d')
+
+
+@lru_cache(maxsize=1024)
+def _trading_window(end_date: str, trading_days: int) -> Tuple[str, str]:
+    """(start_date, end_date) dạng YYYY-MM-DD; nhớ kết quả vì request lặp lại dùng cùng cửa sổ"""
+    end = _parse_end_date(end_date)
+    start = get_start_date_for_trading_days(end, trading_days)
+    return start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d')
+
+
+def prepare_predict_frame(symbol: str, timeframe: str, start_date: str, end_date: str,
+                          records: Optional[list] = None, columns: Optional[List[str]] = None):
+    """
+    Dữ liệu cho predict: feature store nếu đủ, không thì bản ghi đã lấy sẵn hoặc gọi API
+
+    Args:
+        columns: Cột cần đọc từ feature store (mặc định tất cả)
+
+    Returns:
+        Tuple (df, trends, exchange, data_start_date, data_end_date)
+    """
+    # Dùng chỉ báo và nhãn đã tính sẵn nếu feature store đã cập nhật đến end_date
+    precomputed = load_precomputed_window(symbol, start_date, end_date, timeframe, columns)
+    if precomputed is not None and len(precomputed[0]) >= 2:
+        df, exchange = precomputed
+        data_start_date = df['Date'].iloc[0].strftime('%Y-%m-%d')
+        data_end_date = df['Date'].iloc[-1].strftime('%Y-%m-%d')
+        if timeframe == "D":
+            trends = trends_from_frame(df, symbol, exchange)
+        else:
+            # Khung tuần/tháng: gộp OHLCV từ store, chỉ báo được tính lại trên nến đã gộp
+            df = resample_ohlcv(df, timeframe, symbol)
+            trends = calculate_trend(df, symbol, data_start_date, data_end_date, exchange)
+        return df, trends, exchange, data_start_date, data_end_date
+
+    data = records if records is not None else fetch_candles(symbol, start_date, end_date, timeframe)
+    if not data:
+        raise PredictError(
+            404,
+            f"Không tìm thấy dữ liệu cho mã chứng khoán '{symbol}' trong khoảng thời gian từ {start_date} đến {end_date}"
+        )
+    elif len(data) < 2:
+        raise PredictError(
+            422,
+            f"Dữ liệu cho mã '{symbol}' không đủ để phân tích. Cần ít nhất 2 điểm dữ liệu, nhận được {len(data)}."
+        )
+
+    # Extract actual date range (parse một lần cho cả danh sách) và exchange
+    dates = pd.to_datetime([item["time"] for item in data])
+    data_start_date = dates.min().strftime('%Y-%m-%d')
+    data_end_date = dates.max().strftime('%Y-%m-%d')
+    exchange = data[0].get("stock_code", {}).get("exchange", "Unknown")
+
+    # Prepare DataFrame (Date giữ kiểu datetime64 trong suốt pipeline)
+    df = records_to_price_frame(data)
+    df = resample_ohlcv(df, timeframe, symbol)
+
+    # Chỉ báo cho các analyzer được predict_future_trend tính một lần theo registry
+    # (support/resistance không được analyzer nào đọc nên không tính ở đây)
+
+    # Phân tích trends trước để dùng cho candle patterns
+    trends = calculate_trend(df, symbol, data_start_date, data_end_date, exchange)
+    return df, trends, exchange, data_start_date, data_end_date
+
+
+# Cache kết quả predict (LRU) và last_date của từng file trong store theo chữ ký file
+_predict_cache: "OrderedDict[tuple, Dict]" = OrderedDict()
+_store_last_dates: Dict[str, tuple] = {}
+_predict_cache_lock = threading.Lock()
+
+
+def store_bar_key(symbol: str, start_date: str, end_date: str) -> Optional[tuple]:
+    """
+    Nến cuối của mã trong feature store nếu store đủ dữ liệu cho cửa sổ
+
+    Returns:
+        ("store", last_date, chữ ký file) hoặc None nếu cửa sổ phải lấy từ API
+    """
+    if feature_store is None:
+        return None
+    signature = feature_store.file_signature(symbol)
+    if signature is None:
+        return None
+    cached = _store_last_dates.get(symbol)
+    if cached is not None and cached[0] == signature:
+        meta = cached[1]
+    else:
+        # Chỉ đọc metadata khi file được ghi lại
+        try:
+            meta = feature_store.metadata(symbol)
+        except Exception:
+            return None
+        _store_last_dates[symbol] = (signature, meta)
+    if not feature_store.covers(meta, start_date, end_date):
+        return None
+    return "store", meta['last_date'], signature
+
+
+def _frame_bar_key(df: pd.DataFrame) -> tuple:
+    """Nến cuối của dữ liệu đã lấy: ngày, số nến và OHLCV (nến trong phiên có thể còn thay đổi)"""
+    return ("api", len(df)) + tuple(df[OHLCV_COLUMNS].iloc[-1].tolist())
+
+
+def _predict_cache_key(symbol: str, range_name: str, timeframe: str, start_date: str, end_date: str,
+                       analyzers: Optional[List[str]], bar_key: tuple, detail: str = "full") -> tuple:
+    return (symbol, range_name, timeframe, start_date, end_date, analyzer_versions(analyzers), bar_key, detail)
+
+
+def _cache_get(key: Optional[tuple]) -> Optional[Dict]:
+    if key is None or PREDICT_CACHE_SIZE <= 0:
+        return None
+    with _predict_cache_lock:
+        response = _predict_cache.get(key)
+        if response is not None:
+            _predict_cache.move_to_end(key)
+        return response
+
+
+def _cache_put(key: Optional[tuple], response: Dict) -> None:
+    if key is None or PREDICT_CACHE_SIZE <= 0:
+        return
+    with _predict_cache_lock:
+        _predict_cache[key] = response
+        _predict_cache.move_to_end(key)
+        while len(_predict_cache) > PREDICT_CACHE_SIZE:
+            _predict_cache.popitem(last=False)
+
+
+def clear_predict_cache() -> None:
+    """Xóa cache kết quả predict"""
+    with _predict_cache_lock:
+        _predict_cache.clear()
+        _store_last_dates.clear()
+
+
+def predict_symbol(symbol: str, range_value: str, end_date: Optional[str] = None, timeframe: str = "D",
+                   timing: bool = False, analyzers: Optional[List[str]] = None,
+                   records: Optional[list] = None, executor: Optional[str] = None, detail: str = "full") -> Dict:
+    """
+    Dự đoán xu hướng cho một mã (response của /predict)
+
+    Kết quả được lấy từ cache nếu nến cuối và version các analyzer không đổi (trừ khi
+    timing=True vì khi đó cần đo lại). Response trả về được dùng chung, không sửa tại chỗ.
+    Với feature store chỉ các cột mà analyzer được bật cần mới được đọc.
+
+    Args:
+        symbol, range_value, end_date, timeframe, timing, analyzers, detail: Như PredictRequest
+        records: Bản ghi đã lấy sẵn từ API cho khoảng ngày của yêu cầu (dùng khi store không đủ)
+        executor: Chế độ chạy các analyzer (mặc định ANALYZER_EXECUTOR)
+
+    Returns:
+        Dict chứa final_statement (BUY/SELL/HOLD) và analysis chi tiết (detail="full"),
+        statements của từng analyzer (detail="statements") hoặc chỉ final_statement (detail="final")
+
+    Raises:
+        PredictError: Tham số không hợp lệ (400), không có dữ liệu (404) hoặc không đủ dữ liệu (422)
+    """
+    symbol = symbol.upper()
+    range_name, timeframe, start_date_str, end_date_str = resolve_predict_window(
+        range_value, end_date, timeframe, analyzers, detail
+    )
+
+    cache_key = None
+    if not timing:
+        bar_key = store_bar_key(symbol, start_date_str, end_date_str)
+        if bar_key is not None:
+            cache_key = _predict_cache_key(
+                symbol, range_name, timeframe, start_date_str, end_date_str, analyzers, bar_key, detail
+            )
+            cached = _cache_get(cache_key)
+            if cached is not None:
+                return cached
+
+    df, trends, exchange, data_start_date, data_end_date = prepare_predict_frame(
+        symbol, timeframe, start_date_str, end_date_str, records, columns=screen_columns(analyzers)
+    )
+    if not timing and cache_key is None:
+        cache_key = _predict_cache_key(
+            symbol, range_name, timeframe, start_date_str, end_date_str, analyzers, _frame_bar_key(df), detail
+        )
+        cached = _cache_get(cache_key)
+        if cached is not None:
+            return cached
+
+    # Dự đoán tương lai với các analyzer được bật (mặc định 5 phương pháp)
+    future_prediction = predict_future_trend(
+        df, trends, exchange, executor=executor, include_timing=timing, analyzers=analyzers, detail=detail
+    )
+
+    response = _predict_response(
+        symbol, range_name, timeframe, exchange, data_start_date, data_end_date, future_prediction, detail
+    )
+    if timing:
+        response["timing_ms"] = future_prediction.get("timing_ms", {})
+    _cache_put(cache_key, response)
+    return response
+
+
+def _predict_response(symbol: str, range_value: str, timeframe: str, exchange: str, data_start_date: str,
+                      data_end_date: str, future_prediction: Dict, detail: str) -> Dict:
+    """Response /predict theo mức chi tiết từ kết quả của predict_future_trend"""
+    response = {
+        "symbol": symbol,
+        "startDate": data_start_date,
+        "endDate": data_end_date,
+        "range": range_value,
+        "exchange": exchange,
+        "timeframe": timeframe,
+        "final_statement": future_prediction["final_statement"],
+    }
+    if detail == "full":
+        response["analysis"] = future_prediction["analysis"]
+    elif detail == "statements":
+        response["statements"] = future_prediction["statements"]
+    return response
+
+
+def analyze_symbol(symbol: str, range_value: str, end_date: Optional[str] = None, timeframe: str = "D",
+                   analyzers: Optional[List[str]] = None, executor: Optional[str] = None,
+                   detail: str = "full") -> Tuple[Dict, pd.DataFrame, list, Dict]:
+    """
+    Dự đoán cho /analyze và trả kèm frame dùng chung để vẽ biểu đồ
+
+    Dữ liệu được lấy một lần (feature store hoặc một lần gọi API), chỉ báo của các analyzer
+    được tính một lần trên frame này; biểu đồ dùng lại frame, trends và tín hiệu đã tính.
+    Không dùng cache của /predict vì frame cũng cần cho biểu đồ.
+
+    Args:
+        symbol, range_value, end_date, timeframe, analyzers, detail: Như PredictRequest
+        executor: Chế độ chạy các analyzer (mặc định ANALYZER_EXECUTOR)
+
+    Returns:
+        Tuple (response như /predict, frame đã có chỉ báo, trends, {tên analyzer: tín hiệu chưa format})
+
+    Raises:
+        PredictError: Như predict_symbol
+    """
+    symbol = symbol.upper()
+    range_name, timeframe, start_date_str, end_date_str = resolve_predict_window(
+        range_value, end_date, timeframe, analyzers, detail
+    )
+    # Đọc tất cả cột từ store vì biểu đồ có thể cần chỉ báo mà analyzer không dùng
+    df, trends, exchange, data_start_date, data_end_date = prepare_predict_frame(
+        symbol, timeframe, start_date_str, end_date_str
+    )
+    frame = prepare_frame(df, get_analyzers(analyzers), trends, exchange)
+    future_prediction = predict_future_trend(
+        frame, trends, exchange, executor=executor, analyzers=analyzers, detail=detail, include_signals=True
+    )
+    response = _predict_response(
+        symbol, range_name, timeframe, exchange, data_start_date, data_end_date, future_prediction, detail
+    )
+    return response, frame, trends, future_prediction.get("signals", {})
+
+
+def _records_in_range(records: list, start_date: str, end_date: str) -> list:
+    """Bản ghi có ngày trong [start_date, end_date] (như bộ lọc $dateBetween của API)"""
+    return [record for record in records if start_date <= str(record.get("time", ""))[:10] <= end_date]
+
+
+def _predict_batch_item(index: int, item: Dict, records: Optional[list]) -> Dict:
+    """
+    Chạy một yêu cầu của batch (hàm cấp module để chạy trên process pool)
+
+    Returns:
+        Dòng kết quả: index, symbol, status (mã HTTP) và result hoặc detail
+    """
+    symbol = str(item.get("symbol", "")).upper()
+    try:
+        # Các yêu cầu đã chạy song song trên pool của batch nên analyzer chạy tuần tự
+        result = predict_symbol(
+            symbol, item.get("range"), item.get("endDate"), item.get("timeframe", "D"),
+            item.get("timing", False), item.get("analyzers"), records=records, executor="serial",
+            detail=item.get("detail", "full")
+        )
+        return {"index": index, "symbol": symbol, "status": 200, "result": result}
+    except PredictError as e:
+        return {"index": index, "symbol": symbol, "status": e.status_code, "detail": e.detail}
+    except Exception as e:
+        traceback.print_exc()
+        return {"index": index, "symbol": symbol, "status": 500, "detail": f"Lỗi khi xử lý dữ liệu hoặc dự đoán: {str(e)}"}
+
+
+def _submit(pool, index: int, item: Dict, records: Optional[list]) -> Future:
+    """Đưa một yêu cầu lên pool; chế độ serial chạy ngay và trả về Future đã xong"""
+    if pool is not None:
+        return pool.submit(_predict_batch_item, index, item, records)
+    future = Future()
+    future.set_result(_predict_batch_item(index, item, records))
+    return future
+
+
+def iter_predict_batch(items: List[Dict], executor: Optional[str] = None) -> Iterator[Dict]:
+    """
+    Chạy nhiều yêu cầu predict và trả về từng dòng kết quả theo thứ tự hoàn thành
+
+    Args:
+        items: Các yêu cầu dạng dict (các trường của PredictRequest)
+        executor: "process" / "thread" / "serial" (mặc định PREDICT_BATCH_EXECUTOR)
+
+    Yields:
+        Dòng kết quả của _predict_batch_item (có index theo thứ tự trong items)
+    """
+    pool = get_executor(executor or PREDICT_BATCH_EXECUTOR, name='predict_batch', max_workers=PREDICT_BATCH_WORKERS)
+
+    # Kiểm tra tham số trước, yêu cầu lỗi được trả về ngay
+    to_fetch = []
+    futures = []
+    cache_keys = {}
+    for index, item in enumerate(items):
+        symbol = str(item.get("symbol", "")).upper()
+        try:
+            range_name, timeframe, start_date, end_date = resolve_predict_window(
+                item.get("range"), item.get("endDate"), item.get("timeframe", "D"), item.get("analyzers"),
+                item.get("detail", "full")
+            )
+        except PredictError as e:
+            yield {"index": index, "symbol": symbol, "status": e.status_code, "detail": e.detail}
+            continue
+        except Exception as e:
+            # Như /predict: lỗi khác (vd. endDate sai định dạng) trả về 500
+            yield {"index": index, "symbol": symbol, "status": 500, "detail": f"Lỗi khi xử lý dữ liệu hoặc dự đoán: {str(e)}"}
+            continue
+        bar_key = store_bar_key(symbol, start_date, end_date)
+        if bar_key is not None:
+            # Mã trong store: trả về ngay nếu đã có trong cache, không thì tính và lưu lại ở tiến trình này
+            if not item.get("timing"):
+                cache_keys[index] = _predict_cache_key(
+                    symbol, range_name, timeframe, start_date, end_date, item.get("analyzers"), bar_key,
+                    item.get("detail", "full")
+                )
+                cached = _cache_get(cache_keys[index])
+                if cached is not None:
+                    yield {"index": index, "symbol": symbol, "status": 200, "result": cached}
+                    continue
+            futures.append(_submit(pool, index, item, None))
+        else:
+            to_fetch.append((index, item, symbol, start_date, end_date))
+
+    # Các mã cần gọi API: mỗi truy vấn lấy chung nhiều mã trên khoảng ngày bao trùm
+    for offset in range(0, len(to_fetch), PREDICT_BATCH_FETCH_SIZE):
+        chunk = to_fetch[offset:offset + PREDICT_BATCH_FETCH_SIZE]
+        try:
+            history = fetch_stocks_history(
+                sorted({symbol for _, _, symbol, _, _ in chunk}),
+                min(start for _, _, _, start, _ in chunk),
+                max(end for _, _, _, _, end in chunk)
+            )
+        except Exception:
+            # Lấy theo lô lỗi thì để từng yêu cầu tự gọi API
+            traceback.print_exc()
+            history = None
+        for index, item, symbol, start_date, end_date in chunk:
+            records = None if history is None else _records_in_range(history.get(symbol, []), start_date, end_date)
+            futures.append(_submit(pool, index, item, records))
+
+        # Trả về các kết quả đã xong trong lúc chờ lấy dữ liệu lô tiếp theo
+        done = [future for future in futures if future.done()]
+        for future in done:
+            futures.remove(future)
+            yield _cache_batch_line(future.result(), cache_keys)
+
+    for future in as_completed(futures):
+        yield _cache_batch_line(future.result(), cache_keys)
+
+
+def _cache_batch_line(line: Dict, cache_keys: Dict[int, tuple]) -> Dict:
+    """Lưu kết quả thành công của mã trong store vào cache (worker process có cache riêng)"""
+    if line["status"] == 200:
+        _cache_put(cache_keys.get(line["index"]), line["result"])
+    return line
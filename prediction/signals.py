@@ -0,0 +1,186 @@
+"""
+Tín hiệu của analyzer dạng mảng có cấu trúc, reason chỉ được format khi cần.
+
+Analyzer trả về SignalArray: ngày của nến, mã action (+1 BUY, -1 SELL, 0 HOLD), chỉ số luật
+và các tham số số của từng tín hiệu. Statement, backtest và screener chỉ cần đếm action trên
+mảng; reason / code dạng chữ được dựng bởi hàm format của analyzer (reason(rule, params),
+code(rule, params) - hàm cấp module để dùng được với process pool) khi tín hiệu thực sự được
+trả ra ngoài (response /predict, Telegram, lịch sử tín hiệu).
+
+Analyzer tự đăng ký vẫn có thể trả về list dict (date, action, reason); các hàm signal_counts /
+signal_dicts dùng được cho cả hai dạng.
+"""
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+import sys
+import os
+
+# Thêm parent directory vào path để import
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils import DISPLAY_DATE_FORMAT
+
+ACTION_CODES = {"BUY": 1, "SELL": -1, "HOLD": 0}
+ACTION_NAMES = {1: "BUY", -1: "SELL", 0: "HOLD"}
+
+
+class SignalArray:
+    """
+    Danh sách tín hiệu của một analyzer dưới dạng các mảng cùng độ dài
+
+    Args:
+        dates: Ngày (datetime64) của từng tín hiệu
+        actions: Mã action (+1 BUY, -1 SELL, 0 HOLD)
+        rules: Chỉ số luật của analyzer
+        params: Mảng (số tín hiệu x số tham số) truyền cho hàm format
+        reason: Hàm reason(rule, params) -> chuỗi reason
+        code: Hàm code(rule, params) -> mã luật ổn định (mặc định "rule_<chỉ số>")
+        strengths: Strength của từng tín hiệu (chỉ Candle)
+        labels: Nhãn ngày thay cho dates (ví dụ trend period của Candle); None = dùng dates
+        positions: Vị trí nến trong frame của analyzer
+    """
+
+    __slots__ = ('dates', 'actions', 'rules', 'params', 'reason', 'code', 'strengths', 'labels', 'positions')
+
+    def __init__(self, dates, actions, rules, params, reason: Callable, code: Optional[Callable] = None,
+                 strengths=None, labels=None, positions=None):
+        self.dates = np.asarray(dates, dtype='datetime64[ns]')
+        self.actions = np.asarray(actions, dtype=np.int8)
+        self.rules = np.asarray(rules, dtype=np.int64)
+        params = np.asarray(params, dtype='float64')
+        # Một tham số cho mỗi tín hiệu có thể truyền dạng mảng 1 chiều
+        self.params = params[:, None] if params.ndim == 1 else params
+        self.reason = reason
+        self.code = code
+        self.strengths = None if strengths is None else np.asarray(strengths, dtype=np.int64)
+        self.labels = None if labels is None else np.asarray(labels, dtype=object)
+        self.positions = None if positions is None else np.asarray(positions, dtype=np.int64)
+
+    def __len__(self) -> int:
+        return len(self.actions)
+
+    def counts(self) -> Tuple[int, int]:
+        """Số tín hiệu BUY và SELL"""
+        return int(np.sum(self.actions == 1)), int(np.sum(self.actions == -1))
+
+    def select(self, mask) -> "SignalArray":
+        """Các tín hiệu theo mặt nạ / chỉ số (giữ nguyên hàm format)"""
+        return SignalArray(
+            self.dates[mask], self.actions[mask], self.rules[mask], self.params[mask], self.reason, self.code,
+            None if self.strengths is None else self.strengths[mask],
+            None if self.labels is None else self.labels[mask],
+            None if self.positions is None else self.positions[mask],
+        )
+
+    def date_labels(self) -> List[str]:
+        """Ngày hiển thị (DISPLAY_DATE_FORMAT) hoặc nhãn của từng tín hiệu"""
+        # datetime của Python format nhanh hơn DatetimeIndex.strftime với số tín hiệu nhỏ
+        formatted = [date.strftime(DISPLAY_DATE_FORMAT) if date is not None else None
+                     for date in self.dates.astype('datetime64[us]').tolist()]
+        if self.labels is None:
+            return formatted
+        return [label if label is not None else date for label, date in zip(self.labels, formatted)]
+
+    def reason_at(self, i: int) -> str:
+        return self.reason(int(self.rules[i]), self.params[i])
+
+    def code_at(self, i: int) -> str:
+        rule = int(self.rules[i])
+        return self.code(rule, self.params[i]) if self.code is not None else f"rule_{rule}"
+
+    def to_dicts(self, include_reason: bool = True) -> List[Dict]:
+        """
+        Tín hiệu dạng dict (date, action, reason, code và strength nếu có)
+
+        Args:
+            include_reason: False khi chỉ cần ngày và action (không format reason / code)
+        """
+        signals = []
+        for i, date in enumerate(self.date_labels()):
+            signal = {"date": date, "action": ACTION_NAMES[int(self.actions[i])]}
+            if include_reason:
+                signal["reason"] = self.reason_at(i)
+                signal["code"] = self.code_at(i)
+            if self.strengths is not None:
+                signal["strength"] = int(self.strengths[i])
+            signals.append(signal)
+        return signals
+
+
+def empty_signals(reason: Callable, code: Optional[Callable] = None, params: int = 0) -> SignalArray:
+    """SignalArray không có tín hiệu nào"""
+    return SignalArray(np.array([], dtype='datetime64[ns]'), [], [], np.empty((0, params)), reason, code)
+
+
+def signal_counts(signals) -> Tuple[int, int]:
+    """Số tín hiệu BUY và SELL của kết quả analyzer (SignalArray hoặc list dict)"""
+    if isinstance(signals, SignalArray):
+        return signals.counts()
+    if not signals:
+        return 0, 0
+    buy = sum(1 for signal in signals if signal.get('action') == 'BUY')
+    sell = sum(1 for signal in signals if signal.get('action') == 'SELL')
+    return buy, sell
+
+
+def signal_dicts(signals, include_reason: bool = True) -> List[Dict]:
+    """Kết quả analyzer dạng list dict; với SignalArray, reason chỉ được format tại đây"""
+    if isinstance(signals, SignalArray):
+        return signals.to_dicts(include_reason)
+    return list(signals or [])
+
+
+def signals_at(df: pd.DataFrame, positions, rules, rule_actions: List[str], params, reason: Callable,
+               code: Optional[Callable] = None, strengths=None, label_format: str = "Position {}") -> SignalArray:
+    """
+    SignalArray cho các nến tại positions của df
+
+    Args:
+        df: Frame của analyzer
+        positions: Vị trí các nến có tín hiệu (theo thứ tự trả về)
+        rules: Chỉ số luật tại từng vị trí
+        rule_actions: Action của từng luật (BUY/SELL/HOLD)
+        params: Tham số số cho hàm format (số tín hiệu x số tham số)
+        reason, code, strengths: Như SignalArray
+        label_format: Nhãn ngày khi df không có cột Date
+    """
+    positions = np.asarray(positions, dtype=np.int64)
+    rules = np.asarray(rules, dtype=np.int64)
+    labels = None
+    if 'Date' in df.columns:
+        dates = df['Date'].to_numpy(dtype='datetime64[ns]')[positions]
+    else:
+        dates = np.full(len(positions), np.datetime64('NaT'), dtype='datetime64[ns]')
+        labels = [label_format.format(i) for i in positions]
+    action_codes = np.array([ACTION_CODES[action] for action in rule_actions], dtype=np.int8)
+    return SignalArray(dates, action_codes[rules] if len(rules) else [], rules, params, reason, code,
+                       strengths, labels, positions)
+
+
+def concat_signals(parts: List[SignalArray], sort: bool = False) -> SignalArray:
+    """
+    Nối các SignalArray của cùng một analyzer (cùng hàm format và số tham số)
+
+    Args:
+        parts: Các SignalArray theo thứ tự
+        sort: Sắp xếp ổn định theo ngày sau khi nối
+    """
+    first = parts[0]
+
+    def joined(name):
+        values = [getattr(part, name) for part in parts]
+        if all(value is None for value in values):
+            return None
+        if name == 'labels':
+            values = [value if value is not None else np.full(len(part), None, dtype=object)
+                      for value, part in zip(values, parts)]
+        return np.concatenate(values)
+
+    signals = SignalArray(
+        np.concatenate([part.dates for part in parts]), np.concatenate([part.actions for part in parts]),
+        np.concatenate([part.rules for part in parts]), np.concatenate([part.params for part in parts]),
+        first.reason, first.code, joined('strengths'), joined('labels'), joined('positions')
+    )
+    if sort:
+        signals = signals.select(np.argsort(signals.dates, kind='stable'))
+    return signals
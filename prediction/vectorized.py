@@ -0,0 +1,112 @@
+"""
+Hàm dùng chung cho các bộ quét tín hiệu dạng mảng (vectorized).
+
+Mỗi analyzer biểu diễn các luật của mình thành mặt nạ boolean trên mảng numpy
+theo đúng thứ tự ưu tiên của bản tính từng dòng; first_rule trả về chỉ số luật
+đầu tiên thỏa mãn tại mỗi nến (NO_RULE nếu không có).
+
+Panel mode: nhiều mã được nối liền nhau trong một mảng, group_ids cho biết mã của
+từng dòng để các phép dịch (shift) và trung bình trượt không tràn sang mã khác.
+"""
+from typing import List, Optional, Sequence
+import numpy as np
+import pandas as pd
+
+NO_RULE = -1
+
+
+def shift(values, periods: int = 1, group_ids: Optional[Sequence] = None) -> np.ndarray:
+    """
+    Dịch mảng xuống `periods` dòng theo trục 0 (giá trị của nến trước), đầu mảng là NaN
+
+    Với group_ids, các dòng mà nến trước thuộc mã khác cũng là NaN.
+    Hỗ trợ mảng 2 chiều (nến x cột).
+    """
+    values = np.asarray(values, dtype='float64')
+    result = np.full(values.shape, np.nan)
+    if 0 < periods < len(values):
+        result[periods:] = values[:-periods]
+        if group_ids is not None:
+            groups = np.asarray(group_ids)
+            crossed = np.ones(len(values), dtype=bool)
+            crossed[periods:] = groups[periods:] != groups[:-periods]
+            result[crossed] = np.nan
+    return result
+
+
+def bar_positions(length: int, group_ids: Optional[Sequence] = None) -> np.ndarray:
+    """Vị trí của mỗi dòng trong mã của nó (0, 1, 2, ...); các mã phải nằm liền nhau"""
+    positions = np.arange(length)
+    if group_ids is None or length == 0:
+        return positions
+    groups = np.asarray(group_ids)
+    starts = np.ones(length, dtype=bool)
+    starts[1:] = groups[1:] != groups[:-1]
+    return positions - np.maximum.accumulate(np.where(starts, positions, 0))
+
+
+def first_rule(conditions: List[np.ndarray]) -> np.ndarray:
+    """Chỉ số luật đầu tiên đúng tại mỗi dòng (giống chuỗi if/elif), NO_RULE nếu không có"""
+    return np.select(conditions, np.arange(len(conditions)), default=NO_RULE)
+
+
+def rolling_mean(values, window: int, min_periods: int = None, group_ids: Optional[Sequence] = None) -> np.ndarray:
+    """Trung bình trượt (giống Series.rolling), tính riêng cho từng mã nếu có group_ids"""
+    series = pd.Series(np.asarray(values, dtype='float64'))
+    if group_ids is None:
+        return series.rolling(window=window, min_periods=min_periods).mean().to_numpy()
+    rolled = series.groupby(np.asarray(group_ids), sort=False).rolling(window=window, min_periods=min_periods).mean()
+    return rolled.droplevel(0).sort_index().to_numpy()
+
+
+def volume_filter_ratio(volume: np.ndarray, volume_avg: np.ndarray) -> np.ndarray:
+    """Tỷ lệ volume / trung bình dùng cho bộ lọc volume (1 nếu trung bình <= 0)"""
+    volume = np.asarray(volume, dtype='float64')
+    volume_avg = np.asarray(volume_avg, dtype='float64')
+    return np.divide(volume, volume_avg, out=np.ones_like(volume), where=volume_avg > 0)
+
+
+def group_ids_for(df: pd.DataFrame, group_column: Optional[str]) -> Optional[np.ndarray]:
+    """Mảng group_ids cho panel mode (None nếu không có cột nhóm)"""
+    if group_column is None or group_column not in df.columns:
+        return None
+    return df[group_column].to_numpy()
+
+
+def rolling_sum(values, window: int, group_ids: Optional[Sequence] = None) -> np.ndarray:
+    """
+    Tổng trượt `window` dòng gần nhất (kể cả dòng hiện tại) bằng tổng tiền tố, O(n)
+
+    Đầu mỗi mã cộng các dòng đang có (giống min_periods=1); với group_ids tổng không
+    tràn sang mã khác. Hỗ trợ mảng 2 chiều (nến x cột).
+    """
+    values = np.nan_to_num(np.asarray(values, dtype='float64'))
+    prefix = np.cumsum(values, axis=0)
+    length = len(values)
+    positions = bar_positions(length, group_ids)
+    index = np.arange(length)
+    # Tổng tiền tố ngay trước cửa sổ (không lùi quá dòng đầu của mã)
+    before = index - np.minimum(positions + 1, window)
+    result = prefix.copy()
+    has_before = before >= 0
+    result[has_before] -= prefix[before[has_before]]
+    return result
+
+
+def action_counts(rules: np.ndarray, rule_actions: List[str]):
+    """
+    Số tín hiệu BUY / SELL tại mỗi dòng từ mảng chỉ số luật (cộng theo cột nếu là ma trận)
+
+    Args:
+        rules: Mảng chỉ số luật (NO_RULE = không có tín hiệu)
+        rule_actions: Action của từng luật theo thứ tự chỉ số
+
+    Returns:
+        Tuple (buy_counts, sell_counts) kiểu int
+    """
+    labels = np.array(list(rule_actions) + ['HOLD'])[np.asarray(rules)]
+    buy = labels == 'BUY'
+    sell = labels == 'SELL'
+    if buy.ndim > 1:
+        return buy.sum(axis=1), sell.sum(axis=1)
+    return buy.astype(int), sell.astype(int)
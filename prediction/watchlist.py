@@ -0,0 +1,155 @@
+"""
+Phân tích danh mục theo dõi (watchlist) của người dùng cho /watchlist.
+
+Tất cả các mã được tính trong một lần dạng panel như screener (screen_panel) thay vì
+gọi predict cho từng mã:
+
+- Mã có trong feature store (đã cập nhật đến cửa sổ yêu cầu) được đọc cùng lúc, chỉ
+  các cột mà analyzer cần.
+- Các mã còn lại được lấy bằng một truy vấn cho nhiều mã (fetch_stocks_history, tối đa
+  PREDICT_BATCH_FETCH_SIZE mã mỗi truy vấn), chỉ báo và nhãn nến được tính trên cửa sổ
+  như /predict rồi ghép vào cùng panel.
+
+Statement của từng analyzer và final_statement bằng kết quả của /predict trên cùng cửa sổ;
+kết quả kèm tỷ lệ BUY/SELL/HOLD của danh mục và các mã có tín hiệu ở phiên mới nhất.
+
+Biến môi trường:
+- WATCHLIST_MAX_SYMBOLS: số mã tối đa trong một request (mặc định 200)
+"""
+import os
+import traceback
+from typing import Dict, List, Optional
+from dotenv import load_dotenv
+import sys
+
+# Thêm parent directory vào path để import
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils import fetch_stocks_history
+from prediction.registry import get_analyzers, prepare_frame
+from prediction.screener import (
+    screen_panel, screen_columns, load_screen_frames, SCREEN_EXCHANGES, STATEMENT_LABELS
+)
+from prediction.service import (
+    resolve_predict_window, prepare_predict_frame, PredictError, PREDICT_BATCH_FETCH_SIZE
+)
+from storage.feature_store import feature_store
+
+load_dotenv()
+
+WATCHLIST_MAX_SYMBOLS = int(os.getenv('WATCHLIST_MAX_SYMBOLS', '200'))
+
+
+def _fetch_frames(symbols: List[str], start_date: str, end_date: str, analyzers: Optional[List[str]]):
+    """
+    Lấy dữ liệu theo lô cho các mã không dùng được feature store và tính chỉ báo trên cửa sổ
+
+    Returns:
+        Tuple (symbols, frames, exchanges, errors) - errors là list dict symbol, status, detail
+    """
+    selected = get_analyzers(analyzers)
+    loaded_symbols, frames, exchanges, errors = [], [], [], []
+    for offset in range(0, len(symbols), PREDICT_BATCH_FETCH_SIZE):
+        chunk = symbols[offset:offset + PREDICT_BATCH_FETCH_SIZE]
+        try:
+            history = fetch_stocks_history(chunk, start_date, end_date)
+        except Exception:
+            # Lấy theo lô lỗi thì để từng mã tự gọi API
+            traceback.print_exc()
+            history = None
+        for symbol in chunk:
+            records = None if history is None else history.get(symbol, [])
+            try:
+                df, trends, exchange, _, _ = prepare_predict_frame(symbol, "D", start_date, end_date, records)
+            except PredictError as e:
+                errors.append({"symbol": symbol, "status": e.status_code, "detail": e.detail})
+                continue
+            loaded_symbols.append(symbol)
+            frames.append(prepare_frame(df, selected, trends, exchange))
+            exchanges.append(exchange)
+    return loaded_symbols, frames, exchanges, errors
+
+
+def analyze_watchlist(symbols: List[str], range_value: str, end_date: Optional[str] = None,
+                      analyzers: Optional[List[str]] = None) -> Dict:
+    """
+    Statement của từng mã trong watchlist và các số liệu tổng hợp
+
+    Args:
+        symbols: Các mã trong watchlist (trùng lặp được bỏ qua)
+        range_value, end_date, analyzers: Như PredictRequest (khung nến ngày)
+
+    Returns:
+        Dict chứa startDate, endDate, range, results (theo thứ tự symbols: symbol, exchange, date,
+        close, final_statement, statements, events), summary (số mã và tỷ lệ BUY/SELL/HOLD),
+        latestDate, new_signals (mã có tín hiệu ở phiên mới nhất) và errors
+
+    Raises:
+        PredictError: Tham số không hợp lệ (400)
+    """
+    symbols = list(dict.fromkeys(str(symbol).strip().upper() for symbol in symbols or [] if str(symbol).strip()))
+    if not symbols:
+        raise PredictError(400, "Danh sách 'symbols' không được để trống")
+    if len(symbols) > WATCHLIST_MAX_SYMBOLS:
+        raise PredictError(400, f"Watchlist tối đa {WATCHLIST_MAX_SYMBOLS} mã, nhận được {len(symbols)}")
+    range_name, _, start_date, end_date_str = resolve_predict_window(range_value, end_date, "D", analyzers)
+
+    loaded_symbols, frames, exchanges = [], [], []
+    if feature_store is not None:
+        try:
+            # Vài chục mã đọc trong tiến trình hiện tại nhanh hơn khởi động process pool
+            loaded_symbols, frames, exchanges, _ = load_screen_frames(
+                feature_store, start_date, end_date_str, SCREEN_EXCHANGES, screen_columns(analyzers),
+                workers=1, symbols=symbols
+            )
+        except Exception:
+            # Store lỗi thì lấy tất cả từ API
+            traceback.print_exc()
+            loaded_symbols, frames, exchanges = [], [], []
+    in_store = set(loaded_symbols)
+    missing = [symbol for symbol in symbols if symbol not in in_store]
+    errors = []
+    if missing:
+        fetched_symbols, fetched_frames, fetched_exchanges, errors = _fetch_frames(
+            missing, start_date, end_date_str, analyzers
+        )
+        loaded_symbols += fetched_symbols
+        frames += fetched_frames
+        exchanges += fetched_exchanges
+
+    results = {}
+    if frames:
+        statements, final, events = screen_panel(frames, exchanges, analyzers)
+        for i, (symbol, frame) in enumerate(zip(loaded_symbols, frames)):
+            results[symbol] = {
+                "symbol": symbol,
+                "exchange": exchanges[i],
+                "date": frame['Date'].iloc[-1].strftime('%Y-%m-%d'),
+                "close": float(frame['Close'].iloc[-1]),
+                "final_statement": STATEMENT_LABELS[final[i]],
+                "statements": {name: STATEMENT_LABELS[values[i]] for name, values in statements.items()},
+                "events": events[i],
+            }
+    ordered = [results[symbol] for symbol in symbols if symbol in results]
+
+    counts = {label: 0 for label in ("BUY", "SELL", "HOLD")}
+    for result in ordered:
+        counts[result["final_statement"]] += 1
+    latest_date = max((result["date"] for result in ordered), default=None)
+    return {
+        "startDate": start_date,
+        "endDate": end_date_str,
+        "range": range_name,
+        "results": ordered,
+        "summary": {
+            "count": len(ordered),
+            "counts": counts,
+            "shares": {label: round(count / len(ordered), 4) if ordered else 0.0 for label, count in counts.items()},
+        },
+        "latestDate": latest_date,
+        # Mã có sự kiện (tín hiệu của analyzer) ở phiên mới nhất của watchlist
+        "new_signals": [
+            {"symbol": result["symbol"], "events": result["events"]}
+            for result in ordered if result["date"] == latest_date and result["events"]
+        ],
+        "errors": errors,
+    }
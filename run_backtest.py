@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+"""
+Backtest tín hiệu BUY/SELL/HOLD của /predict trên lịch sử nhiều mã.
+
+Ví dụ:
+    python run_backtest.py --years 5 --window 60 --workers 8 --output backtest.csv
+    python run_backtest.py --symbols FPT VNM HPG --analyzers RSI MACD --allow-short
+    python run_backtest.py --range long --walk-forward
+
+Dữ liệu đọc từ feature store (FEATURE_STORE_DIR) nếu mã đã có, không thì lấy từ API.
+"""
+import logging
+import sys
+import argparse
+import datetime
+import pandas as pd
+from dotenv import load_dotenv
+
+from utils import fetch_stock_symbols
+from storage.feature_store import FEATURE_STORE_DIR
+from backtest.runner import run_backtest, summarize_by_exchange
+from backtest.walk_forward import WALK_FORWARD_WINDOWS
+
+# Setup logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.StreamHandler(sys.stdout)
+    ]
+)
+
+logger = logging.getLogger("backtest")
+
+
+def main():
+    """Chạy backtest và in kết quả tổng hợp theo sàn"""
+    load_dotenv()
+    parser = argparse.ArgumentParser(description='Backtest prediction signals over history')
+    parser.add_argument('--symbols', nargs='*',
+                      help='Chỉ backtest các mã này (mặc định: tất cả mã niêm yết)')
+    parser.add_argument('--years', type=int, default=3,
+                      help='Số năm lịch sử (default: 3)')
+    parser.add_argument('--window', type=int, default=60,
+                      help='Số nến gần nhất để ra statement của mỗi analyzer (default: 60)')
+    parser.add_argument('--range', choices=sorted(WALK_FORWARD_WINDOWS),
+                      help='Dùng cửa sổ của /predict: short = 60 nến, long = 180 nến (ghi đè --window)')
+    parser.add_argument('--walk-forward', action='store_true',
+                      help='Verdict mỗi phiên đúng như /predict tại phiên đó (không nhìn trước dữ liệu)')
+    parser.add_argument('--analyzers', nargs='*',
+                      help='Chỉ dùng các analyzer này (mặc định: tất cả)')
+    parser.add_argument('--allow-short', action='store_true',
+                      help='SELL mở vị thế short thay vì chỉ bán ra')
+    parser.add_argument('--cost-bps', type=float, default=15.0,
+                      help='Phí mỗi lần đổi vị thế, basis point (default: 15)')
+    parser.add_argument('--workers', type=int, default=4,
+                      help='Số tiến trình chạy song song (default: 4)')
+    parser.add_argument('--store-dir', default=FEATURE_STORE_DIR,
+                      help='Thư mục feature store (mặc định: FEATURE_STORE_DIR)')
+    parser.add_argument('--output',
+                      help='Ghi kết quả từng mã ra file CSV')
+
+    args = parser.parse_args()
+    window = WALK_FORWARD_WINDOWS[args.range] if args.range else args.window
+
+    today = datetime.date.today()
+    end_date = today.strftime('%Y-%m-%d')
+    start_date = (today - datetime.timedelta(days=365 * args.years)).strftime('%Y-%m-%d')
+    symbols = [s.upper() for s in args.symbols] if args.symbols else [item["symbol"] for item in fetch_stock_symbols()]
+    logger.info(f"Backtesting {len(symbols)} symbols from {start_date} to {end_date}...")
+
+    results = run_backtest(
+        symbols, start_date, end_date, workers=args.workers,
+        store_dir=args.store_dir, window=window, analyzers=args.analyzers,
+        allow_short=args.allow_short, cost_bps=args.cost_bps, walk_forward=args.walk_forward
+    )
+    if results.empty:
+        logger.error("No symbol could be backtested.")
+        return 1
+
+    if args.output:
+        results.to_csv(args.output, index=False)
+        logger.info(f"Per-symbol results written to {args.output}")
+
+    with pd.option_context('display.float_format', '{:.4f}'.format, 'display.width', 200):
+        print(summarize_by_exchange(results))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
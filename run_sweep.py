@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+"""
+Dò tham số cho các ngưỡng tín hiệu (RSI, bộ lọc volume, cặp MA, ngưỡng xu hướng)
+bằng backtest trên lịch sử nhiều mã, in tổ hợp tốt nhất của từng sàn.
+
+Ví dụ:
+    python run_sweep.py --years 5 --workers 8 --output sweep.csv
+    python run_sweep.py --symbols FPT VNM HPG --volume-ratio 0.3 0.5 --trend-threshold 10 15
+    python run_sweep.py --rsi-levels 30/70/10/90 25/75/10/90 --metric total_return
+
+Dữ liệu đọc từ feature store (FEATURE_STORE_DIR) nếu mã đã có, không thì lấy từ API.
+"""
+import logging
+import sys
+import argparse
+import datetime
+import pandas as pd
+from dotenv import load_dotenv
+
+from utils import fetch_stock_symbols
+from storage.feature_store import FEATURE_STORE_DIR
+from backtest.sweep import run_sweep, summarize_sweep, best_settings, DEFAULT_SWEEP_GRID, MA_PAIR_SETS, format_rsi_levels
+
+# Setup logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.StreamHandler(sys.stdout)
+    ]
+)
+
+logger = logging.getLogger("sweep")
+
+
+def parse_rsi_levels(value: str) -> tuple:
+    """Đọc ngưỡng RSI dạng oversold/overbought/extreme_oversold/extreme_overbought"""
+    parts = value.split('/')
+    if len(parts) != 4:
+        raise argparse.ArgumentTypeError(f"'{value}' phải có dạng 30/70/10/90")
+    try:
+        return tuple(float(part) for part in parts)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"'{value}' phải có dạng 30/70/10/90")
+
+
+def main():
+    """Chạy sweep và in tổ hợp tham số tốt nhất theo sàn"""
+    load_dotenv()
+    default_rsi = ' '.join(format_rsi_levels(levels) for levels in DEFAULT_SWEEP_GRID['rsi_levels'])
+    parser = argparse.ArgumentParser(description='Parameter sweep for prediction signal thresholds')
+    parser.add_argument('--symbols', nargs='*',
+                      help='Chỉ dùng các mã này (mặc định: tất cả mã niêm yết)')
+    parser.add_argument('--years', type=int, default=3,
+                      help='Số năm lịch sử (default: 3)')
+    parser.add_argument('--rsi-levels', nargs='+', type=parse_rsi_levels,
+                      default=DEFAULT_SWEEP_GRID['rsi_levels'],
+                      help=f'Ngưỡng RSI oversold/overbought/extreme_oversold/extreme_overbought (default: {default_rsi})')
+    parser.add_argument('--volume-ratio', nargs='+', type=float, default=DEFAULT_SWEEP_GRID['volume_ratio'],
+                      help=f"Ngưỡng volume thấp (default: {' '.join(map(str, DEFAULT_SWEEP_GRID['volume_ratio']))})")
+    parser.add_argument('--ma-pairs', nargs='+', choices=list(MA_PAIR_SETS), default=DEFAULT_SWEEP_GRID['ma_pairs'],
+                      help=f"Tập cặp MA (default: {' '.join(DEFAULT_SWEEP_GRID['ma_pairs'])})")
+    parser.add_argument('--trend-threshold', nargs='+', type=float, default=DEFAULT_SWEEP_GRID['trend_threshold'],
+                      help=f"Ngưỡng %% xu hướng (default: {' '.join(map(str, DEFAULT_SWEEP_GRID['trend_threshold']))})")
+    parser.add_argument('--metric', default='annual_return',
+                      help='Chỉ số dùng để chọn tổ hợp tốt nhất (default: annual_return)')
+    parser.add_argument('--window', type=int, default=60,
+                      help='Số nến gần nhất để ra statement của mỗi analyzer (default: 60)')
+    parser.add_argument('--allow-short', action='store_true',
+                      help='SELL mở vị thế short thay vì chỉ bán ra')
+    parser.add_argument('--cost-bps', type=float, default=15.0,
+                      help='Phí mỗi lần đổi vị thế, basis point (default: 15)')
+    parser.add_argument('--workers', type=int, default=4,
+                      help='Số tiến trình chạy song song (default: 4)')
+    parser.add_argument('--store-dir', default=FEATURE_STORE_DIR,
+                      help='Thư mục feature store (mặc định: FEATURE_STORE_DIR)')
+    parser.add_argument('--output',
+                      help='Ghi chỉ số trung bình theo sàn của mọi tổ hợp ra file CSV')
+
+    args = parser.parse_args()
+
+    today = datetime.date.today()
+    end_date = today.strftime('%Y-%m-%d')
+    start_date = (today - datetime.timedelta(days=365 * args.years)).strftime('%Y-%m-%d')
+    symbols = [s.upper() for s in args.symbols] if args.symbols else [item["symbol"] for item in fetch_stock_symbols()]
+    grid = {
+        'rsi_levels': args.rsi_levels,
+        'volume_ratio': args.volume_ratio,
+        'ma_pairs': args.ma_pairs,
+        'trend_threshold': args.trend_threshold,
+    }
+    combinations = len(args.rsi_levels) * len(args.volume_ratio) * len(args.ma_pairs) * len(args.trend_threshold)
+    logger.info(f"Sweeping {combinations} parameter combinations over {len(symbols)} symbols from {start_date} to {end_date}...")
+
+    results = run_sweep(
+        symbols, start_date, end_date, grid=grid, workers=args.workers, window=args.window,
+        allow_short=args.allow_short, cost_bps=args.cost_bps, store_dir=args.store_dir
+    )
+    if results.empty:
+        logger.error("No symbol could be backtested.")
+        return 1
+
+    summary = summarize_sweep(results)
+    if args.output:
+        summary.to_csv(args.output, index=False)
+        logger.info(f"Per-exchange results written to {args.output}")
+
+    try:
+        best = best_settings(summary, args.metric)
+    except ValueError as e:
+        logger.error(str(e))
+        return 1
+    with pd.option_context('display.float_format', '{:.4f}'.format, 'display.width', 200):
+        print(best)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,122 @@
+"""
+Biểu diễn compact cho dữ liệu nến (OHLCV) và nhãn phân loại.
+
+Chế độ lưu trữ giá được chọn bằng biến môi trường PRICE_STORAGE_MODE:
+- "float64": giữ nguyên như cũ (mặc định)
+- "float32": giá lưu dạng float32 (một nửa bộ nhớ, chính xác với giá nguyên VND)
+- "ticks":   giá lưu dạng int32 theo bước giá PRICE_TICK_SIZE (chỉ dùng trong kho dữ liệu)
+
+Các nhãn candle_pattern / trend_context / gap_type được giữ ở dạng categorical.
+Các hàm tính chỉ báo luôn chuyển giá về float64 trước khi tính toán.
+"""
+import os
+import logging
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+PRICE_COLUMNS = ['Open', 'High', 'Low', 'Close']
+
+PRICE_STORAGE_MODES = ('float64', 'float32', 'ticks')
+PRICE_STORAGE_MODE = os.getenv('PRICE_STORAGE_MODE', 'float64').lower()
+# Bước giá nhỏ nhất trên thị trường Việt Nam (10 VND cho HSX, giá < 10.000)
+PRICE_TICK_SIZE = float(os.getenv('PRICE_TICK_SIZE', '10'))
+
+# Danh mục cố định cho các nhãn để mọi frame dùng chung một bảng mã
+CANDLE_PATTERN_CATEGORIES = [
+    'Standard', 'Marubozu', 'Spinning Top', 'Hammer', 'Hanging Man',
+    'Inverted Hammer', 'Shooting Star', 'Star Doji', 'Long Legged Doji',
+    'Dragonfly Doji', 'Gravestone Doji'
+]
+TREND_CATEGORIES = ['sideways', 'uptrend', 'downtrend']
+GAP_CATEGORIES = ['No Gap', 'Rising Window', 'Falling Window']
+
+LABEL_CATEGORIES = {
+    'candle_pattern': CANDLE_PATTERN_CATEGORIES,
+    'trend_context': TREND_CATEGORIES,
+    'gap_type': GAP_CATEGORIES,
+}
+
+
+def is_compact_mode(mode: str = None) -> bool:
+    """Kiểm tra chế độ compact có được bật hay không"""
+    return (mode or PRICE_STORAGE_MODE) != 'float64'
+
+
+def is_compact_frame(df: pd.DataFrame) -> bool:
+    """Frame compact là frame có cột giá không ở dạng float64"""
+    return 'Close' in df.columns and df['Close'].dtype != np.float64
+
+
+def categorize_labels(df: pd.DataFrame) -> pd.DataFrame:
+    """Chuyển các cột nhãn (pattern/trend/gap) sang categorical với danh mục cố định"""
+    df_result = df.copy()
+    for column, categories in LABEL_CATEGORIES.items():
+        if column in df_result.columns and not isinstance(df_result[column].dtype, pd.CategoricalDtype):
+            df_result[column] = pd.Categorical(df_result[column], categories=categories)
+    return df_result
+
+
+def compact_price_frame(df: pd.DataFrame, mode: str = None, tick_size: float = None) -> pd.DataFrame:
+    """
+    Chuyển DataFrame OHLCV sang dạng compact
+    
+    Args:
+        df: DataFrame với cột Open, High, Low, Close, Volume (float64)
+        mode: "float64" / "float32" / "ticks" (mặc định theo PRICE_STORAGE_MODE)
+        tick_size: Bước giá dùng cho chế độ "ticks"
+    
+    Returns:
+        DataFrame mới với giá float32 hoặc int32 ticks, Volume int64 và nhãn categorical
+    """
+    mode = (mode or PRICE_STORAGE_MODE).lower()
+    tick_size = tick_size or PRICE_TICK_SIZE
+    if mode not in PRICE_STORAGE_MODES:
+        raise ValueError(f"PRICE_STORAGE_MODE '{mode}' không hợp lệ. Chỉ hỗ trợ: {', '.join(PRICE_STORAGE_MODES)}")
+    
+    df_result = categorize_labels(df)
+    if mode == 'float64':
+        return df_result
+    
+    prices = df_result[PRICE_COLUMNS].to_numpy(dtype='float64')
+    if mode == 'ticks':
+        ticks = np.round(prices / tick_size)
+        # Chỉ dùng ticks khi chuyển đổi không làm mất dữ liệu
+        lossless = (
+            not np.isnan(ticks).any()
+            and np.abs(ticks).max(initial=0) < 2**31
+            and np.allclose(ticks * tick_size, prices, rtol=1e-9, atol=0)
+        )
+        if lossless:
+            for i, column in enumerate(PRICE_COLUMNS):
+                df_result[column] = ticks[:, i].astype('int32')
+            df_result.attrs['tick_size'] = tick_size
+            df_result['Volume'] = df_result['Volume'].astype('int64')
+            return df_result
+        logger.warning(f"Giá không chia hết cho bước giá {tick_size}, chuyển sang lưu float32")
+    
+    for column in PRICE_COLUMNS:
+        df_result[column] = df_result[column].astype('float32')
+    df_result.attrs.pop('tick_size', None)
+    df_result['Volume'] = df_result['Volume'].astype('int64')
+    return df_result
+
+
+def expand_price_frame(df: pd.DataFrame, tick_size: float = None) -> pd.DataFrame:
+    """
+    Chuyển frame lưu dạng ticks (giá int32) về giá thực float64 để đưa vào pipeline tính toán
+    
+    Frame float32/float64 được giữ nguyên: các hàm chỉ báo tự chuyển sang float64 khi tính.
+    """
+    if 'Close' not in df.columns or not pd.api.types.is_integer_dtype(df['Close']):
+        return df
+    
+    tick_size = tick_size or df.attrs.get('tick_size', PRICE_TICK_SIZE)
+    df_result = df.copy()
+    for column in PRICE_COLUMNS:
+        df_result[column] = df_result[column].to_numpy(dtype='float64') * tick_size
+    df_result.attrs.pop('tick_size', None)
+    return df_result
@@ -0,0 +1,207 @@
+"""
+Feature store dạng cột lưu trên đĩa cho chỉ báo đã tính trước.
+
+Mỗi mã là một file <SYMBOL>.npz, mỗi cột là một mảng riêng nên khi đọc chỉ
+nạp những cột cần dùng. Nhãn dạng chuỗi được lưu dưới dạng mã + danh mục.
+Thư mục lưu trữ được cấu hình bằng biến môi trường FEATURE_STORE_DIR; khi
+không cấu hình, API tính toán trực tiếp như trước.
+"""
+import os
+import json
+import datetime
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+import sys
+
+# Thêm parent directory vào path để import
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from storage.compact import compact_price_frame, expand_price_frame, is_compact_mode, PRICE_STORAGE_MODE
+
+load_dotenv()
+
+FEATURE_STORE_DIR = os.getenv('FEATURE_STORE_DIR')
+FEATURE_STORE_VERSION = 2
+
+_META_KEY = '__meta__'
+_CODES_SUFFIX = '__codes'
+_CATEGORIES_SUFFIX = '__categories'
+
+
+def last_session_on_or_before(date) -> pd.Timestamp:
+    """Ngày giao dịch (thứ 2 - thứ 6) gần nhất không sau `date`"""
+    day = pd.Timestamp(date).normalize()
+    while day.weekday() >= 5:
+        day -= pd.Timedelta(days=1)
+    return day
+
+
+class FeatureStore:
+    """Đọc/ghi feature frame của từng mã dưới dạng file cột .npz"""
+
+    def __init__(self, root_dir: str, mode: str = None):
+        self.root_dir = root_dir
+        self.mode = mode or PRICE_STORAGE_MODE
+        os.makedirs(root_dir, exist_ok=True)
+
+    def _path(self, symbol: str) -> str:
+        return os.path.join(self.root_dir, f"{symbol.upper()}.npz")
+
+    def write(self, symbol: str, df: pd.DataFrame, exchange: str, history_start: str = None) -> None:
+        """
+        Ghi đè feature frame của một mã
+
+        Args:
+            symbol: Mã chứng khoán
+            df: DataFrame với cột Date (datetime64) và các cột feature
+            exchange: Sàn giao dịch
+            history_start: Ngày bắt đầu lịch sử đã lấy (YYYY-MM-DD) - dùng để kiểm tra độ phủ
+        """
+        frame = df.sort_values('Date').reset_index(drop=True)
+        if is_compact_mode(self.mode):
+            frame = compact_price_frame(frame, self.mode)
+
+        arrays = {}
+        categorical_columns = []
+        object_columns = []
+        for column in frame.columns:
+            series = frame[column]
+            if column == 'Date':
+                arrays[column] = series.to_numpy(dtype='datetime64[ns]').view('int64')
+            elif isinstance(series.dtype, pd.CategoricalDtype) or series.dtype == object:
+                if isinstance(series.dtype, pd.CategoricalDtype):
+                    categorical_columns.append(column)
+                else:
+                    object_columns.append(column)
+                categorical = pd.Categorical(series)
+                arrays[column + _CODES_SUFFIX] = categorical.codes
+                arrays[column + _CATEGORIES_SUFFIX] = np.asarray(categorical.categories, dtype=str)
+            else:
+                arrays[column] = series.to_numpy()
+
+        meta = {
+            "symbol": symbol.upper(),
+            "exchange": exchange,
+            "version": FEATURE_STORE_VERSION,
+            "columns": list(frame.columns),
+            "categorical_columns": categorical_columns,
+            "object_columns": object_columns,
+            "first_date": frame['Date'].iloc[0].strftime('%Y-%m-%d') if len(frame) else None,
+            "last_date": frame['Date'].iloc[-1].strftime('%Y-%m-%d') if len(frame) else None,
+            "history_start": history_start,
+            "tick_size": frame.attrs.get('tick_size'),
+            "updated_at": datetime.datetime.now().isoformat(timespec='seconds'),
+        }
+        arrays[_META_KEY] = np.array(json.dumps(meta))
+
+        # Ghi ra file tạm rồi đổi tên để reader không bao giờ thấy file ghi dở
+        path = self._path(symbol)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path)
+
+    def metadata(self, symbol: str) -> Optional[Dict]:
+        """Metadata của một mã hoặc None nếu chưa có"""
+        path = self._path(symbol)
+        if not os.path.exists(path):
+            return None
+        with np.load(path, allow_pickle=False) as npz:
+            return json.loads(str(npz[_META_KEY]))
+
+    def file_signature(self, symbol: str) -> Optional[Tuple[int, int]]:
+        """(mtime_ns, kích thước) của file một mã hoặc None nếu chưa có - thay đổi mỗi lần ghi lại"""
+        try:
+            stat = os.stat(self._path(symbol))
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def read(self, symbol: str, start_date=None, end_date=None, columns: List[str] = None) -> Optional[pd.DataFrame]:
+        """
+        Đọc các cột feature của một mã trong khoảng [start_date, end_date]
+
+        Args:
+            symbol: Mã chứng khoán
+            start_date, end_date: Giới hạn thời gian (tùy chọn)
+            columns: Danh sách cột cần đọc (mặc định tất cả); Date luôn được trả về
+
+        Returns:
+            DataFrame index 0..n-1 hoặc None nếu mã chưa có trong store
+        """
+        path = self._path(symbol)
+        if not os.path.exists(path):
+            return None
+
+        with np.load(path, allow_pickle=False) as npz:
+            meta = json.loads(str(npz[_META_KEY]))
+            dates = npz['Date'].view('datetime64[ns]')
+
+            # Date đã sắp xếp nên cắt cửa sổ bằng searchsorted
+            lo = 0 if start_date is None else int(np.searchsorted(dates, np.datetime64(pd.Timestamp(start_date)), side='left'))
+            hi = len(dates) if end_date is None else int(np.searchsorted(dates, np.datetime64(pd.Timestamp(end_date)), side='right'))
+
+            wanted = meta['columns'] if columns is None else ['Date'] + [c for c in columns if c != 'Date' and c in meta['columns']]
+            data = {}
+            for column in wanted:
+                if column == 'Date':
+                    data[column] = dates[lo:hi]
+                elif column in meta['object_columns']:
+                    # Trả lại dạng object với None cho giá trị thiếu (mã -1) như frame gốc
+                    lookup = np.append(np.asarray(npz[column + _CATEGORIES_SUFFIX], dtype=object), None)
+                    data[column] = lookup[npz[column + _CODES_SUFFIX][lo:hi]]
+                elif column in meta['categorical_columns']:
+                    data[column] = pd.Categorical.from_codes(
+                        npz[column + _CODES_SUFFIX][lo:hi],
+                        categories=npz[column + _CATEGORIES_SUFFIX]
+                    )
+                else:
+                    data[column] = npz[column][lo:hi]
+
+        frame = pd.DataFrame(data)
+        if meta.get('tick_size'):
+            frame = expand_price_frame(frame, meta['tick_size'])
+        return frame
+
+    @staticmethod
+    def covers(meta: Optional[Dict], start_date: str, end_date: str) -> bool:
+        """
+        Store có đủ dữ liệu cho khoảng [start_date, end_date] theo metadata hay không
+
+        Store được coi là đủ khi lịch sử đã lấy bắt đầu không muộn hơn start_date và
+        đã có nến của phiên giao dịch gần nhất trước/bằng end_date.
+        """
+        if not meta or meta.get('version') != FEATURE_STORE_VERSION or not meta.get('last_date'):
+            return False
+        history_start = meta.get('history_start') or meta.get('first_date')
+        if pd.Timestamp(history_start) > pd.Timestamp(start_date):
+            return False
+        return pd.Timestamp(meta['last_date']) >= last_session_on_or_before(end_date)
+
+    def read_fresh_window(self, symbol: str, start_date: str, end_date: str,
+                          columns: List[str] = None) -> Optional[Tuple[pd.DataFrame, str]]:
+        """
+        Đọc cửa sổ [start_date, end_date] nếu store có đủ dữ liệu cho khoảng này (xem covers)
+
+        Returns:
+            (DataFrame, exchange) hoặc None nếu cần tính trực tiếp
+        """
+        meta = self.metadata(symbol)
+        if not self.covers(meta, start_date, end_date):
+            return None
+
+        frame = self.read(symbol, start_date, end_date, columns)
+        if frame is None or len(frame) == 0:
+            return None
+        return frame, meta['exchange']
+
+    def symbols(self) -> List[str]:
+        """Danh sách mã đang có trong store"""
+        return sorted(
+            name[:-len('.npz')] for name in os.listdir(self.root_dir) if name.endswith('.npz')
+        )
+
+
+# Store dùng chung trong tiến trình (None nếu không cấu hình FEATURE_STORE_DIR)
+feature_store = FeatureStore(FEATURE_STORE_DIR) if FEATURE_STORE_DIR else None
@@ -0,0 +1,154 @@
+"""
+Lịch sử tín hiệu BUY/SELL của các analyzer lưu trên đĩa (SQLite, chỉ ghi thêm).
+
+Mỗi tín hiệu là một dòng (symbol, date, analyzer, version, action, strength, code, reason),
+khóa chính (symbol, date, analyzer, version, code) nên truy vấn theo mã và khoảng ngày là
+một lần quét chỉ mục. Bảng signal_progress ghi nến cuối đã được đánh giá của từng
+(mã, analyzer, version) để lần cập nhật sau chỉ phải đánh giá nến mới. Tín hiệu đã ghi
+không bị sửa hay xóa; tăng version của analyzer thì lịch sử được dựng lại với version mới.
+
+Đường dẫn file được cấu hình bằng biến môi trường SIGNAL_STORE_PATH; khi không cấu hình,
+job build_feature_store.py không ghi lịch sử và API không trả lịch sử tín hiệu.
+"""
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SIGNAL_STORE_PATH = os.getenv('SIGNAL_STORE_PATH')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS signals (
+    symbol TEXT NOT NULL,
+    date TEXT NOT NULL,
+    analyzer TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    action TEXT NOT NULL,
+    strength INTEGER,
+    code TEXT NOT NULL,
+    reason TEXT NOT NULL,
+    PRIMARY KEY (symbol, date, analyzer, version, code)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS signal_progress (
+    symbol TEXT NOT NULL,
+    analyzer TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    last_date TEXT NOT NULL,
+    PRIMARY KEY (symbol, analyzer, version)
+) WITHOUT ROWID;
+"""
+
+
+class SignalStore:
+    """Đọc/ghi lịch sử tín hiệu theo mã và ngày (ngày dạng YYYY-MM-DD)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._write_lock = threading.Lock()
+        with self._connect() as connection:
+            # WAL: API vẫn đọc được trong lúc job đang ghi
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def evaluated_until(self, symbol: str, versions: Iterable[Tuple[str, int]]) -> Dict[str, Optional[str]]:
+        """
+        Nến cuối đã được đánh giá của từng analyzer (theo version hiện tại)
+
+        Args:
+            symbol: Mã chứng khoán
+            versions: Các cặp (tên analyzer, version) (registry.analyzer_versions)
+
+        Returns:
+            Dict {tên analyzer: ngày YYYY-MM-DD hoặc None nếu chưa đánh giá}
+        """
+        versions = list(versions)
+        with self._connect() as connection:
+            rows = connection.execute(
+                "SELECT analyzer, version, last_date FROM signal_progress WHERE symbol = ?",
+                (symbol.upper(),)
+            ).fetchall()
+        done = {(analyzer, version): last_date for analyzer, version, last_date in rows}
+        return {name: done.get((name, version)) for name, version in versions}
+
+    def append(self, symbol: str, signals: List[Dict], progress: Dict[Tuple[str, int], str]) -> int:
+        """
+        Ghi thêm tín hiệu và cập nhật nến cuối đã đánh giá trong cùng một transaction
+
+        Args:
+            symbol: Mã chứng khoán
+            signals: List dict gồm date (YYYY-MM-DD), analyzer, version, action, strength, code, reason
+            progress: {(analyzer, version): ngày nến cuối đã đánh giá}
+
+        Returns:
+            Số tín hiệu mới được ghi (tín hiệu đã có được bỏ qua)
+        """
+        symbol = symbol.upper()
+        rows = [
+            (symbol, signal["date"], signal["analyzer"], signal["version"], signal["action"],
+             signal.get("strength"), signal["code"], signal["reason"])
+            for signal in signals
+        ]
+        with self._write_lock, self._connect() as connection:
+            before = connection.total_changes
+            connection.executemany("INSERT OR IGNORE INTO signals VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            inserted = connection.total_changes - before
+            connection.executemany(
+                "INSERT INTO signal_progress VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (symbol, analyzer, version) DO UPDATE SET last_date = MAX(last_date, excluded.last_date)",
+                [(symbol, analyzer, version, last_date) for (analyzer, version), last_date in progress.items()]
+            )
+        return inserted
+
+    def query(self, symbol: str, versions: Iterable[Tuple[str, int]], start_date: Optional[str] = None,
+              end_date: Optional[str] = None, action: Optional[str] = None,
+              limit: Optional[int] = None) -> List[Dict]:
+        """
+        Tín hiệu của một mã trong khoảng [start_date, end_date] theo thứ tự ngày
+
+        Args:
+            symbol: Mã chứng khoán
+            versions: Các cặp (tên analyzer, version) cần lấy
+            start_date, end_date: Khoảng ngày YYYY-MM-DD (bỏ trống = không giới hạn)
+            action: Chỉ lấy BUY hoặc SELL
+            limit: Chỉ lấy limit tín hiệu gần nhất
+
+        Returns:
+            List dict date, analyzer, action, strength, code, reason
+        """
+        versions = list(versions)
+        if not versions:
+            return []
+        conditions = ["symbol = ?", "(" + " OR ".join(["(analyzer = ? AND version = ?)"] * len(versions)) + ")"]
+        params = [symbol.upper()] + [value for pair in versions for value in pair]
+        if start_date:
+            conditions.append("date >= ?")
+            params.append(start_date)
+        if end_date:
+            conditions.append("date <= ?")
+            params.append(end_date)
+        if action:
+            conditions.append("action = ?")
+            params.append(action.upper())
+        sql = (
+            "SELECT date, analyzer, action, strength, code, reason FROM signals WHERE "
+            + " AND ".join(conditions) + " ORDER BY date DESC, analyzer, code"
+        )
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(max(int(limit), 0))
+        with self._connect() as connection:
+            rows = connection.execute(sql, params).fetchall()
+        columns = ["date", "analyzer", "action", "strength", "code", "reason"]
+        return [dict(zip(columns, row)) for row in reversed(rows)]
+
+
+# Store dùng chung trong tiến trình (None nếu không cấu hình SIGNAL_STORE_PATH)
+signal_store = SignalStore(SIGNAL_STORE_PATH) if SIGNAL_STORE_PATH else None
@@ -6,10 +6,14 @@ import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
+from storage.compact import is_compact_mode, compact_price_frame
 
 # Load environment variables
 load_dotenv()
 
+# Định dạng ngày hiển thị - chỉ dùng khi trả kết quả ra ngoài (JSON, Telegram, biểu đồ)
+DISPLAY_DATE_FORMAT = '%d/%m/%Y'
+
 def update_attachment(file_path=None, base64String=None, ext="png", attachmentField=None):
     """Upload file to attachment service"""
     if ext == "png":
@@ -56,30 +60,120 @@ def update_attachment(file_path=None, base64String=None, ext="png", attachmentFi
     )
     return response.json()
 
-def fetch_stock_data(symbol: str, start_date: str = None, end_date: str = None):
-    """Fetch stock data from API"""
-    filters = [
-        {"stock_code": {"stockCode": {"$eq": symbol.upper()}}}
-    ]
-    
-    # Apply date filter only if both dates are provided
-    if start_date and end_date:
-        filters.append({"time": {"$dateBetween": [f"{start_date} 00:00:00", f"{end_date} 00:00:00"]}})
-    
+def _request_trade_data(filters: list, page: int = 1, page_size: int = 365, sort: str = None) -> dict:
+    """Gọi API trade_data:list với bộ lọc và phân trang, trả về JSON gốc (data + meta)"""
     filter_str = requests.utils.quote(str({"$and": filters}).replace("'", '"'))
     url = (
         f"{os.getenv('API_BASE_URL')}/api/trade_data:list"
-        f"?pageSize=365&page=1&appends[]=stock_code"
+        f"?pageSize={page_size}&page={page}&appends[]=stock_code"
         f"&filter={filter_str}"
         f"&fields=open,close,high,low,volume,time"
     )
+    if sort:
+        url += f"&sort={sort}"
     headers = {
         'authorization': f"Bearer {os.getenv('TRADE_DATA_TOKEN')}"
     }
     
     resp = requests.get(url, headers=headers)
     resp.raise_for_status()
-    return resp.json()["data"]
+    return resp.json()
+
+def _date_filter(start_date: str = None, end_date: str = None) -> list:
+    """Bộ lọc theo khoảng thời gian (chỉ áp dụng khi có đủ cả hai ngày)"""
+    if start_date and end_date:
+        return [{"time": {"$dateBetween": [f"{start_date} 00:00:00", f"{end_date} 00:00:00"]}}]
+    return []
+
+def fetch_stock_data(symbol: str, start_date: str = None, end_date: str = None):
+    """Fetch stock data from API"""
+    filters = [
+        {"stock_code": {"stockCode": {"$eq": symbol.upper()}}}
+    ]
+    
+    # Apply date filter only if both dates are provided
+    filters.extend(_date_filter(start_date, end_date))
+    
+    return _request_trade_data(filters)["data"]
+
+def fetch_stock_history(symbol: str, start_date: str, end_date: str, page_size: int = 1000) -> list:
+    """
+    Lấy toàn bộ lịch sử giao dịch của một mã (duyệt qua tất cả các trang)
+    
+    Khác với fetch_stock_data (chỉ lấy 1 trang 365 bản ghi), hàm này dùng cho các
+    khoảng thời gian nhiều năm như job tính feature store.
+    """
+    filters = [{"stock_code": {"stockCode": {"$eq": symbol.upper()}}}]
+    filters.extend(_date_filter(start_date, end_date))
+    
+    records = []
+    page = 1
+    while True:
+        result = _request_trade_data(filters, page=page, page_size=page_size, sort="time")
+        data = result.get("data", [])
+        records.extend(data)
+        total_page = result.get("meta", {}).get("totalPage")
+        if not data or (total_page is not None and page >= total_page) or len(data) < page_size:
+            break
+        page += 1
+    return records
+
+def fetch_stocks_history(symbols: list, start_date: str, end_date: str, page_size: int = 1000) -> dict:
+    """
+    Lấy lịch sử giao dịch của nhiều mã trong một truy vấn phân trang (dùng cho /predict/batch)
+
+    Returns:
+        Dict {symbol: danh sách bản ghi theo thời gian}; mã không có dữ liệu không có trong dict
+    """
+    filters = [{"stock_code": {"stockCode": {"$in": [symbol.upper() for symbol in symbols]}}}]
+    filters.extend(_date_filter(start_date, end_date))
+
+    records_by_symbol = {}
+    page = 1
+    while True:
+        result = _request_trade_data(filters, page=page, page_size=page_size, sort="time")
+        data = result.get("data", [])
+        for item in data:
+            symbol = (item.get("stock_code") or {}).get("stockCode")
+            if symbol:
+                records_by_symbol.setdefault(symbol.upper(), []).append(item)
+        total_page = result.get("meta", {}).get("totalPage")
+        if not data or (total_page is not None and page >= total_page) or len(data) < page_size:
+            break
+        page += 1
+    return records_by_symbol
+
+def fetch_stock_symbols(page_size: int = 1000) -> list:
+    """
+    Lấy danh sách tất cả mã chứng khoán đang niêm yết
+    
+    Returns:
+        List dict {"symbol": ..., "exchange": ...}
+    """
+    headers = {
+        'authorization': f"Bearer {os.getenv('TRADE_DATA_TOKEN')}"
+    }
+    symbols = []
+    page = 1
+    while True:
+        url = (
+            f"{os.getenv('API_BASE_URL')}/api/stock_code:list"
+            f"?pageSize={page_size}&page={page}"
+            f"&fields=stockCode,exchange"
+        )
+        resp = requests.get(url, headers=headers)
+        resp.raise_for_status()
+        result = resp.json()
+        data = result.get("data", [])
+        symbols.extend(
+            {"symbol": item["stockCode"].upper(), "exchange": item.get("exchange", "Unknown")}
+            for item in data if item.get("stockCode")
+        )
+        total_page = result.get("meta", {}).get("totalPage")
+        if not data or (total_page is not None and page >= total_page) or len(data) < page_size:
+            break
+        page += 1
+    return symbols
 
 
 def get_trading_days_between(start_date: datetime, end_date: datetime):
@@ -163,3 +257,50 @@ def get_start_date_for_trading_days(end_date: datetime, num_trading_days: int):
     return current_date.date()
     
     return start_date.date()
+
+
+def build_price_frame(dates, open, high, low, close, volume) -> pd.DataFrame:
+    """
+    Tạo DataFrame OHLCV chuẩn cho toàn bộ pipeline.
+    
+    Cột Date được giữ ở kiểu datetime64 (không timezone, chỉ còn phần ngày) suốt quá trình
+    tính toán. Chỉ format sang chuỗi DISPLAY_DATE_FORMAT ở tầng trả về JSON/Telegram/biểu đồ.
+    Khi bật PRICE_STORAGE_MODE (float32/ticks), giá được giữ ở float32.
+    
+    Args:
+        dates: Danh sách thời gian từ API
+        open, high, low, close, volume: Danh sách giá trị tương ứng
+    
+    Returns:
+        DataFrame đã loại bỏ ngày không hợp lệ và sắp xếp theo thời gian
+    """
+    df = pd.DataFrame({
+        'Date': pd.to_datetime(dates, utc=True, errors='coerce'),
+        'Open': open,
+        'High': high,
+        'Low': low,
+        'Close': close,
+        'Volume': volume,
+    })
+    df = df.dropna(subset=['Date'])
+    df = df.sort_values('Date')
+    # Bỏ timezone và phần giờ để Date chỉ còn ngày giao dịch
+    df['Date'] = df['Date'].dt.tz_convert(None).dt.normalize()
+    
+    # Chế độ compact: giá float32 trong frame làm việc (ticks chỉ dùng trong kho dữ liệu)
+    if is_compact_mode():
+        df = compact_price_frame(df, mode='float32')
+    return df
+
+
+def records_to_price_frame(data: list) -> pd.DataFrame:
+    """Chuyển danh sách bản ghi từ fetch_stock_data thành DataFrame OHLCV"""
+    return build_price_frame(
+        dates=[item["time"] for item in data],
+        open=[item["open"] for item in data],
+        high=[item["high"] for item in data],
+        low=[item["low"] for item in data],
+        close=[item["close"] for item in data],
+        volume=[item["volume"] for item in data]
+    )
+